@@ -47,11 +47,36 @@ class OtherServiceInline(admin.StackedInline):
 # ============================
 @admin.register(Contract)
 class ContractAdmin(admin.ModelAdmin):
-    list_display = ("contract_no", "customer", "service_type", "created_at")
+    list_display = (
+        "contract_no", "customer", "service_type",
+        "progress_display", "remaining_display", "overdue_display", "next_due_display",
+        "created_at",
+    )
+    list_select_related = ("customer",)
     list_filter = ("service_type", "created_at")
     search_fields = ("contract_no", "customer__name")
     ordering = ("-created_at",)
 
+    # Số liệu thanh toán annotate sẵn -> không chạy aggregate trên từng dòng
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_payment_stats()
+
+    @admin.display(description="Đã thanh toán (%)", ordering="progress_pct")
+    def progress_display(self, obj):
+        return f"{obj.progress_pct:.0f}%"
+
+    @admin.display(description="Còn lại", ordering="remaining")
+    def remaining_display(self, obj):
+        return f"{obj.remaining:,.0f}"
+
+    @admin.display(description="Đợt quá hạn", ordering="overdue_installments")
+    def overdue_display(self, obj):
+        return obj.overdue_installments
+
+    @admin.display(description="Hạn tới", ordering="next_due_date")
+    def next_due_display(self, obj):
+        return obj.next_due_date
+
     inlines = [
         TrademarkServiceInline,
         CopyrightServiceInline,
@@ -68,6 +93,31 @@ class ContractAdmin(admin.ModelAdmin):
     )
 
 
+# ============================
+# CÔNG NỢ QUÁ HẠN (ĐỌC TỪ SNAPSHOT)
+# ============================
+@admin.register(OverdueSnapshot)
+class OverdueSnapshotAdmin(admin.ModelAdmin):
+    list_display = (
+        "contract", "overdue_installments", "oldest_due_date",
+        "days_overdue", "outstanding_amount", "snapshot_date",
+    )
+    list_select_related = ("contract",)
+    search_fields = ("contract__contract_no",)
+    ordering = ("-days_overdue",)
+
+
+# ============================
+# DOANH THU THEO NGÀY (BẢNG GOM)
+# ============================
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ("day", "service_type", "is_exported_bill", "amount", "payment_count")
+    list_filter = ("service_type", "is_exported_bill")
+    date_hierarchy = "day"
+    ordering = ("-day",)
+
+
 # ============================
 # LỊCH SỬ HỢP ĐỒNG
 # ============================
@@ -78,6 +128,17 @@ class ContractHistoryAdmin(admin.ModelAdmin):
     search_fields = ("contract__contract_no", "user")
 
 
+# ============================
+# VIỆC NỀN
+# ============================
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "run_after", "created_at", "finished_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "dedup_key")
+    ordering = ("-created_at",)
+
+
 # ============================
 #carousel
 # ============================
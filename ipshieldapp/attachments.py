@@ -0,0 +1,84 @@
+import os
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+
+from .models import Certificate
+
+
+# ============================
+# GHI FILE UPLOAD SAU KHI COMMIT
+# ============================
+class DeferredFileWriter:
+    """
+    Giữ file upload của các instance sắp lưu: đặt trước tên file trên storage
+    để INSERT ngay, còn nội dung chỉ ghi xuống storage khi transaction commit.
+    Transaction rollback -> không ghi gì, không còn file mồ côi trên đĩa.
+    """
+
+    def __init__(self):
+        self._pending = []     # (instance, field, tên đặt trước, nội dung)
+        self._reserved = set()
+
+    def hold(self, instance):
+        for field in instance._meta.concrete_fields:
+            if not isinstance(field, models.FileField):
+                continue
+            file = getattr(instance, field.attname)
+            if not file or file._committed:
+                continue
+            name = self._reserve(field, instance, file.name)
+            self._pending.append((instance, field, name, file.file))
+            file.name = name
+            file._committed = True   # FileField.pre_save không tự ghi file nữa
+        return instance
+
+    def _reserve(self, field, instance, filename):
+        storage = field.storage
+        name = field.generate_filename(instance, filename)
+        while True:
+            name = storage.get_available_name(name, max_length=field.max_length)
+            # Storage chưa có các file cùng lần gửi -> tự tránh trùng tên giữa chúng
+            if name not in self._reserved:
+                self._reserved.add(name)
+                return name
+            root, ext = os.path.splitext(name)
+            name = storage.get_alternative_name(root, ext)
+
+    def commit(self):
+        """Gọi bên trong transaction.atomic(): ghi file khi transaction commit"""
+        if self._pending:
+            transaction.on_commit(self._write)
+
+    def _write(self):
+        for instance, field, name, content in self._pending:
+            saved = field.storage.save(name, content, max_length=field.max_length)
+            if saved != name:
+                # File khác chiếm tên trong lúc chờ commit -> cập nhật lại đường dẫn
+                type(instance)._default_manager.filter(pk=instance.pk).update(**{field.attname: saved})
+                getattr(instance, field.attname).name = saved
+        self._pending = []
+
+
+# ============================
+# TÀI LIỆU ĐÍNH KÈM (CERTIFICATE)
+# ============================
+def validate_uploads(files, label):
+    """Kiểm tra file đính kèm trước khi ghi, trả về list thông báo lỗi"""
+    max_name = Certificate._meta.get_field('name').max_length
+    errors = []
+    for f in files:
+        if not f.size:
+            errors.append(f'{label} - file "{f.name}" rỗng')
+        elif len(f.name) > max_name:
+            errors.append(f'{label} - tên file "{f.name[:50]}..." quá dài (tối đa {max_name} ký tự)')
+    return errors
+
+
+def build_certificates(service, files, writer):
+    """Certificate chưa lưu cho các file của 1 dịch vụ (đã có pk) - để bulk_create 1 lần"""
+    content_type = ContentType.objects.get_for_model(service)
+    return [
+        writer.hold(Certificate(content_type=content_type, object_id=service.pk, file=f, name=f.name))
+        for f in files
+    ]
@@ -0,0 +1,190 @@
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+
+from .models import Contract, ContractHistory
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# LỊCH SỬ THAY ĐỔI HỢP ĐỒNG (CHỈ GHI PHẦN KHÁC NHAU)
+# ============================
+# Mỗi lần lưu Contract / dịch vụ / đợt thanh toán -> 1 dòng ContractHistory chỉ chứa
+# các trường đổi ({"trường": giá trị}). Dòng được gom theo request và ghi bằng
+# 1 bulk_create sau khi transaction commit (rollback -> không ghi gì).
+_buffer = ContextVar('contract_audit_buffer', default=None)
+
+_tracked_cache = {}
+
+
+def tracked_fields(model):
+    """Cột được theo dõi: bỏ khóa, mốc thời gian, cột tính sẵn và cột *_key chuẩn hóa"""
+    if model not in _tracked_cache:
+        ignored = set(model.AUDIT_IGNORED_FIELDS) | set(getattr(model, 'REGISTRY_KEY_FIELDS', {}).values())
+        _tracked_cache[model] = [f for f in model._meta.concrete_fields if f.name not in ignored]
+    return _tracked_cache[model]
+
+
+def _plain(field, value):
+    """Đưa về cùng dạng để so: cột file lúc nạp là chuỗi, lúc lưu là FieldFile (rỗng = None / '')"""
+    if isinstance(field, FileField):
+        return (value.name if isinstance(value, FieldFile) else value) or ''
+    return value
+
+
+def _value(instance, field):
+    return _plain(field, getattr(instance, field.attname))
+
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) if data else None
+
+
+class AuditBuffer:
+    def __init__(self, user=''):
+        self._user = user   # chuỗi hoặc hàm trả về tên (chỉ gọi khi thật sự ghi)
+        self.entries = []
+        self.closed = False
+
+    @property
+    def user(self):
+        return self._user() if callable(self._user) else self._user
+
+    def add(self, entry):
+        if self.closed:
+            write_entries([entry])
+        else:
+            self.entries.append(entry)
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        if not entries:
+            return
+        user = self.user
+        for entry in entries:
+            entry.user = user
+        write_entries(entries)
+
+
+def write_entries(entries):
+    # Hợp đồng bị xóa cùng transaction -> lịch sử của nó cũng không còn chỗ gắn
+    alive = set(
+        Contract.objects.filter(pk__in={e.contract_id for e in entries}).values_list('pk', flat=True)
+    )
+    try:
+        ContractHistory.objects.bulk_create([e for e in entries if e.contract_id in alive], batch_size=500)
+    except DatabaseError:
+        # Dữ liệu chính đã commit, chỉ lịch sử không ghi được -> không làm hỏng request
+        logger.exception("Không ghi được %s dòng lịch sử hợp đồng", len(entries))
+
+
+@contextmanager
+def collect(user=None):
+    """
+    Gom lịch sử trong 1 khối (request, lệnh nhập...) rồi ghi 1 lần khi ra khỏi khối.
+    Khối lồng trong khối khác (vd. 1 lô nhập trong request) dùng người dùng của khối ngoài.
+    """
+    if user is None:
+        outer = _buffer.get()
+        user = outer._user if outer is not None else ''
+    buffer = AuditBuffer(user)
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+        buffer.closed = True
+        buffer.flush()
+
+
+def _record(instance, verb, old, new):
+    contract_id = instance.pk if isinstance(instance, Contract) else instance.contract_id
+    if not isinstance(instance, Contract):
+        # Dịch vụ / đợt thanh toán: giữ id để biết dòng nào thay đổi
+        old = {'id': instance.pk, **old} if old is not None else None
+        new = {'id': instance.pk, **new} if new is not None else None
+
+    buffer = _buffer.get()
+    entry = ContractHistory(
+        contract_id=contract_id,
+        user='',
+        action=f"{verb} {instance._meta.verbose_name}",
+        old_data=_dumps(old),
+        new_data=_dumps(new),
+    )
+
+    def on_commit():
+        if buffer is not None:
+            buffer.add(entry)
+        else:
+            write_entries([entry])
+
+    transaction.on_commit(on_commit)
+
+
+def record_save(instance, created, update_fields=None):
+    fields = tracked_fields(type(instance))
+    if update_fields is not None:
+        fields = [f for f in fields if f.name in update_fields or f.attname in update_fields]
+    current = {f: _value(instance, f) for f in fields}
+
+    if created:
+        _record(instance, 'Tạo', None, {f.name: v for f, v in current.items() if v not in (None, '')})
+        instance._loaded_values = {f.attname: v for f, v in current.items()}
+        return
+
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return  # không nạp từ CSDL -> không có bản cũ để so
+    changed = [f for f, v in current.items() if f.attname in loaded and _plain(f, loaded[f.attname]) != v]
+    if changed:
+        _record(
+            instance, 'Sửa',
+            {f.name: _plain(f, loaded[f.attname]) for f in changed},
+            {f.name: current[f] for f in changed},
+        )
+    # Lần lưu sau so với giá trị vừa ghi
+    loaded.update((f.attname, v) for f, v in current.items())
+
+
+def record_update(instance, fields):
+    """
+    Đường ghi không gửi signal (queryset.update / bulk_update): gán giá trị mới lên
+    instance đã nạp từ CSDL rồi gọi hàm này, chỉ so các trường `fields`.
+    """
+    record_save(instance, False, fields)
+
+
+def record_created(instances):
+    """Các bản ghi vừa bulk_create (đã có pk)"""
+    for instance in instances:
+        record_save(instance, True)
+
+
+def record_delete(instance):
+    data = {f.name: _value(instance, f) for f in tracked_fields(type(instance))}
+    _record(instance, 'Xóa', {k: v for k, v in data.items() if v not in (None, '')}, None)
+
+
+# ============================
+# MIDDLEWARE: 1 LẦN GHI / REQUEST
+# ============================
+def _username(request):
+    user = getattr(request, 'user', None)
+    return user.get_username() if user is not None and user.is_authenticated else ''
+
+
+class AuditMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect(user=lambda: _username(request)):
+            return self.get_response(request)
@@ -0,0 +1,398 @@
+import csv
+import hashlib
+import io
+import re
+from collections import defaultdict
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import audit
+from .models import Contract, Customer, PaymentInstallment, PaymentLog
+from .payments import PAYMENT_INSTALLMENT_FIELDS
+from .revenue import add_logs
+from .normalize import compact, fold_text, fold_words
+from .tabular import read_records
+
+
+# ============================
+# ĐỌC SAO KÊ NGÂN HÀNG
+# ============================
+STATEMENT_COLUMNS = {
+    'date': ('ngay', 'ngay giao dich', 'ngay gd', 'ngay hieu luc', 'date', 'transaction date', 'value date'),
+    'amount': ('so tien', 'so tien giao dich', 'amount'),
+    'credit': ('ghi co', 'so tien ghi co', 'co', 'credit', 'credit amount'),
+    'description': ('noi dung', 'noi dung giao dich', 'dien giai', 'mo ta', 'description', 'details'),
+    'reference': ('ma gd', 'ma giao dich', 'so tham chieu', 'so but toan', 'reference', 'ref', 'transaction id'),
+}
+
+DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d-%m-%Y')
+
+MAX_KEY_WORDS = 4  # số đơn / mã KH bị ngân hàng tách tối đa thành 4 cụm: "HD 2024 001"
+
+
+class StatementLine:
+    def __init__(self, row_no, txn_date, amount, description, reference):
+        self.row_no = row_no
+        self.txn_date = txn_date
+        self.amount = amount
+        self.description = description
+        self.reference = reference
+
+    @property
+    def key(self):
+        """Khóa chống nhập trùng: mã GD của ngân hàng, không có thì băm nội dung dòng"""
+        if self.reference:
+            return f'bank:ref:{compact(self.reference)}'
+        raw = f'{self.txn_date.isoformat()}|{self.amount}|{fold_text(self.description)}'
+        return 'bank:' + hashlib.sha1(raw.encode()).hexdigest()[:32]
+
+    def tokens(self):
+        """Các cụm 1..4 từ liền nhau đã rút gọn - để so với số HĐ / mã KH"""
+        words = fold_words(self.description)
+        found = set()
+        for i in range(len(words)):
+            for n in range(1, MAX_KEY_WORDS + 1):
+                if i + n <= len(words):
+                    found.add(''.join(words[i:i + n]))
+        return found
+
+
+def parse_money(value):
+    """ "1.500.000" / "1,500,000" / "1500000.00" / 1500000 -> Decimal"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+    text = re.sub(r'[^\d,.\-]', '', str(value))
+    if not text:
+        return None
+    if ',' in text and '.' in text:
+        # Dấu xuất hiện sau cùng là dấu thập phân
+        thousands = ',' if text.rfind('.') > text.rfind(',') else '.'
+        text = text.replace(thousands, '').replace(',', '.')
+    else:
+        sep = ',' if ',' in text else '.' if '.' in text else None
+        if sep:
+            head, _, tail = text.rpartition(sep)
+            if text.count(sep) > 1 or len(tail) == 3:
+                text = text.replace(sep, '')
+            else:
+                text = head.replace(sep, '') + '.' + tail
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def read_statement(fileobj, filename):
+    """
+    Trả về (các dòng tiền vào, các dòng lỗi định dạng).
+    Dòng tiền ra (số âm / cột ghi có trống) bị bỏ qua.
+    """
+    records = read_records(fileobj, filename, STATEMENT_COLUMNS, required=('date', 'description'))
+    if records and not {'amount', 'credit'} & set(records[0][1]):
+        raise ValidationError('Thiếu cột số tiền (Số tiền / Ghi có)')
+
+    lines, invalid = [], []
+    for row_no, rec in records:
+        raw_amount = rec.get('credit') if rec.get('credit') not in (None, '') else rec.get('amount')
+        amount = parse_money(raw_amount)
+        txn_date = parse_date(rec.get('date'))
+        description = str(rec.get('description') or '').strip()
+        reference = str(rec.get('reference') or '').strip()
+
+        if amount is None or txn_date is None:
+            invalid.append((row_no, rec, 'Không đọc được ngày hoặc số tiền'))
+            continue
+        if amount <= 0:
+            continue
+        lines.append(StatementLine(row_no, txn_date, amount, description, reference))
+    return lines, invalid
+
+
+# ============================
+# KHỚP + GHI NHẬN THANH TOÁN HÀNG LOẠT
+# ============================
+class ImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.total_lines = 0
+        self.matched = []      # (line, contract_no, [(installment_id, số tiền)])
+        self.exceptions = []   # (row_no, ngày, số tiền, nội dung, mã GD, lý do)
+
+    @property
+    def matched_amount(self):
+        return sum((line.amount for line, _, _ in self.matched), Decimal('0'))
+
+    def add_exception(self, line, reason):
+        self.exceptions.append((
+            line.row_no, line.txn_date, line.amount, line.description, line.reference, reason,
+        ))
+
+    def add_invalid(self, row_no, rec, reason):
+        self.exceptions.append((
+            row_no, rec.get('date'), rec.get('credit') or rec.get('amount'),
+            rec.get('description'), rec.get('reference'), reason,
+        ))
+
+    def exceptions_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['Dòng', 'Ngày', 'Số tiền', 'Nội dung', 'Mã GD', 'Lý do'])
+        writer.writerows(self.exceptions)
+        return '\ufeff' + out.getvalue()  # BOM để Excel đọc đúng tiếng Việt
+
+
+def _allocate(open_installments, amount):
+    """
+    Chia số tiền vào các đợt còn nợ của 1 hợp đồng.
+    Ưu tiên đợt có số còn lại bằng đúng số tiền, không thì trả dần theo hạn.
+    Trả về [(đợt, số tiền)] hoặc None nếu vượt tổng còn phải thu.
+    """
+    for ins in open_installments:
+        if ins.amount - ins.paid_amount == amount:
+            return [(ins, amount)]
+
+    if amount > sum(ins.amount - ins.paid_amount for ins in open_installments):
+        return None
+
+    parts, left = [], amount
+    for ins in open_installments:
+        portion = min(ins.amount - ins.paid_amount, left)
+        if portion > 0:
+            parts.append((ins, portion))
+            left -= portion
+        if left == 0:
+            break
+    return parts
+
+
+# Số hợp đồng mỗi câu IN khi nạp đợt (dưới giới hạn tham số của SQLite)
+INSTALLMENT_CHUNK = 500
+
+
+class BankStatementImporter:
+    """
+    Khớp từng dòng sao kê với hợp đồng (theo số HĐ, không có thì theo mã KH + số tiền)
+    rồi ghi nhận theo lô: mỗi lô 1 transaction gồm bulk_update các đợt,
+    bulk_create PaymentLog và 1 câu UPDATE tính lại tổng tiền hợp đồng.
+    Nhập lại cùng sao kê không bị cộng 2 lần nhờ idempotency_key của PaymentLog.
+    """
+
+    def __init__(self, batch_size=500, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    # ---------- tra cứu ----------
+    def _load_open_contracts(self):
+        by_contract_no = defaultdict(set)
+        by_customer_code = defaultdict(set)
+        contract_nos = {}
+
+        rows = (
+            Contract.objects
+            .filter(paid_total__lt=F('contract_value'))
+            .values_list('id', 'contract_no', 'customer__customer_code')
+            .iterator(chunk_size=5000)
+        )
+        for pk, contract_no, customer_code in rows:
+            contract_nos[pk] = contract_no
+            by_contract_no[compact(contract_no)].add(pk)
+            if customer_code:
+                by_customer_code[compact(customer_code)].add(pk)
+        return contract_nos, by_contract_no, by_customer_code
+
+    @staticmethod
+    def _open_installments(contract_ids, lock=False):
+        """Các đợt còn nợ theo hợp đồng; mỗi câu IN tối đa INSTALLMENT_CHUNK hợp đồng"""
+        contract_ids = sorted(contract_ids)
+        grouped = defaultdict(list)
+        for start in range(0, len(contract_ids), INSTALLMENT_CHUNK):
+            qs = PaymentInstallment.objects.filter(
+                contract_id__in=contract_ids[start:start + INSTALLMENT_CHUNK],
+                amount__gt=F('paid_amount'),
+            ).order_by('due_date', 'created_at', 'id')
+            if lock:
+                qs = qs.select_for_update()
+            for ins in qs:
+                grouped[ins.contract_id].append(ins)
+        return grouped
+
+    @staticmethod
+    def _candidates(line, by_contract_no, by_customer_code):
+        """Hợp đồng ứng viên của 1 dòng (theo số HĐ, không có thì theo mã KH) + lý do nếu nhiều ứng viên"""
+        tokens = line.tokens()
+
+        candidates = set()
+        for token in tokens:
+            candidates |= by_contract_no.get(token, set())
+        if candidates:
+            return candidates, 'Nhiều hợp đồng khớp số HĐ'
+
+        for token in tokens:
+            candidates |= by_customer_code.get(token, set())
+        return candidates, 'Khách hàng có nhiều hợp đồng còn nợ, không phân biệt được theo số tiền'
+
+    def _resolve(self, line, candidates, reason, installments):
+        if not candidates:
+            return None, 'Không tìm thấy số hợp đồng / mã khách hàng trong nội dung'
+        if len(candidates) == 1:
+            return next(iter(candidates)), None
+
+        # Nhiều ứng viên -> giữ hợp đồng có đợt còn nợ đúng bằng số tiền
+        exact = [
+            pk for pk in candidates
+            if any(ins.amount - ins.paid_amount == line.amount for ins in installments.get(pk, ()))
+        ]
+        if len(exact) == 1:
+            return exact[0], None
+        return None, reason
+
+    # ---------- chạy ----------
+    def run(self, lines, invalid=()):
+        report = ImportReport(dry_run=self.dry_run)
+        report.total_lines = len(lines) + len(invalid)
+        for row_no, rec, reason in invalid:
+            report.add_invalid(row_no, rec, reason)
+
+        contract_nos, by_contract_no, by_customer_code = self._load_open_contracts()
+
+        unique, seen_keys = [], set()
+        for line in lines:
+            if line.key in seen_keys:
+                report.add_exception(line, 'Trùng giao dịch trong file')
+                continue
+            seen_keys.add(line.key)
+            unique.append((line, *self._candidates(line, by_contract_no, by_customer_code)))
+
+        # Chỉ nạp đợt của các hợp đồng có trong sao kê: cần để chọn giữa nhiều ứng viên,
+        # chạy thử thì cần cho mọi dòng (chia tiền trên bộ nhớ)
+        needed = set()
+        for _, candidates, _ in unique:
+            if self.dry_run or len(candidates) > 1:
+                needed |= candidates
+        snapshot = self._open_installments(needed)
+
+        resolved = []
+        for line, candidates, reason in unique:
+            contract_id, reason = self._resolve(line, candidates, reason, snapshot)
+            if contract_id is None:
+                report.add_exception(line, reason)
+            else:
+                resolved.append((line, contract_id))
+
+        for start in range(0, len(resolved), self.batch_size):
+            batch = resolved[start:start + self.batch_size]
+            if self.dry_run:
+                self._allocate_batch(batch, snapshot, contract_nos, report, self._done_keys(batch))
+            else:
+                self._apply_batch(batch, contract_nos, report)
+        return report
+
+    @staticmethod
+    def _done_keys(batch):
+        return set(
+            PaymentLog.objects
+            .filter(idempotency_key__in=[line.key for line, _ in batch])
+            .values_list('idempotency_key', flat=True)
+        )
+
+    def _allocate_batch(self, batch, installments, contract_nos, report, done_keys):
+        """Chia tiền cho từng dòng trên dữ liệu đợt đang giữ trong bộ nhớ"""
+        touched, logs, contract_ids = {}, [], set()
+
+        for line, contract_id in batch:
+            if line.key in done_keys:
+                report.add_exception(line, 'Giao dịch đã được nhập trước đó')
+                continue
+
+            parts = _allocate(installments.get(contract_id, []), line.amount)
+            if not parts:
+                report.add_exception(line, 'Số tiền vượt quá phần còn phải thu của các đợt')
+                continue
+
+            paid_at = datetime.combine(line.txn_date, time.min)
+            for n, (ins, portion) in enumerate(parts):
+                ins.paid_amount += portion
+                if ins.paid_amount >= ins.amount:
+                    ins.is_paid = True
+                    ins.paid_date = ins.paid_date or line.txn_date
+                touched[ins.pk] = ins
+                logs.append(PaymentLog(
+                    contract_id=contract_id,
+                    installment=ins,
+                    amount_paid=portion,
+                    paid_at=paid_at,
+                    notes=f'Sao kê: {line.description}',
+                    idempotency_key=line.key if n == 0 else f'{line.key}:{n}',
+                ))
+
+            # Đợt đã trả đủ thì bỏ khỏi danh sách còn nợ
+            installments[contract_id] = [
+                ins for ins in installments[contract_id] if ins.paid_amount < ins.amount
+            ]
+            contract_ids.add(contract_id)
+            report.matched.append((line, contract_nos[contract_id], [(i.pk, p) for i, p in parts]))
+
+        return list(touched.values()), logs, contract_ids
+
+    def _apply_batch(self, batch, contract_nos, report):
+        # Lịch sử hợp đồng của cả lô ghi bằng 1 lần bulk_create sau commit
+        with audit.collect(), transaction.atomic():
+            # Khóa các đợt của lô và đọc lại số đã trả mới nhất
+            installments = self._open_installments({cid for _, cid in batch}, lock=True)
+            done_keys = self._done_keys(batch)
+
+            touched, logs, contract_ids = self._allocate_batch(
+                batch, installments, contract_nos, report, done_keys
+            )
+            if not logs:
+                return
+
+            PaymentInstallment.objects.bulk_update(
+                touched, PAYMENT_INSTALLMENT_FIELDS, batch_size=500
+            )
+            # Cột giống nhau cho cả lô -> 1 câu UPDATE thay vì thêm 1 nhánh CASE mỗi dòng
+            PaymentInstallment.objects.filter(pk__in=[ins.pk for ins in touched]).update(
+                updated_at=timezone.now()
+            )
+            PaymentLog.objects.bulk_create(logs, batch_size=500)
+
+            # bulk_* không gửi signal -> cộng doanh thu ngày, tính lại tổng + trạng thái hợp đồng theo tập
+            add_logs(logs)
+            Contract.refresh_payment_totals(contract_ids)
+            completing = list(
+                Contract.objects
+                .select_for_update()
+                .filter(pk__in=contract_ids, contract_value__lte=F('paid_total'))
+                .exclude(status='completed')
+                .only('id', 'status')
+            )
+            Contract.objects.filter(pk__in=[c.pk for c in completing]).update(status='completed')
+
+            # bulk_update / update không gửi signal -> ghi lịch sử thủ công
+            for ins in touched:
+                audit.record_update(ins, PAYMENT_INSTALLMENT_FIELDS)
+            for contract in completing:
+                contract.status = 'completed'
+                audit.record_update(contract, ['status'])
+            Customer.refresh_status(Contract.objects.filter(pk__in=contract_ids).values('customer_id'))
@@ -0,0 +1,371 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, time as dtime
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import audit
+from .models import Contract, Customer, PaymentInstallment, PaymentLog
+from .normalize import registry_key
+from .registry_search import SERVICE_KINDS, get_registry_search
+from .revenue import add_logs
+
+
+# ============================
+# ĐỌC FILE HỢP ĐỒNG (JSON / JSON LINES)
+# ============================
+CONTRACT_FIELDS = (
+    'contract_no', 'service_type', 'contract_value', 'payment_type', 'prepaid_amount',
+    'payment_date', 'number_of_installments', 'installment_interval_days', 'status',
+)
+INSTALLMENT_FIELDS = ('amount', 'paid_amount', 'due_date', 'paid_date', 'notes', 'is_exported_bill')
+RECORD_KEYS = set(CONTRACT_FIELDS) | {'customer_code', 'services', 'installments'}
+
+# Cột định danh của từng model dịch vụ (unique) - kiểm tra trùng theo lô
+SERVICE_ID_FIELDS = {
+    model_name: id_field for model_name, _, id_field, _ in SERVICE_KINDS.values() if id_field
+}
+
+LEGACY_PAYMENT_NOTE = 'Nhập từ dữ liệu cũ'
+
+
+def read_contract_records(fileobj, filename):
+    """
+    Trả về iterator (số thứ tự, bản ghi). Mỗi bản ghi là 1 hợp đồng kèm
+    "services": [...] và "installments": [...].
+    .jsonl / .ndjson: mỗi dòng 1 hợp đồng, đọc dần (RAM cố định);
+    .json: 1 mảng các hợp đồng. Dòng JSON hỏng -> bản ghi None.
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        return _iter_json_lines(fileobj)
+    if ext == '.json':
+        try:
+            data = json.load(fileobj)
+        except ValueError as e:
+            raise ValidationError(f'File JSON không hợp lệ: {e}')
+        if not isinstance(data, list):
+            raise ValidationError('File .json phải là 1 mảng các hợp đồng')
+        return enumerate(data, start=1)
+    raise ValidationError(f'Không hỗ trợ định dạng file "{ext}" (chỉ nhận .json, .jsonl)')
+
+
+def _iter_json_lines(fileobj):
+    for line_no, line in enumerate(fileobj, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8-sig')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+# ============================
+# NHẬP HỢP ĐỒNG HÀNG LOẠT
+# ============================
+class ContractImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.total = 0
+        self.contracts = 0
+        self.services = 0
+        self.installments = 0
+        self.payments = 0
+        self.elapsed = 0.0
+        self.errors = []   # (số thứ tự, số HĐ, lỗi)
+
+    @property
+    def rate(self):
+        return self.contracts / self.elapsed if self.elapsed else 0
+
+    def add_error(self, record_no, rec, message):
+        contract_no = rec.get('contract_no') if isinstance(rec, dict) else None
+        self.errors.append((record_no, contract_no, message))
+
+    def errors_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['Bản ghi', 'Số HĐ', 'Lỗi'])
+        writer.writerows(self.errors)
+        return '\ufeff' + out.getvalue()  # BOM để Excel đọc đúng tiếng Việt
+
+
+class _Prepared:
+    def __init__(self, record_no, rec, contract, services, installments):
+        self.record_no = record_no
+        self.rec = rec
+        self.contract = contract
+        self.services = services
+        self.installments = installments
+
+
+def _messages(error, prefix=''):
+    if hasattr(error, 'error_dict'):
+        text = '; '.join(f"{field}: {' '.join(msgs)}" for field, msgs in error.message_dict.items())
+    else:
+        text = ' '.join(error.messages)
+    return f'{prefix}{text}'
+
+
+def _service_model(service_type):
+    relation = Contract.SERVICE_RELATIONS.get(service_type, 'other_service')
+    return relation, Contract._meta.get_field(relation).related_model
+
+
+def _assignable_fields(model):
+    """Cột được phép có trong file: bỏ khóa, cột *_key tính tự động và cột file"""
+    key_fields = set(getattr(model, 'REGISTRY_KEY_FIELDS', {}).values())
+    return {
+        f.name for f in model._meta.concrete_fields
+        if not f.primary_key and f.name != 'contract' and f.name not in key_fields
+        and f.get_internal_type() not in ('FileField', 'ImageField')
+    }
+
+
+class ContractImporter:
+    """
+    Nhập hợp đồng cũ kèm dịch vụ + lịch thanh toán.
+    Mỗi lô: 1 câu IN tìm khách theo mã, 1 câu IN kiểm tra trùng số HĐ, 1 câu / loại dịch vụ
+    kiểm tra trùng số định danh; rồi trong 1 transaction bulk_create theo thứ tự phụ thuộc
+    Contract -> dịch vụ -> đợt thanh toán -> PaymentLog.
+    bulk_create không gửi signal nên chỉ mục tìm kiếm, tổng tiền và doanh thu ngày được cập nhật tại đây.
+    """
+
+    def __init__(self, batch_size=200, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress   # progress(report) sau mỗi lô
+
+    def run(self, records):
+        report = ContractImportReport(dry_run=self.dry_run)
+        seen = {'contract_no': set(), **{name: set() for name in SERVICE_ID_FIELDS}}
+        started = time.monotonic()
+
+        batch = []
+        for item in records:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._run_batch(batch, seen, report)
+                batch = []
+                report.elapsed = time.monotonic() - started
+                if self.progress:
+                    self.progress(report)
+        if batch:
+            self._run_batch(batch, seen, report)
+
+        report.elapsed = time.monotonic() - started
+        return report
+
+    # ---------- kiểm tra ----------
+    def _prepare(self, record_no, rec, customers):
+        if not isinstance(rec, dict):
+            raise ValidationError('Bản ghi không phải JSON object hợp lệ')
+        unknown = set(rec) - RECORD_KEYS
+        if unknown:
+            raise ValidationError(f"Trường không hỗ trợ: {', '.join(sorted(unknown))}")
+
+        customer = customers.get(str(rec.get('customer_code') or '').strip())
+        if customer is None:
+            raise ValidationError(f"Không tìm thấy khách hàng mã \"{rec.get('customer_code')}\"")
+
+        # Luật của hợp đồng kiểm tra theo lô trong _run_batch (Contract.validate_many)
+        contract = Contract(customer=customer, **{f: rec[f] for f in CONTRACT_FIELDS if f in rec})
+
+        relation, model = _service_model(contract.service_type)
+        raw_services = rec.get('services') or []
+        if not isinstance(raw_services, list):
+            raise ValidationError('"services" phải là mảng')
+        if len(raw_services) > 1 and Contract._meta.get_field(relation).one_to_one:
+            raise ValidationError(f'Loại dịch vụ này chỉ có 1 dịch vụ / hợp đồng ({len(raw_services)} trong file)')
+
+        allowed = _assignable_fields(model)
+        services = []
+        for i, raw in enumerate(raw_services, start=1):
+            unknown = set(raw) - allowed if isinstance(raw, dict) else None
+            if unknown is None or unknown:
+                raise ValidationError(f"Dịch vụ #{i}: trường không hỗ trợ: {', '.join(sorted(unknown or ['?']))}")
+            service = model(**raw)
+            try:
+                service.clean_fields(exclude=['contract'] + list(getattr(model, 'REGISTRY_KEY_FIELDS', {}).values()))
+            except ValidationError as e:
+                raise ValidationError(_messages(e, f'Dịch vụ #{i}: '))
+            for field, key_field in getattr(model, 'REGISTRY_KEY_FIELDS', {}).items():
+                setattr(service, key_field, registry_key(getattr(service, field)))
+            services.append(service)
+
+        raw_installments = rec.get('installments') or []
+        if not isinstance(raw_installments, list):
+            raise ValidationError('"installments" phải là mảng')
+        installments = []
+        for i, raw in enumerate(raw_installments, start=1):
+            unknown = set(raw) - set(INSTALLMENT_FIELDS) if isinstance(raw, dict) else None
+            if unknown is None or unknown:
+                raise ValidationError(f"Đợt #{i}: trường không hỗ trợ: {', '.join(sorted(unknown or ['?']))}")
+            ins = PaymentInstallment(**raw)
+            try:
+                ins.clean_fields(exclude=['contract'])
+            except ValidationError as e:
+                raise ValidationError(_messages(e, f'Đợt #{i}: '))
+            # Như PaymentInstallment.save(): đủ tiền -> đã trả
+            ins.is_paid = ins.amount > 0 and ins.paid_amount >= ins.amount
+            if ins.is_paid:
+                ins.paid_date = ins.paid_date or ins.due_date or timezone.now().date()
+            installments.append(ins)
+
+        return _Prepared(record_no, rec, contract, services, installments)
+
+    def _run_batch(self, batch, seen, report):
+        report.total += len(batch)
+        codes = {
+            str(rec.get('customer_code') or '').strip()
+            for _, rec in batch if isinstance(rec, dict)
+        }
+        customers = Customer.objects.in_bulk(codes, field_name='customer_code') if codes else {}
+
+        prepared = []
+        for record_no, rec in batch:
+            try:
+                prepared.append(self._prepare(record_no, rec, customers))
+            except ValidationError as e:
+                report.add_error(record_no, rec, ' '.join(e.messages))
+
+        # Luật hợp đồng + trùng số HĐ (CSDL và trong lô): 1 câu IN cho cả lô.
+        # Khách đã tra theo lô -> bỏ qua kiểm tra khóa ngoại customer (1 câu / hợp đồng)
+        errors = Contract.validate_many([p.contract for p in prepared], exclude=['customer'])
+        for i, p in enumerate(prepared):
+            if i in errors:
+                report.add_error(p.record_no, p.rec, _messages(errors[i]))
+        prepared = [p for i, p in enumerate(prepared) if i not in errors]
+
+        # Trùng số định danh với CSDL: 1 câu / loại dịch vụ
+        existing = {}
+        wanted = defaultdict(set)
+        for p in prepared:
+            for service in p.services:
+                id_field = SERVICE_ID_FIELDS.get(type(service).__name__)
+                if id_field and getattr(service, id_field):
+                    wanted[type(service).__name__].add(getattr(service, id_field))
+        for model_name, values in wanted.items():
+            id_field = SERVICE_ID_FIELDS[model_name]
+            model = apps.get_model('ipshieldapp', model_name)
+            existing[model_name] = set(
+                model.objects.filter(**{f'{id_field}__in': values}).values_list(id_field, flat=True)
+            )
+
+        accepted = []
+        for p in prepared:
+            problem = self._duplicate(p, seen, existing)
+            if problem:
+                report.add_error(p.record_no, p.rec, problem)
+                continue
+            seen['contract_no'].add(p.contract.contract_no)
+            for service in p.services:
+                model_name = type(service).__name__
+                if model_name in SERVICE_ID_FIELDS and getattr(service, SERVICE_ID_FIELDS[model_name]):
+                    seen[model_name].add(getattr(service, SERVICE_ID_FIELDS[model_name]))
+            accepted.append(p)
+
+        if accepted and not self.dry_run:
+            self._write(accepted, report)
+        elif accepted:
+            self._count(accepted, report)
+
+    @staticmethod
+    def _duplicate(p, seen, existing):
+        contract_no = p.contract.contract_no
+        if contract_no in seen['contract_no']:
+            return f'Số hợp đồng "{contract_no}" trùng với bản ghi trước trong file'
+
+        in_record = set()
+        for service in p.services:
+            model_name = type(service).__name__
+            id_field = SERVICE_ID_FIELDS.get(model_name)
+            value = getattr(service, id_field) if id_field else None
+            if not value:
+                continue
+            if value in existing.get(model_name, ()):
+                return f'{id_field} "{value}" đã tồn tại'
+            if value in seen[model_name] or (model_name, value) in in_record:
+                return f'{id_field} "{value}" trùng trong file'
+            in_record.add((model_name, value))
+        return None
+
+    # ---------- ghi ----------
+    @staticmethod
+    def _count(accepted, report):
+        report.contracts += len(accepted)
+        report.services += sum(len(p.services) for p in accepted)
+        report.installments += sum(len(p.installments) for p in accepted)
+        report.payments += sum(1 for p in accepted for ins in p.installments if ins.paid_amount > 0)
+
+    def _write(self, accepted, report):
+        # Lịch sử "Tạo" của cả lô ghi bằng 1 lần bulk_create sau commit
+        with audit.collect(), transaction.atomic():
+            contracts = Contract.objects.bulk_create([p.contract for p in accepted])
+
+            services_by_model = defaultdict(list)
+            installments = []
+            for p in accepted:
+                for service in p.services:
+                    service.contract = p.contract
+                    services_by_model[type(service)].append(service)
+                for ins in p.installments:
+                    ins.contract = p.contract
+                    installments.append(ins)
+
+            services = []
+            for model, objs in services_by_model.items():
+                services.extend(model.objects.bulk_create(objs, batch_size=500))
+            PaymentInstallment.objects.bulk_create(installments, batch_size=500)
+
+            # Số đã trả của dữ liệu cũ -> 1 PaymentLog / đợt để lịch sử, hóa đơn, doanh thu khớp
+            logs = [
+                PaymentLog(
+                    contract=ins.contract,
+                    installment=ins,
+                    amount_paid=ins.paid_amount,
+                    paid_at=datetime.combine(ins.paid_date or ins.due_date or timezone.now().date(), dtime.min),
+                    is_exported_bill=ins.is_exported_bill,
+                    notes=LEGACY_PAYMENT_NOTE,
+                )
+                for ins in installments if ins.paid_amount > 0
+            ]
+            PaymentLog.objects.bulk_create(logs, batch_size=500)
+
+            # bulk_* không gửi signal -> doanh thu ngày, tổng tiền, trạng thái, chỉ mục tìm kiếm
+            add_logs(logs)
+            ids = [c.pk for c in contracts]
+            Contract.refresh_payment_totals(ids)
+            completed = set(
+                Contract.objects
+                .filter(pk__in=ids, paid_total__gt=0, contract_value__lte=F('paid_total'))
+                .exclude(status='completed')
+                .values_list('id', flat=True)
+            )
+            Contract.objects.filter(pk__in=completed).update(status='completed')
+            for contract in contracts:
+                if contract.pk in completed:
+                    contract.status = 'completed'
+
+            # bulk_create không gửi signal -> ghi lịch sử "Tạo" với trạng thái cuối
+            audit.record_created(contracts)
+            audit.record_created(services)
+            audit.record_created(installments)
+            Customer.refresh_status({c.customer_id for c in contracts})
+            get_registry_search().index_many(contracts, services)
+
+        report.contracts += len(contracts)
+        report.services += len(services)
+        report.installments += len(installments)
+        report.payments += len(logs)
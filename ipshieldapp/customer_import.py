@@ -0,0 +1,168 @@
+import csv
+import io
+from decimal import Decimal
+
+from django.db import transaction
+
+from .forms import CustomerImportForm
+from .fulltext import get_search_backend
+from .models import Customer
+from .normalize import fold_text
+from .prefix_index import customer_index
+from .tabular import read_records
+
+
+# ============================
+# ĐỌC FILE KHÁCH HÀNG
+# ============================
+CUSTOMER_COLUMNS = {
+    'customer_code': ('ma kh', 'ma khach hang', 'customer code', 'code'),
+    'name': ('ten', 'ten kh', 'ten khach hang', 'ho ten', 'name', 'customer name'),
+    'customer_type': ('loai', 'loai kh', 'loai khach hang', 'type', 'customer type'),
+    'status': ('trang thai', 'status'),
+    'address': ('dia chi', 'address'),
+    'phone': ('sdt', 'so dien thoai', 'dien thoai', 'phone'),
+    'email': ('email', 'e mail'),
+    'cccd': ('cccd', 'so cccd', 'cmnd', 'so cmnd'),
+    'tax_code': ('mst', 'ma so thue', 'tax code'),
+    'manager': ('nguoi phu trach', 'phu trach', 'manager'),
+    'position': ('chuc danh', 'chuc vu', 'position'),
+    'note': ('ghi chu', 'note'),
+}
+
+REQUIRED_COLUMNS = ('customer_code', 'name')
+
+# Cột bỏ trống trong file -> lấy mặc định của model
+DEFAULTS = {
+    'customer_type': 'personal',
+    'status': 'approved',
+}
+
+
+def read_customers(fileobj, filename):
+    return read_records(fileobj, filename, CUSTOMER_COLUMNS, required=REQUIRED_COLUMNS)
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # ô số của Excel: 123.0 -> "123"
+    if isinstance(value, Decimal):
+        value = value.normalize()
+    return str(value).strip()
+
+
+def _choice_lookup(choices):
+    """Nhận cả mã ("company") lẫn nhãn ("Doanh nghiệp") của lựa chọn"""
+    lookup = {}
+    for code, label in choices:
+        lookup[code] = code
+        lookup[fold_text(label)] = code
+    return lookup
+
+
+CHOICE_LOOKUPS = {
+    'customer_type': _choice_lookup(Customer.CUSTOMER_TYPE_CHOICES),
+    'status': _choice_lookup(Customer.CUSTOMER_STATUS_CHOICES),
+}
+
+
+def form_data(rec):
+    data = {name: _text(rec.get(name)) for name in CUSTOMER_COLUMNS}
+    for name, default in DEFAULTS.items():
+        data[name] = data[name] or default
+    for name, lookup in CHOICE_LOOKUPS.items():
+        data[name] = lookup.get(fold_text(data[name]), data[name])
+    return data
+
+
+# ============================
+# NHẬP KHÁCH HÀNG HÀNG LOẠT
+# ============================
+class CustomerImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.total_rows = 0
+        self.created = 0
+        self.errors = []   # (dòng, mã KH, tên, lỗi)
+
+    def add_error(self, row_no, data, message):
+        self.errors.append((row_no, data.get('customer_code'), data.get('name'), message))
+
+    def errors_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['Dòng', 'Mã KH', 'Tên khách hàng', 'Lỗi'])
+        writer.writerows(self.errors)
+        return '\ufeff' + out.getvalue()  # BOM để Excel đọc đúng tiếng Việt
+
+
+def _form_errors(form):
+    parts = []
+    for field, errors in form.errors.items():
+        label = form.fields[field].label if field in form.fields else None
+        message = ' '.join(errors)
+        parts.append(f'{label}: {message}' if label else message)
+    return '; '.join(parts)
+
+
+class CustomerImporter:
+    """
+    Kiểm tra từng dòng bằng CustomerImportForm (luật của CustomerForm),
+    mỗi lô kiểm tra trùng mã KH với CSDL bằng 1 câu IN rồi bulk_create trong 1 transaction.
+    bulk_create không gửi signal nên chỉ mục tìm kiếm được cập nhật tại đây.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False, progress=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress   # progress(số dòng đã xử lý, tổng số dòng)
+
+    def run(self, records):
+        report = CustomerImportReport(dry_run=self.dry_run)
+        report.total_rows = len(records)
+        seen = set()
+
+        for start in range(0, len(records), self.batch_size):
+            self._run_batch(records[start:start + self.batch_size], seen, report)
+            if self.progress:
+                self.progress(min(start + self.batch_size, len(records)), len(records))
+
+        if report.created and not self.dry_run:
+            transaction.on_commit(customer_index.invalidate)
+        return report
+
+    def _run_batch(self, batch, seen, report):
+        candidates = []
+        for row_no, rec in batch:
+            data = form_data(rec)
+            form = CustomerImportForm(data=data)
+            if not form.is_valid():
+                report.add_error(row_no, data, _form_errors(form))
+                continue
+
+            code = form.cleaned_data['customer_code']
+            if code in seen:
+                report.add_error(row_no, data, 'Trùng mã KH với dòng trước trong file')
+                continue
+            seen.add(code)
+            candidates.append((row_no, data, form.instance))
+
+        existing = set(
+            Customer.objects
+            .filter(customer_code__in=[c.customer_code for _, _, c in candidates])
+            .values_list('customer_code', flat=True)
+        )
+        new = []
+        for row_no, data, customer in candidates:
+            if customer.customer_code in existing:
+                report.add_error(row_no, data, 'Mã khách hàng đã tồn tại')
+            else:
+                new.append(customer)
+
+        if new and not self.dry_run:
+            with transaction.atomic():
+                created = Customer.objects.bulk_create(new)
+                get_search_backend().index_many(c for c in created if c.pk)
+        report.created += len(new)
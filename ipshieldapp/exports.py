@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from .models import (
+    Customer,
+    Contract,
+    PaymentInstallment,
+    TrademarkService,
+    CopyrightService,
+    BusinessRegistrationService,
+    InvestmentService,
+)
+
+
+# ============================
+# XUẤT DỮ LIỆU TOÀN BỘ (STREAMING)
+# ============================
+EXPORT_CHUNK_SIZE = 2000
+
+# Dịch vụ có số định danh: (model, cột định danh)
+SERVICE_IDENTIFIERS = (
+    (TrademarkService, 'app_no'),
+    (CopyrightService, 'certificate_no'),
+    (BusinessRegistrationService, 'tax_code'),
+    (InvestmentService, 'project_code'),
+)
+
+CUSTOMER_EXPORT_HEADERS = [
+    'Mã KH', 'Tên khách hàng', 'Loại KH', 'Trạng thái', 'Địa chỉ', 'SĐT', 'Email',
+    'CCCD', 'Mã số thuế', 'Người phụ trách', 'Chức danh', 'Ngày tạo',
+]
+
+CONTRACT_EXPORT_HEADERS = [
+    'Số HĐ', 'Mã KH', 'Khách hàng', 'Loại dịch vụ', 'Trạng thái', 'Hình thức TT',
+    'Giá trị HĐ', 'Đã thanh toán', 'Ngày tạo', 'Số định danh dịch vụ',
+]
+
+INSTALLMENT_EXPORT_HEADERS = [
+    'Số HĐ', 'Mã KH', 'Đợt', 'Số tiền', 'Đã trả', 'Hạn thanh toán',
+    'Đã trả đủ', 'Ngày trả', 'Đã xuất HĐ', 'Thời gian xuất HĐ',
+]
+
+
+def _label_row(row, columns):
+    """Đổi mã lựa chọn sang nhãn ở các cột chỉ định: columns = {vị trí: dict(choices)}"""
+    row = list(row)
+    for i, labels in columns.items():
+        row[i] = labels.get(row[i], row[i])
+    return row
+
+
+def customer_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    rows = (
+        Customer.objects
+        .order_by('id')
+        .values_list(
+            'customer_code', 'name', 'customer_type', 'status', 'address', 'phone', 'email',
+            'cccd', 'tax_code', 'manager', 'position', 'created_at',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    labels = {
+        2: dict(Customer.CUSTOMER_TYPE_CHOICES),
+        3: dict(Customer.CUSTOMER_STATUS_CHOICES),
+    }
+    return (_label_row(row, labels) for row in rows)
+
+
+def _service_identifiers(contract_ids):
+    """1 câu mỗi loại dịch vụ cho cả lô hợp đồng"""
+    identifiers = defaultdict(list)
+    for model, field in SERVICE_IDENTIFIERS:
+        rows = (
+            model.objects
+            .filter(contract_id__in=contract_ids)
+            .exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .order_by('id')
+            .values_list('contract_id', field)
+        )
+        for contract_id, value in rows:
+            identifiers[contract_id].append(value)
+    return identifiers
+
+
+def contract_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Đọc hợp đồng theo con trỏ id từng lô (không giữ cả bảng),
+    mỗi lô thêm 1 câu / loại dịch vụ để lấy số định danh.
+    """
+    columns = (
+        'id', 'contract_no', 'customer__customer_code', 'customer__name', 'service_type',
+        'status', 'payment_type', 'contract_value', 'paid_total', 'created_at',
+    )
+    labels = {
+        3: dict(Contract.SERVICE_TYPE_CHOICES),
+        4: dict(Contract.CONTRACT_STATUS_CHOICES),
+        5: dict(Contract.PAYMENT_TYPE_CHOICES),
+    }
+    last_id = 0
+    while True:
+        chunk = list(
+            Contract.objects
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list(*columns)[:chunk_size]
+        )
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        identifiers = _service_identifiers([row[0] for row in chunk])
+
+        for row in chunk:
+            yield _label_row(row[1:], labels) + ['; '.join(identifiers.get(row[0], ()))]
+
+
+def installment_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    return (
+        PaymentInstallment.objects
+        .order_by('contract_id', 'due_date', 'id')
+        .values_list(
+            'contract__contract_no', 'contract__customer__customer_code', 'notes',
+            'amount', 'paid_amount', 'due_date', 'is_paid', 'paid_date',
+            'is_exported_bill', 'bill_exported_at',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+# Tên trong URL / lệnh -> (tên file, tiêu đề cột, hàm sinh dòng)
+EXPORTS = {
+    'customers': ('khach_hang', CUSTOMER_EXPORT_HEADERS, customer_rows),
+    'contracts': ('hop_dong', CONTRACT_EXPORT_HEADERS, contract_rows),
+    'installments': ('dot_thanh_toan', INSTALLMENT_EXPORT_HEADERS, installment_rows),
+}
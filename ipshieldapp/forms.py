@@ -1,3 +1,5 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
 from .models import (
     Customer,
@@ -96,6 +98,16 @@ class CustomerForm(forms.ModelForm):
         return cleaned_data
 
 
+class CustomerImportForm(CustomerForm):
+    """
+    Kiểm tra 1 dòng của file nhập khách hàng theo đúng luật của CustomerForm.
+    Trùng mã KH được kiểm tra theo lô bằng 1 câu IN (xem customer_import.py).
+    """
+
+    def validate_unique(self):
+        pass
+
+
 # ======================================================
 # CUSTOMER STATUS FORM (CHỈ ĐỔI TRẠNG THÁI)
 # ======================================================
@@ -229,10 +241,168 @@ class ContractForm(forms.ModelForm):
         return cleaned_data
 
 
+# ======================================================
+# BỘ LỌC DANH SÁCH HỢP ĐỒNG
+# ======================================================
+class ContractFilterForm(forms.Form):
+    service_type = forms.ChoiceField(
+        required=False,
+        label='Loại dịch vụ',
+        choices=(('', 'Tất cả dịch vụ'),) + Contract.SERVICE_TYPE_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    status = forms.ChoiceField(
+        required=False,
+        label='Trạng thái',
+        choices=(('', 'Tất cả trạng thái'),) + Contract.CONTRACT_STATUS_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    date_from = forms.DateField(
+        required=False,
+        label='Từ ngày',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        label='Đến ngày',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    overdue = forms.BooleanField(
+        required=False,
+        label='Chỉ HĐ quá hạn',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def filter(self, queryset):
+        """Áp bộ lọc đã hợp lệ lên queryset (bộ lọc sai thì bỏ qua)"""
+        if not self.is_valid():
+            return queryset
+
+        data = self.cleaned_data
+        if data.get('service_type'):
+            queryset = queryset.filter(service_type=data['service_type'])
+        if data.get('status'):
+            queryset = queryset.filter(status=data['status'])
+        # So sánh trực tiếp trên created_at (không dùng __date) để dùng được index
+        if data.get('date_from'):
+            queryset = queryset.filter(
+                created_at__gte=datetime.combine(data['date_from'], time.min)
+            )
+        if data.get('date_to'):
+            queryset = queryset.filter(
+                created_at__lt=datetime.combine(data['date_to'] + timedelta(days=1), time.min)
+            )
+        # Đọc bảng snapshot do compute_overdue ghi, không quét các đợt thanh toán
+        if data.get('overdue'):
+            queryset = queryset.filter(overdue_snapshot__isnull=False)
+        return queryset
+
+
+# ======================================================
+# NHẬP SAO KÊ NGÂN HÀNG
+# ======================================================
+class BankStatementImportForm(forms.Form):
+    statement = forms.FileField(
+        label='File sao kê (.csv / .xlsx)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Chạy thử (chỉ khớp, không ghi thanh toán)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+
+# ======================================================
+# NHẬP KHÁCH HÀNG TỪ FILE
+# ======================================================
+class CustomerFileImportForm(forms.Form):
+    customers_file = forms.FileField(
+        label='File khách hàng (.csv / .xlsx)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Chạy thử (chỉ kiểm tra, không ghi)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+
+# ======================================================
+# XUẤT HÓA ĐƠN HÀNG LOẠT
+# ======================================================
+class InvoiceExportForm(forms.Form):
+    date_from = forms.DateField(
+        required=False,
+        label='Thanh toán từ ngày',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        label='Đến ngày',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    customer_code = forms.CharField(
+        required=False,
+        label='Mã khách hàng',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Để trống = tất cả'})
+    )
+    format = forms.ChoiceField(
+        label='Định dạng',
+        choices=(('csv', 'CSV'), ('xlsx', 'Excel (.xlsx)')),
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+    def clean_customer_code(self):
+        code = self.cleaned_data.get('customer_code', '').strip()
+        if not code:
+            return None
+        customer = Customer.objects.filter(customer_code__iexact=code).first()
+        if customer is None:
+            raise forms.ValidationError('Không tìm thấy khách hàng có mã này')
+        return customer
+
+    def clean(self):
+        cleaned = super().clean()
+        date_from, date_to = cleaned.get('date_from'), cleaned.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('"Từ ngày" phải trước "Đến ngày"')
+        if not (date_from or date_to or cleaned.get('customer_code')) and not self.errors:
+            raise forms.ValidationError('Chọn khoảng ngày hoặc khách hàng cần xuất hóa đơn')
+        return cleaned
+
+
+# ======================================================
+# KIỂM TRA TRÙNG SỐ ĐỊNH DANH THEO LÔ (FORMSET)
+# ======================================================
+class BatchedDuplicateMixin:
+    """
+    Form dịch vụ trong BatchDuplicateFormSet: bỏ câu exists() của model.clean()
+    và câu unique của form cho số định danh - formset kiểm tra 1 lần cho cả lô.
+    Dùng riêng lẻ (batched_duplicate_field = None) thì giữ nguyên kiểm tra cũ.
+    """
+    batched_duplicate_field = None
+
+    def _post_clean(self):
+        if self.batched_duplicate_field:
+            self.instance._duplicates_checked = True
+        super()._post_clean()
+
+    def validate_unique(self):
+        if not self.batched_duplicate_field:
+            return super().validate_unique()
+        exclude = self._get_validation_exclusions()
+        exclude.add(self.batched_duplicate_field)
+        try:
+            self.instance.validate_unique(exclude=exclude)
+        except forms.ValidationError as e:
+            self._update_errors(e)
+
+
 # ======================================================
 # 1. NHÃN HIỆU
 # ======================================================
-class TrademarkForm(forms.ModelForm):
+class TrademarkForm(BatchedDuplicateMixin, forms.ModelForm):
     class Meta:
         model = TrademarkService
         exclude = ['contract']
@@ -271,7 +441,7 @@ class TrademarkForm(forms.ModelForm):
 # ======================================================
 # 2. BẢN QUYỀN
 # ======================================================
-class CopyrightForm(forms.ModelForm):
+class CopyrightForm(BatchedDuplicateMixin, forms.ModelForm):
     class Meta:
         model = CopyrightService
         exclude = ['contract']
@@ -407,11 +577,71 @@ class PaymentInstallmentForm(forms.ModelForm):
                 'class': 'form-control'
             }),
         }
-from django.forms import modelformset_factory
+from collections import defaultdict
+
+from django.forms import BaseModelFormSet, modelformset_factory
+
+
+class BatchDuplicateFormSet(BaseModelFormSet):
+    """
+    Kiểm tra trùng duplicate_field cho cả formset: 1 câu IN với CSDL
+    + trùng giữa các dòng trong cùng lần gửi (thay vì 2 câu / form).
+    """
+    duplicate_field = None
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        form.batched_duplicate_field = self.duplicate_field
+        return form
+
+    def clean(self):
+        # Chạy trước super().clean(): form lỗi trùng bị loại khỏi kiểm tra unique của Django
+        self.check_duplicates()
+        super().clean()
+
+    def check_duplicates(self):
+        field = self.duplicate_field
+        label = self.model._meta.get_field(field).verbose_name
+
+        forms_by_value = defaultdict(list)
+        for form in self.forms:
+            if not form.is_valid() or self._should_delete_form(form):
+                continue
+            value = form.cleaned_data.get(field)
+            if value:
+                forms_by_value[value].append(form)
+        if not forms_by_value:
+            return
+
+        owners = dict(
+            self.model._default_manager
+            .filter(**{f'{field}__in': list(forms_by_value)})
+            .values_list(field, 'pk')
+        )
+        for value, value_forms in forms_by_value.items():
+            owner = owners.get(value)
+            accepted = False
+            for form in value_forms:
+                if owner is not None and owner != form.instance.pk:
+                    form.add_error(field, f'{label} "{value}" đã tồn tại!')
+                elif accepted:
+                    form.add_error(field, f'{label} "{value}" bị nhập trùng trong danh sách!')
+                else:
+                    accepted = True
+
+
+class TrademarkBaseFormSet(BatchDuplicateFormSet):
+    duplicate_field = 'app_no'
+
+
+class CopyrightBaseFormSet(BatchDuplicateFormSet):
+    duplicate_field = 'certificate_no'
+
 
 TrademarkFormSet = modelformset_factory(
     TrademarkService,
     form=TrademarkForm,
+    formset=TrademarkBaseFormSet,
     extra=0,
     can_delete=True
 )
@@ -419,6 +649,7 @@ TrademarkFormSet = modelformset_factory(
 CopyrightFormSet = modelformset_factory(
     CopyrightService,
     form=CopyrightForm,
+    formset=CopyrightBaseFormSet,
     extra=0,
     can_delete=True
 )
@@ -0,0 +1,205 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .normalize import fold_text, fold_words, compact
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# TÌM KIẾM KHÁCH HÀNG (FULL-TEXT)
+# ============================
+class CustomerSearchBackend:
+    """
+    Giao diện chung cho việc tìm khách hàng.
+    Backend mặc định chạy icontains nên dùng được với mọi CSDL.
+    """
+
+    def index(self, customer):
+        pass
+
+    def remove(self, customer_id):
+        pass
+
+    def index_many(self, customers):
+        """Thêm khách hàng mới tạo hàng loạt (bulk_create không gửi signal)"""
+        pass
+
+    def rebuild(self, queryset=None):
+        return 0
+
+    def filter_queryset(self, queryset, q):
+        return queryset.filter(
+            Q(customer_code__icontains=q) |
+            Q(name__icontains=q) |
+            Q(email__icontains=q) |
+            Q(phone__icontains=q)
+        )
+
+    def search(self, q, limit=10, offset=0):
+        """Khách hàng khớp q theo thứ tự liên quan (backend này: mới nhất trước)"""
+        from .models import Customer
+        qs = self.filter_queryset(Customer.objects.all(), q).order_by('-created_at', '-id')
+        return list(qs[offset:offset + limit])
+
+
+def build_fragments(*values):
+    """
+    Các hậu tố của mã KH / SĐT ("kh001" -> "kh001 h001 001 01").
+    Tìm theo tiền tố trên hậu tố = tìm chuỗi con, giống icontains cũ.
+    """
+    fragments = []
+    for value in values:
+        text = compact(value)
+        fragments.extend(text[i:] for i in range(len(text) - 1))
+    return ' '.join(fragments)
+
+
+def build_match(q):
+    """Chuỗi MATCH của FTS5: mọi từ đều phải khớp theo tiền tố"""
+    return ' '.join(f'"{word}"*' for word in fold_words(q))
+
+
+class SqliteFTSBackend(CustomerSearchBackend):
+    """
+    Bảng ảo FTS5 (rowid = Customer.id) chứa dữ liệu đã bỏ dấu.
+    Được cập nhật qua signal của Customer, xem signals.py.
+    """
+
+    table = 'ipshieldapp_customer_fts'
+    # Trọng số bm25 theo thứ tự cột: code, name, email, phone, fragments
+    weights = (10.0, 5.0, 1.0, 2.0, 3.0)
+
+    # {alias CSDL: có bảng FTS}. Chỉ nhớ khi đã có bảng; chưa có (vd. kiểm tra trước
+    # migrate) thì lần sau kiểm tra lại, không bỏ qua cập nhật chỉ mục đến hết tiến trình
+    _available = {}
+
+    def is_available(self):
+        alias = connection.alias
+        if self._available.get(alias):
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [self.table]
+            )
+            found = cursor.fetchone() is not None
+        if not found and alias not in self._available:
+            logger.warning(
+                "Chưa có bảng %s (CSDL %s): tìm khách bằng icontains, chưa cập nhật chỉ mục full-text",
+                self.table, alias,
+            )
+        self._available[alias] = found
+        return found
+
+    def _row(self, customer):
+        return [
+            customer.id,
+            fold_text(customer.customer_code),
+            fold_text(customer.name),
+            fold_text(customer.email),
+            customer.phone or '',
+            build_fragments(customer.customer_code, customer.phone),
+        ]
+
+    def index(self, customer):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [customer.id])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, customer_code, name, email, phone, fragments) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                self._row(customer)
+            )
+
+    def remove(self, customer_id):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [customer_id])
+
+    def index_many(self, customers):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            self._insert_many(cursor, [self._row(c) for c in customers])
+
+    def rebuild(self, queryset=None):
+        from .models import Customer
+        if not self.is_available():
+            return 0
+
+        queryset = queryset if queryset is not None else Customer.objects.all()
+        rows = queryset.only('id', 'customer_code', 'name', 'email', 'phone').iterator(chunk_size=2000)
+
+        count = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            batch = []
+            for customer in rows:
+                batch.append(self._row(customer))
+                if len(batch) >= 2000:
+                    count += self._insert_many(cursor, batch)
+                    batch = []
+            count += self._insert_many(cursor, batch)
+        return count
+
+    def _insert_many(self, cursor, batch):
+        if batch:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, customer_code, name, email, phone, fragments) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                batch
+            )
+        return len(batch)
+
+    def filter_queryset(self, queryset, q):
+        match = build_match(q)
+        if not match or not self.is_available():
+            return super().filter_queryset(queryset, q)
+
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match]
+        ))
+
+    def search(self, q, limit=10, offset=0):
+        from .models import Customer
+        match = build_match(q)
+        if not match or not self.is_available():
+            return super().search(q, limit, offset)
+
+        weights = ', '.join(str(w) for w in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {weights}), rowid DESC LIMIT %s OFFSET %s",
+                [match, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        # Giữ đúng thứ tự xếp hạng
+        customers = Customer.objects.in_bulk(ids)
+        return [customers[pk] for pk in ids if pk in customers]
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Chọn backend theo settings.CUSTOMER_SEARCH_BACKEND hoặc theo loại CSDL"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CUSTOMER_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SqliteFTSBackend()
+        else:
+            _backend = CustomerSearchBackend()
+    return _backend
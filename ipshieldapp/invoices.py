@@ -0,0 +1,84 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Contract, PaymentLog
+from .revenue import move_to_exported
+
+
+# ============================
+# XUẤT HÓA ĐƠN HÀNG LOẠT
+# ============================
+INVOICE_EXPORT_HEADERS = [
+    'Ngày thanh toán', 'Số HĐ', 'Mã KH', 'Khách hàng', 'Email', 'SĐT',
+    'Loại dịch vụ', 'Đợt', 'Số tiền', 'Ghi chú', 'Thời gian xuất HĐ',
+]
+
+
+def pending_invoices(date_from=None, date_to=None, customer=None):
+    """Các khoản đã thanh toán chưa xuất hóa đơn, lọc theo ngày thanh toán / khách hàng"""
+    qs = PaymentLog.objects.filter(is_exported_bill=False)
+    # So sánh trực tiếp trên paid_at (không dùng __date) để dùng được index
+    if date_from:
+        qs = qs.filter(paid_at__gte=datetime.combine(date_from, time.min))
+    if date_to:
+        qs = qs.filter(paid_at__lt=datetime.combine(date_to + timedelta(days=1), time.min))
+    if customer is not None:
+        qs = qs.filter(contract__customer=customer)
+    return qs
+
+
+def mark_exported(queryset):
+    """
+    Đánh dấu đã xuất hóa đơn bằng 1 câu UPDATE, cùng 1 mốc bill_exported_at.
+    Trả về (số dòng, mốc) - mốc dùng để đọc lại đúng các dòng vừa xuất.
+    """
+    stamp = timezone.now()
+    with transaction.atomic():
+        count = queryset.update(is_exported_bill=True, bill_exported_at=stamp)
+        if count:
+            # queryset.update không gửi signal -> chuyển doanh thu ngày sang phần đã xuất
+            move_to_exported(exported_batch(stamp))
+    return count, stamp
+
+
+def exported_batch(stamp):
+    return PaymentLog.objects.filter(is_exported_bill=True, bill_exported_at=stamp)
+
+
+def invoice_rows(stamp, chunk_size=2000):
+    """Dòng hóa đơn của lần xuất `stamp`, đọc theo lô (không nạp cả danh sách)"""
+    labels = dict(Contract.SERVICE_TYPE_CHOICES)
+    rows = (
+        exported_batch(stamp)
+        .order_by('paid_at', 'id')
+        .values_list(
+            'paid_at',
+            'contract__contract_no',
+            'contract__customer__customer_code',
+            'contract__customer__name',
+            'contract__customer__email',
+            'contract__customer__phone',
+            'contract__service_type',
+            'installment__notes',
+            'amount_paid',
+            'notes',
+            'bill_exported_at',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for paid_at, contract_no, code, name, email, phone, service_type, installment, amount, notes, exported_at in rows:
+        yield [
+            paid_at.strftime('%d/%m/%Y %H:%M'),
+            contract_no,
+            code,
+            name,
+            email or '',
+            phone or '',
+            labels.get(service_type, service_type),
+            installment or '',
+            amount,
+            notes,
+            exported_at.strftime('%d/%m/%Y %H:%M'),
+        ]
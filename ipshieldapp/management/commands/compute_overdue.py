@@ -0,0 +1,37 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.overdue import refresh_overdue_snapshot
+
+
+class Command(BaseCommand):
+    help = "Tính lại bảng công nợ quá hạn (chạy hằng ngày, tăng dần từ mốc lần trước)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Bỏ qua mốc, tính lại trên toàn bộ đợt thanh toán'
+        )
+        parser.add_argument(
+            '--date',
+            help='Tính như thể hôm nay là ngày này (YYYY-MM-DD)'
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('Ngày phải có dạng YYYY-MM-DD')
+
+        started = time.monotonic()
+        result = refresh_overdue_snapshot(today=today, full=options['full'])
+        mode = "toàn bộ" if result['full'] else "tăng dần"
+        self.stdout.write(self.style.SUCCESS(
+            f"[{mode}] {result['contracts']} hợp đồng / {result['installments']} đợt quá hạn, "
+            f"{result['outstanding']:,.0f} VNĐ trong {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,66 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.exports import EXPORTS, EXPORT_CHUNK_SIZE
+from ipshieldapp.tabular import EXPORT_FORMATS, write_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Xuất toàn bộ khách hàng / hợp đồng / đợt thanh toán ra CSV hoặc XLSX (đọc theo lô, RAM cố định)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help='Dữ liệu cần xuất')
+        parser.add_argument(
+            '--format',
+            choices=EXPORT_FORMATS,
+            default='csv',
+            help='Định dạng file (mặc định csv)'
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='Đường dẫn file; bỏ trống = <tên>.<định dạng> (CSV có thể dùng "-" để in ra stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Số dòng đọc từ DB mỗi lần'
+        )
+
+    def handle(self, *args, **options):
+        filename, headers, rows = EXPORTS[options['name']]
+        fmt = options['format']
+        output = options['output'] or f"{filename}.{fmt}"
+        if output == '-' and fmt != 'csv':
+            raise CommandError('Chỉ định dạng csv mới in ra stdout được')
+
+        counted = _Counter(rows(chunk_size=options['chunk_size']))
+        started = time.monotonic()
+
+        if output == '-':
+            write_csv(sys.stdout, headers, counted)
+            return
+        if fmt == 'xlsx':
+            write_xlsx(output, headers, counted)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8-sig') as f:
+                write_csv(f, headers, counted)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã xuất {counted.count} dòng vào {output} trong {time.monotonic() - started:.2f}s"
+        ))
+
+
+class _Counter:
+    """Đếm số dòng khi đi qua, không giữ lại dòng nào"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
@@ -0,0 +1,55 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.bank_import import BankStatementImporter, read_statement
+
+
+class Command(BaseCommand):
+    help = "Nhập sao kê ngân hàng (.csv / .xlsx), khớp với hợp đồng và ghi nhận thanh toán hàng loạt"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Đường dẫn file sao kê')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chỉ khớp và báo cáo, không ghi thanh toán'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Số dòng sao kê ghi trong mỗi transaction'
+        )
+        parser.add_argument(
+            '--report',
+            help='Ghi các dòng không khớp ra file CSV này'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                lines, invalid = read_statement(f, options['path'])
+        except (OSError, ValidationError) as e:
+            raise CommandError(str(e))
+
+        importer = BankStatementImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        report = importer.run(lines, invalid)
+
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Khớp {len(report.matched)}/{report.total_lines} dòng, "
+            f"tổng {report.matched_amount:,.0f} VNĐ trong {time.monotonic() - started:.2f}s"
+        ))
+
+        if report.exceptions:
+            self.stdout.write(self.style.WARNING(f"{len(report.exceptions)} dòng không khớp"))
+            if options['report']:
+                with open(options['report'], 'w', encoding='utf-8', newline='') as f:
+                    f.write(report.exceptions_csv())
+                self.stdout.write(f"Đã ghi báo cáo: {options['report']}")
+            else:
+                for row_no, _, amount, description, _, reason in report.exceptions:
+                    self.stdout.write(f"  Dòng {row_no}: {amount} | {description} -> {reason}")
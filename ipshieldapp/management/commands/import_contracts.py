@@ -0,0 +1,63 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.contract_import import ContractImporter, read_contract_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Nhập hợp đồng cũ hàng loạt (kèm dịch vụ + lịch thanh toán) từ file .jsonl / .json. "
+        "Mỗi bản ghi: các trường hợp đồng + customer_code, \"services\": [...], \"installments\": [...]"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Đường dẫn file hợp đồng')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chỉ kiểm tra, không ghi'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Số hợp đồng kiểm tra + ghi trong mỗi lô (mỗi lô 1 transaction)'
+        )
+        parser.add_argument(
+            '--errors',
+            help='Ghi các bản ghi lỗi ra file CSV này'
+        )
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(
+                f"  {report.total} bản ghi, {report.contracts} hợp đồng ({report.rate:,.0f} HĐ/s)"
+            )
+
+        importer = ContractImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+        try:
+            with open(options['path'], 'rb') as f:
+                report = importer.run(read_contract_records(f, options['path']))
+        except (OSError, ValidationError) as e:
+            raise CommandError(' '.join(getattr(e, 'messages', [str(e)])))
+
+        prefix = "[dry-run] Hợp lệ" if options['dry_run'] else "Đã thêm"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {report.contracts}/{report.total} hợp đồng, {report.services} dịch vụ, "
+            f"{report.installments} đợt thanh toán, {report.payments} khoản đã trả "
+            f"trong {report.elapsed:.2f}s ({report.rate:,.0f} HĐ/s)"
+        ))
+
+        if report.errors:
+            self.stdout.write(self.style.WARNING(f"{len(report.errors)} bản ghi lỗi"))
+            if options['errors']:
+                with open(options['errors'], 'w', encoding='utf-8', newline='') as f:
+                    f.write(report.errors_csv())
+                self.stdout.write(f"Đã ghi file lỗi: {options['errors']}")
+            else:
+                for record_no, contract_no, message in report.errors[:50]:
+                    self.stdout.write(f"  Bản ghi {record_no} ({contract_no}): {message}")
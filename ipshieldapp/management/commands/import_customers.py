@@ -0,0 +1,63 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.customer_import import CustomerImporter, read_customers
+
+
+class Command(BaseCommand):
+    help = "Nhập khách hàng hàng loạt từ file .csv / .xlsx (kiểm tra theo luật của form thêm khách hàng)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Đường dẫn file khách hàng')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chỉ kiểm tra, không ghi'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số dòng kiểm tra + ghi trong mỗi lô'
+        )
+        parser.add_argument(
+            '--errors',
+            help='Ghi các dòng lỗi ra file CSV này'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                records = read_customers(f, options['path'])
+        except (OSError, ValidationError) as e:
+            raise CommandError(str(e))
+
+        def progress(done, total):
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"  {done}/{total} dòng ({rate:,.0f} dòng/s)")
+
+        importer = CustomerImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+        report = importer.run(records)
+
+        prefix = "[dry-run] Hợp lệ" if options['dry_run'] else "Đã thêm"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {report.created}/{report.total_rows} khách hàng "
+            f"trong {time.monotonic() - started:.2f}s"
+        ))
+
+        if report.errors:
+            self.stdout.write(self.style.WARNING(f"{len(report.errors)} dòng lỗi"))
+            if options['errors']:
+                with open(options['errors'], 'w', encoding='utf-8', newline='') as f:
+                    f.write(report.errors_csv())
+                self.stdout.write(f"Đã ghi file lỗi: {options['errors']}")
+            else:
+                for row_no, code, _, message in report.errors[:50]:
+                    self.stdout.write(f"  Dòng {row_no} ({code}): {message}")
@@ -0,0 +1,41 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ipshieldapp.revenue import rebuild_daily_revenue
+
+
+class Command(BaseCommand):
+    help = "Dựng lại bảng doanh thu theo ngày từ lịch sử thanh toán (toàn bộ hoặc 1 khoảng ngày)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='Từ ngày (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Đến ngày (YYYY-MM-DD)'
+        )
+
+    @staticmethod
+    def _parse(value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError('Ngày phải có dạng YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        start = self._parse(options['start'])
+        end = self._parse(options['end'])
+        if start and end and start > end:
+            raise CommandError('--start phải trước --end')
+
+        started = time.monotonic()
+        rows = rebuild_daily_revenue(start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã ghi {rows} dòng doanh thu theo ngày trong {time.monotonic() - started:.2f}s"
+        ))
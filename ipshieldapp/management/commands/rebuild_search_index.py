@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ipshieldapp.fulltext import get_search_backend
+from ipshieldapp.registry_search import get_registry_search
+
+
+class Command(BaseCommand):
+    help = "Dựng lại toàn bộ chỉ mục tìm kiếm khách hàng và hợp đồng (sau khi import/update hàng loạt)"
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã lập chỉ mục {count} khách hàng trong {time.monotonic() - started:.2f}s"
+        ))
+
+        started = time.monotonic()
+        count = get_registry_search().rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã lập chỉ mục {count} hợp đồng/dịch vụ trong {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ipshieldapp.models import Customer
+
+
+class Command(BaseCommand):
+    help = "Tính lại trạng thái toàn bộ khách hàng từ trạng thái các hợp đồng (1 câu UPDATE cho cả bảng)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chỉ đếm số khách bị lệch trạng thái, không ghi'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        labels = dict(Customer.CUSTOMER_STATUS_CHOICES)
+
+        # Khách lệch trạng thái, gom theo (hiện tại -> đúng): 1 câu GROUP BY
+        drift = list(
+            Customer.objects
+            .annotate(derived=Customer.derived_status())
+            .exclude(status=Customer.derived_status())
+            .order_by()
+            .values('status', 'derived')
+            .annotate(n=Count('id'))
+        )
+        for row in drift:
+            self.stdout.write(
+                f"  {labels.get(row['status'], row['status'])} -> "
+                f"{labels.get(row['derived'], row['derived'])}: {row['n']}"
+            )
+
+        if options['dry_run']:
+            total = sum(row['n'] for row in drift)
+            self.stdout.write(self.style.WARNING(f"[dry-run] {total} khách hàng lệch trạng thái"))
+            return
+
+        updated = Customer.refresh_status()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã cập nhật trạng thái {updated} khách hàng trong {time.monotonic() - started:.2f}s"
+        ))
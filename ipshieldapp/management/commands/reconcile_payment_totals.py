@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from ipshieldapp.models import Contract
+
+
+class Command(BaseCommand):
+    help = "Đối chiếu paid_total / installment_total với bảng đợt thanh toán và sửa các hợp đồng bị lệch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Chỉ liệt kê hợp đồng bị lệch, không ghi lại'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số hợp đồng sửa trong mỗi câu UPDATE'
+        )
+
+    def handle(self, *args, **options):
+        # So sánh cột lưu sẵn với tổng tính lại ngay trong SQL, chỉ lấy dòng lệch
+        mismatched = (
+            Contract.objects
+            .annotate(**{f'expected_{k}': v for k, v in Contract.payment_total_expressions().items()})
+            .filter(
+                ~Q(paid_total=F('expected_paid_total')) |
+                ~Q(installment_total=F('expected_installment_total'))
+            )
+            .values_list('id', 'contract_no', 'paid_total', 'expected_paid_total',
+                         'installment_total', 'expected_installment_total')
+        )
+
+        ids = []
+        for pk, contract_no, paid, exp_paid, total, exp_total in mismatched.iterator(chunk_size=2000):
+            ids.append(pk)
+            self.stdout.write(
+                f"  {contract_no}: đã trả {paid} -> {exp_paid}, tổng đợt {total} -> {exp_total}"
+            )
+
+        if not ids:
+            self.stdout.write(self.style.SUCCESS("Tất cả hợp đồng đều khớp"))
+            return
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(ids)} hợp đồng bị lệch (dry-run, chưa sửa)"))
+            return
+
+        size = options['batch_size']
+        fixed = 0
+        with transaction.atomic():
+            for start in range(0, len(ids), size):
+                fixed += Contract.refresh_payment_totals(ids[start:start + size])
+
+        self.stdout.write(self.style.SUCCESS(f"Đã sửa {fixed} hợp đồng"))
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ipshieldapp.taskqueue import claim_batch, purge_finished, release_stale, run_task
+
+
+class Command(BaseCommand):
+    help = "Worker chạy hàng đợi việc nền (BackgroundTask): lấy việc đến giờ, chạy, thử lại khi lỗi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Chạy hết việc đang đến giờ rồi thoát (dùng cho cron)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Số việc nhận mỗi lượt'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Số giây nghỉ khi hàng đợi trống'
+        )
+        parser.add_argument(
+            '--purge-days',
+            type=int,
+            help='Xóa việc đã xong / lỗi cũ hơn số ngày này trước khi chạy'
+        )
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted = purge_finished(options['purge_days'])
+            self.stdout.write(f"Đã xóa {deleted} việc cũ")
+
+        done = failed = 0
+        try:
+            while True:
+                close_old_connections()
+                released = release_stale()
+                if released:
+                    self.stdout.write(self.style.WARNING(f"Trả lại hàng đợi {released} việc bị treo"))
+
+                batch = claim_batch(options['batch_size'])
+                for item in batch:
+                    started = time.monotonic()
+                    if run_task(item):
+                        done += 1
+                        self.stdout.write(f"  ✔ {item.name} #{item.pk} ({time.monotonic() - started:.2f}s)")
+                    else:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(
+                            f"  ✘ {item.name} #{item.pk} lần {item.attempts}/{item.max_attempts}: "
+                            f"{item.last_error.strip().splitlines()[-1] if item.last_error else ''}"
+                        ))
+
+                if not batch:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Xong {done} việc, {failed} lần lỗi"))
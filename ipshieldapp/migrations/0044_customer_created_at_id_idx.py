@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0043_paymentinstallment_bill_exported_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='ipshieldapp_created_0778c4_idx'),
+        ),
+    ]
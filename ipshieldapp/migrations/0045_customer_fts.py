@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 16:38
+
+from django.db import migrations
+
+
+FTS_TABLE = 'ipshieldapp_customer_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    from ipshieldapp.fulltext import SqliteFTSBackend
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "customer_code, name, email, phone, fragments, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+    # Nạp dữ liệu khách hàng hiện có vào chỉ mục
+    backend = SqliteFTSBackend()
+    Customer = apps.get_model('ipshieldapp', 'Customer')
+    with schema_editor.connection.cursor() as cursor:
+        backend._insert_many(cursor, [backend._row(c) for c in Customer.objects.all()])
+    SqliteFTSBackend._available.pop(schema_editor.connection.alias, None)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0044_customer_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
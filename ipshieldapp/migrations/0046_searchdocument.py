@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_registry_index(apps, schema_editor):
+    from ipshieldapp.registry_search import RegistrySearchEngine, create_sqlite_fts
+
+    if schema_editor.connection.vendor == 'sqlite':
+        create_sqlite_fts(schema_editor)
+    RegistrySearchEngine().rebuild(apps)
+
+
+def drop_registry_index(apps, schema_editor):
+    from ipshieldapp.registry_search import drop_sqlite_fts
+
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_sqlite_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0045_customer_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('contract', 'Hợp đồng'), ('trademark', 'Nhãn hiệu'), ('copyright', 'Bản quyền'), ('business', 'ĐKKD'), ('investment', 'Đầu tư'), ('other', 'Dịch vụ khác')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('service_type', models.CharField(max_length=50)),
+                ('identifier', models.CharField(blank=True, max_length=100)),
+                ('identifier_key', models.CharField(blank=True, max_length=100)),
+                ('contract_no', models.CharField(blank=True, max_length=50)),
+                ('customer_text', models.CharField(blank=True, max_length=400)),
+                ('title', models.CharField(blank=True, max_length=600)),
+                ('fragments', models.TextField(blank=True)),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='ipshieldapp.contract')),
+            ],
+            options={
+                'verbose_name': 'Chỉ mục tìm kiếm',
+                'verbose_name_plural': 'Chỉ mục tìm kiếm',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='uniq_searchdocument_kind_object')],
+            },
+        ),
+        migrations.RunPython(create_registry_index, drop_registry_index),
+    ]
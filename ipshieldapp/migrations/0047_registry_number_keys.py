@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+KEY_FIELDS = (
+    ('TrademarkService', 'app_no'),
+    ('CopyrightService', 'certificate_no'),
+    ('BusinessRegistrationService', 'tax_code'),
+    ('InvestmentService', 'project_code'),
+)
+
+
+def fill_registry_keys(apps, schema_editor):
+    from ipshieldapp.normalize import registry_key
+
+    for model_name, field in KEY_FIELDS:
+        model = apps.get_model('ipshieldapp', model_name)
+        rows = list(model.objects.exclude(**{f'{field}__isnull': True}).only('id', field))
+        for row in rows:
+            setattr(row, f'{field}_key', registry_key(getattr(row, field)))
+        model.objects.bulk_update(rows, [f'{field}_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0046_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessregistrationservice',
+            name='tax_code_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, null=True, verbose_name='Mã số thuế (chuẩn hóa)'),
+        ),
+        migrations.AddField(
+            model_name='copyrightservice',
+            name='certificate_no_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50, null=True, verbose_name='Số chứng nhận (chuẩn hóa)'),
+        ),
+        migrations.AddField(
+            model_name='investmentservice',
+            name='project_code_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, null=True, verbose_name='Mã dự án (chuẩn hóa)'),
+        ),
+        migrations.AddField(
+            model_name='trademarkservice',
+            name='app_no_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50, null=True, verbose_name='Số đơn (chuẩn hóa)'),
+        ),
+        migrations.RunPython(fill_registry_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 16:47
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_payment_totals(apps, schema_editor):
+    Contract = apps.get_model('ipshieldapp', 'Contract')
+    PaymentInstallment = apps.get_model('ipshieldapp', 'PaymentInstallment')
+    money = models.DecimalField(max_digits=15, decimal_places=2)
+
+    def total_of(field):
+        sums = (
+            PaymentInstallment.objects
+            .filter(contract=OuterRef('pk'))
+            .order_by()
+            .values('contract')
+            .annotate(total=Sum(field))
+            .values('total')
+        )
+        return Coalesce(Subquery(sums, output_field=money), Value(Decimal('0')), output_field=money)
+
+    Contract.objects.update(
+        paid_total=total_of('paid_amount'),
+        installment_total=total_of('amount'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0047_registry_number_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contract',
+            name='installment_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Tổng tiền các đợt'),
+        ),
+        migrations.AddField(
+            model_name='contract',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Tổng đã thanh toán'),
+        ),
+        migrations.RunPython(fill_payment_totals, migrations.RunPython.noop),
+    ]
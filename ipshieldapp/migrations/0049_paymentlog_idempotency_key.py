@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0048_contract_payment_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentlog',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True, verbose_name='Khóa chống ghi trùng'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0049_paymentlog_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Mốc chạy job',
+                'verbose_name_plural': 'Mốc chạy job',
+            },
+        ),
+        migrations.CreateModel(
+            name='OverdueSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overdue_installments', models.PositiveIntegerField(verbose_name='Số đợt quá hạn')),
+                ('oldest_due_date', models.DateField(verbose_name='Hạn sớm nhất chưa trả')),
+                ('days_overdue', models.PositiveIntegerField(verbose_name='Số ngày quá hạn')),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Số tiền quá hạn')),
+                ('snapshot_date', models.DateField(verbose_name='Ngày tính')),
+                ('contract', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_snapshot', to='ipshieldapp.contract')),
+            ],
+            options={
+                'verbose_name': 'Công nợ quá hạn',
+                'verbose_name_plural': 'Công nợ quá hạn',
+                'indexes': [models.Index(fields=['-days_overdue'], name='ipshieldapp_days_ov_85faaa_idx')],
+            },
+        ),
+    ]
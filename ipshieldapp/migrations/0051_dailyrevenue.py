@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 17:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_revenue(apps, schema_editor):
+    PaymentLog = apps.get_model('ipshieldapp', 'PaymentLog')
+    DailyRevenue = apps.get_model('ipshieldapp', 'DailyRevenue')
+
+    rows = (
+        PaymentLog.objects
+        .order_by()
+        .annotate(day=TruncDate('paid_at'))
+        .values('day', 'contract__service_type', 'is_exported_bill')
+        .annotate(total=Sum('amount_paid'), n=Count('id'))
+    )
+    DailyRevenue.objects.bulk_create([
+        DailyRevenue(
+            day=row['day'],
+            service_type=row['contract__service_type'],
+            is_exported_bill=row['is_exported_bill'],
+            amount=row['total'] or 0,
+            payment_count=row['n'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0050_overduesnapshot_jobwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Ngày')),
+                ('service_type', models.CharField(choices=[('nhanhieu', 'Đăng ký nhãn hiệu'), ('banquyen', 'Bản quyền tác giả'), ('dkkd', 'Đăng ký kinh doanh'), ('dautu', 'Đăng ký đầu tư'), ('khac', 'Dịch vụ khác')], max_length=50, verbose_name='Loại dịch vụ')),
+                ('is_exported_bill', models.BooleanField(default=False, verbose_name='Đã xuất hóa đơn')),
+                ('amount', models.DecimalField(decimal_places=0, default=0, max_digits=15, verbose_name='Doanh thu')),
+                ('payment_count', models.IntegerField(default=0, verbose_name='Số lần thanh toán')),
+            ],
+            options={
+                'verbose_name': 'Doanh thu theo ngày',
+                'verbose_name_plural': 'Doanh thu theo ngày',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'service_type', 'is_exported_bill'), name='uniq_dailyrevenue_day_service_exported')],
+            },
+        ),
+        migrations.RunPython(fill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0051_dailyrevenue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contracthistory',
+            index=models.Index(fields=['contract', 'created_at'], name='ipshieldapp_contrac_8da46f_idx'),
+        ),
+    ]
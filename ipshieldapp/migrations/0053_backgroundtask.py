@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0052_contracthistory_contract_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Tên việc')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Tham số')),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True, verbose_name='Khóa gộp')),
+                ('status', models.CharField(choices=[('pending', 'Chờ chạy'), ('running', 'Đang chạy'), ('done', 'Xong'), ('failed', 'Lỗi')], default='pending', max_length=20, verbose_name='Trạng thái')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Số lần chạy')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='Số lần chạy tối đa')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Chạy từ')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Nhận lúc')),
+                ('last_error', models.TextField(blank=True, verbose_name='Lỗi gần nhất')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Việc nền',
+                'verbose_name_plural': 'Việc nền',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='bgtask_status_run_after')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('dedup_key',), name='uniq_bgtask_pending_dedup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipshieldapp', '0053_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportReportFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='Loại')),
+                ('content', models.TextField(verbose_name='Nội dung CSV')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'File lỗi khi nhập',
+                'verbose_name_plural': 'File lỗi khi nhập',
+            },
+        ),
+    ]
@@ -1,10 +1,19 @@
-from django.db import models
+import re
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.core.validators import RegexValidator
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import (
+    Sum, Count, F, OuterRef, Subquery, Value, DecimalField, FloatField,
+    Case, When, Exists, ExpressionWrapper, prefetch_related_objects,
+)
+from django.db.models.functions import Cast, Coalesce, Round
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
+
+from .normalize import registry_key
 # ============================
 # VALIDATORS (THÔNG BÁO TV)
 # ============================
@@ -19,6 +28,42 @@ number_validator = RegexValidator(
 )
 
 
+# ============================
+# KHÓA CHUẨN HÓA CHO SỐ ĐỊNH DANH
+# ============================
+class RegistryKeyMixin:
+    """
+    Tự điền cột *_key (đã chuẩn hóa, có index) mỗi khi save.
+    REGISTRY_KEY_FIELDS = {'app_no': 'app_no_key'}
+    """
+    REGISTRY_KEY_FIELDS = {}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        for field, key_field in self.REGISTRY_KEY_FIELDS.items():
+            setattr(self, key_field, registry_key(getattr(self, field)))
+            if update_fields is not None and field in update_fields:
+                kwargs['update_fields'] = list(kwargs['update_fields']) + [key_field]
+        super().save(*args, **kwargs)
+
+
+# ============================
+# GIÁ TRỊ LÚC NẠP (CHO LỊCH SỬ THAY ĐỔI)
+# ============================
+class AuditedMixin:
+    """
+    Giữ giá trị các cột lúc nạp từ CSDL để audit.py chỉ ghi các trường thay đổi
+    mà không phải SELECT lại bản cũ trước mỗi lần lưu.
+    """
+    AUDIT_IGNORED_FIELDS = ('id', 'contract', 'created_at', 'updated_at')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
 # ============================
 # KHÁCH HÀNG
 # ============================
@@ -114,18 +159,104 @@ class Customer(models.Model):
     class Meta:
         verbose_name = 'Khách hàng'
         verbose_name_plural = 'Khách hàng'
+        indexes = [
+            # Phân trang theo con trỏ (created_at, id)
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    # ============================
+    # CỘT ĐƯA VÀO CHỈ MỤC HỢP ĐỒNG (registry_search.py)
+    # ============================
+    CONTRACT_INDEX_FIELDS = ('customer_code', 'name')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Giữ mã/tên lúc nạp: lưu mà không đổi 2 cột này thì không phải cập nhật chỉ mục hợp đồng
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._indexed_values = tuple(loaded.get(f) for f in cls.CONTRACT_INDEX_FIELDS)
+        return instance
+
+    def contract_index_changed(self):
+        current = tuple(getattr(self, f) for f in self.CONTRACT_INDEX_FIELDS)
+        return getattr(self, '_indexed_values', None) != current
+
+    # ============================
+    # TRẠNG THÁI SUY RA TỪ HỢP ĐỒNG
+    # ============================
+    # Còn hợp đồng chờ / đang xử lý -> Đang xử lý; không còn nhưng có hợp đồng hoàn thành -> Hoàn tất;
+    # chưa có hợp đồng (hoặc chỉ có hợp đồng ngưng) -> Chờ duyệt
+    ACTIVE_CONTRACT_STATUSES = ('pending', 'processing')
+
+    @classmethod
+    def derived_status(cls):
+        """Biểu thức SQL tính trạng thái khách từ trạng thái các hợp đồng (EXISTS theo từng khách)"""
+        contracts = Contract.objects.filter(customer=OuterRef('pk')).order_by()
+        return Case(
+            When(Exists(contracts.filter(status__in=cls.ACTIVE_CONTRACT_STATUSES)), then=Value('pending')),
+            When(Exists(contracts.filter(status='completed')), then=Value('completed')),
+            default=Value('approved'),
+            output_field=models.CharField(),
+        )
+
+    @classmethod
+    def refresh_status(cls, customer_ids=None):
+        """
+        Tính lại trạng thái bằng 1 câu UPDATE ... WHERE id IN (...), chỉ ghi khách bị lệch.
+        customer_ids: list id hoặc subquery (vd. values('customer_id')); None = cả bảng.
+        """
+        qs = cls.objects.all() if customer_ids is None else cls.objects.filter(pk__in=customer_ids)
+        status = cls.derived_status()
+        return qs.exclude(status=status).update(status=status)
 
     def __str__(self):
         return f"{self.customer_code} - {self.name}"
 
 
+# ============================
+# QUERYSET HỢP ĐỒNG (SỐ LIỆU THANH TOÁN)
+# ============================
+class ContractQuerySet(models.QuerySet):
+    def with_payment_stats(self):
+        """
+        Gắn số liệu thanh toán cho từng hợp đồng ngay trong 1 câu SELECT:
+        total_paid, remaining, progress_pct (từ cột lưu sẵn),
+        paid_installments, overdue_installments, next_due_date (subquery).
+        Dùng cho trang danh sách thay vì gọi property trên từng dòng.
+        """
+        money = DecimalField(max_digits=15, decimal_places=2)
+        today = timezone.now().date()
+        installments = PaymentInstallment.objects.filter(contract=OuterRef('pk')).order_by()
+
+        def count_of(qs):
+            counted = qs.values('contract').annotate(n=Count('id')).values('n')
+            return Coalesce(Subquery(counted, output_field=models.IntegerField()), Value(0))
+
+        return self.annotate(
+            total_paid=F('paid_total'),
+            remaining=ExpressionWrapper(F('contract_value') - F('paid_total'), output_field=money),
+            progress_pct=Case(
+                When(contract_value=0, then=Value(Decimal('0'))),
+                # Ép kiểu số thực để SQLite không chia nguyên
+                default=Round(Cast('paid_total', FloatField()) * 100 / F('contract_value'), 2),
+                output_field=money,
+            ),
+            paid_installments=count_of(installments.filter(is_paid=True)),
+            overdue_installments=count_of(installments.filter(is_paid=False, due_date__lt=today)),
+            next_due_date=Subquery(
+                installments.filter(is_paid=False, due_date__isnull=False)
+                .order_by('due_date').values('due_date')[:1]
+            ),
+        )
+
+
 # ============================
 # HỢP ĐỒNG
 # ============================
 # ============================
 # HỢP ĐỒNG (Contract Model - CẬP NHẬT ĐẦY ĐỦ)
 # ============================
-class Contract(models.Model):
+class Contract(AuditedMixin, models.Model):
     SERVICE_TYPE_CHOICES = (
         ('nhanhieu', 'Đăng ký nhãn hiệu'),
         ('banquyen', 'Bản quyền tác giả'),
@@ -208,9 +339,28 @@ class Contract(models.Model):
         default='pending'
     )
 
+    # 🟢 TỔNG TIỀN LƯU SẴN (cập nhật qua signal của PaymentInstallment)
+    paid_total = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name='Tổng đã thanh toán'
+    )
+
+    installment_total = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name='Tổng tiền các đợt'
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(default=timezone.now)
 
+    objects = ContractQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Hợp đồng'
         verbose_name_plural = 'Hợp đồng'
@@ -235,71 +385,285 @@ class Contract(models.Model):
                 'number_of_installments': 'Số đợt trả góp phải lớn hơn 0'
             })
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    # ============================
+    # CHÍNH SÁCH VALIDATE KHI LƯU
+    # ============================
+    # - Form (ModelForm) đã full_clean -> save() không kiểm tra lại các trường đã kiểm tra
+    #   (tránh câu truy vấn unique contract_no lần 2), chỉ kiểm tra trường đổi sau đó.
+    # - save(update_fields=[...]): cập nhật vài cột (status...) -> không validate lại.
+    # - save(validate=False): đường ghi đã tự validate (vd. validate_many cho nhập hàng loạt).
+    def _validation_state(self):
+        return {f.name: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+    def full_clean(self, exclude=None, validate_unique=True, validate_constraints=True):
+        super().full_clean(exclude=exclude, validate_unique=validate_unique,
+                           validate_constraints=validate_constraints)
+        # Ghi nhớ giá trị các trường vừa kiểm tra hợp lệ
+        exclude = set(exclude or ())
+        state = getattr(self, '_validated', None) or {}
+        state.update((name, value) for name, value in self._validation_state().items() if name not in exclude)
+        self._validated = state
+
+    def _unvalidated_fields(self):
+        validated = getattr(self, '_validated', None) or {}
+        return {
+            name for name, value in self._validation_state().items()
+            if name not in validated or validated[name] != value
+        }
+
+    def save(self, *args, validate=True, **kwargs):
+        if validate and kwargs.get('update_fields') is None:
+            pending = self._unvalidated_fields()
+            if pending:
+                # Chỉ kiểm tra trường chưa kiểm tra / đã đổi; clean() luôn chạy (rẻ, không truy vấn)
+                self.full_clean(exclude=set(self._validation_state()) - pending)
+            super().save(*args, **kwargs)
+            # id / created_at vừa được gán -> lần save() sau không kiểm tra lại
+            self._validated = self._validation_state()
+            return
         super().save(*args, **kwargs)
 
-    # Trong class Contract, thay thế phương thức create_installments():
-
-    def create_installments(self):
-        """Tự động tạo các đợt thanh toán RỖNG (chưa có số tiền)"""
+    @classmethod
+    def validate_many(cls, contracts, exclude=None):
+        """
+        Validate cả lô hợp đồng chưa lưu: luật của từng hợp đồng (không truy vấn)
+        + trùng contract_no bằng 1 câu IN và trong chính lô.
+        Trả về {vị trí: ValidationError}; hợp đồng hợp lệ được đánh dấu đã kiểm tra.
+        """
+        errors = {}
+        for i, contract in enumerate(contracts):
+            try:
+                contract.full_clean(exclude=exclude, validate_unique=False)
+            except ValidationError as e:
+                errors[i] = e
+
+        numbers = [c.contract_no for i, c in enumerate(contracts) if i not in errors]
+        existing = set(
+            cls.objects.filter(contract_no__in=numbers).values_list('contract_no', flat=True)
+        ) if numbers else set()
+        seen = set()
+        for i, contract in enumerate(contracts):
+            if i in errors:
+                continue
+            if contract.contract_no in existing:
+                errors[i] = ValidationError({'contract_no': f'Số hợp đồng "{contract.contract_no}" đã tồn tại'})
+            elif contract.contract_no in seen:
+                errors[i] = ValidationError({'contract_no': f'Số hợp đồng "{contract.contract_no}" bị trùng trong lô'})
+            seen.add(contract.contract_no)
+        return errors
+
+    def create_installments(self, regenerate=False):
+        """
+        Tạo lịch các đợt thanh toán RỖNG (chưa có số tiền) bằng 1 lần bulk_create.
+        regenerate=True: so với các đợt đang có thay vì xóa hết -
+        giữ nguyên đợt đã trả tiền / đã xuất hóa đơn, chỉ sửa ngày + ghi chú
+        các đợt chưa trả, thêm đợt thiếu và xóa đợt thừa.
+        Trả về dict số đợt created / updated / deleted / kept.
+        Số đợt mới ít hơn số đợt phải giữ -> ValidationError (không ghi gì).
+        """
+        summary = {'created': 0, 'updated': 0, 'deleted': 0, 'kept': 0}
         if self.payment_type != 'installment':
-            return
-
-        # Xóa các đợt cũ nếu có
-        self.installments.all().delete()
+            return summary
 
-        # Tạo các đợt thanh toán RỖNG
         from datetime import timedelta
-        current_date = timezone.now().date()
-
-        for i in range(self.number_of_installments):
-            # Tính ngày đến hạn cho từng đợt
-            due_date = current_date + timedelta(days=self.installment_interval_days * i)
-
-            # Đợt đầu tiên có số tiền đã trả trước (nếu có)
-            paid_amount = self.prepaid_amount if i == 0 else 0
-
-            PaymentInstallment.objects.create(
-                contract=self,
-                amount=0,  # 🔥 ĐỂ TRỐNG, CHỜ NHẬP TAY
-                paid_amount=paid_amount,
-                due_date=due_date,
-                is_paid=False,
-                paid_date=None,
-                notes=f"Đợt {i + 1}/{self.number_of_installments}"
+        from . import audit
+        from .signals import installment_batch
+        total = self.number_of_installments
+
+        # Xóa đợt không tính lại tổng / doanh thu theo từng dòng - gom 1 lần khi ra khỏi khối
+        with audit.collect(), transaction.atomic(), installment_batch() as batch:
+            existing = list(self.installments.order_by('due_date', 'created_at', 'id'))
+
+            if regenerate and existing:
+                start_date = existing[0].due_date or timezone.now().date()
+            else:
+                start_date = timezone.now().date()
+                # Xóa các đợt cũ nếu có
+                if existing:
+                    summary['deleted'] = self.installments.all().delete()[1].get(
+                        PaymentInstallment._meta.label, 0
+                    )
+                existing = []
+
+            def slot(i):
+                return (
+                    start_date + timedelta(days=self.installment_interval_days * i),
+                    f"Đợt {i + 1}/{total}",
+                )
+
+            # Đã có tiền hoặc hóa đơn -> giữ lại, chiếm chỗ 1 đợt trong lịch mới
+            locked = {ins.pk for ins in existing if ins.paid_amount > 0 or ins.is_exported_bill}
+            if len(locked) > total:
+                raise ValidationError({
+                    'number_of_installments': (
+                        f'Đã có {len(locked)} đợt đã thanh toán / xuất hóa đơn, '
+                        f'số đợt không được nhỏ hơn {len(locked)}'
+                    )
+                })
+            free_slots = total - len(locked)
+
+            schedule, to_delete = [], []
+            for ins in existing:
+                if ins.pk in locked:
+                    schedule.append(ins)
+                elif free_slots > 0:
+                    schedule.append(ins)
+                    free_slots -= 1
+                else:
+                    to_delete.append(ins.pk)
+
+            to_update, to_create = [], []
+            for i in range(len(schedule), total):
+                to_create.append(PaymentInstallment(
+                    contract=self,
+                    amount=0,  # 🔥 ĐỂ TRỐNG, CHỜ NHẬP TAY
+                    # Đợt đầu tiên có số tiền đã trả trước (nếu có)
+                    paid_amount=self.prepaid_amount if i == 0 else 0,
+                    is_paid=False,
+                    paid_date=None,
+                ))
+            schedule.extend(to_create)
+
+            for i, ins in enumerate(schedule):
+                due_date, notes = slot(i)
+                if ins.pk in locked:
+                    # Chỉ đánh số lại nhãn tự sinh, giữ ngày + ghi chú nhập tay
+                    if AUTO_INSTALLMENT_NOTE.match(ins.notes) and ins.notes != notes:
+                        ins.notes = notes
+                        to_update.append(ins)
+                elif ins.pk is None:
+                    ins.due_date, ins.notes = due_date, notes
+                elif (ins.due_date, ins.notes) != (due_date, notes):
+                    ins.due_date, ins.notes = due_date, notes
+                    to_update.append(ins)
+            summary['kept'] = len(locked)
+
+            if to_update:
+                PaymentInstallment.objects.bulk_update(to_update, ['due_date', 'notes'])
+            if to_delete:
+                PaymentInstallment.objects.filter(pk__in=to_delete).delete()
+            if to_create:
+                PaymentInstallment.objects.bulk_create(to_create)
+
+            # bulk_create / bulk_update không gửi signal -> ghi lịch sử thủ công
+            for ins in to_update:
+                audit.record_update(ins, ['due_date', 'notes'])
+            audit.record_created(to_create)
+
+            # bulk_create / bulk_update không gửi signal -> tính lại tổng 1 lần khi ra khỏi khối
+            batch['contract_ids'].add(self.pk)
+
+        self.refresh_from_db(fields=self.PAYMENT_TOTAL_FIELDS)
+        summary.update(created=len(to_create), updated=len(to_update))
+        summary['deleted'] += len(to_delete)
+        return summary
+
+    # ============================
+    # TỔNG TIỀN THANH TOÁN (LƯU SẴN)
+    # ============================
+    PAYMENT_TOTAL_FIELDS = ('paid_total', 'installment_total')
+    AUDIT_IGNORED_FIELDS = AuditedMixin.AUDIT_IGNORED_FIELDS + PAYMENT_TOTAL_FIELDS
+
+    @classmethod
+    def payment_total_expressions(cls):
+        """Biểu thức tính lại tổng từ bảng đợt thanh toán (subquery theo từng hợp đồng)"""
+        def total_of(field):
+            sums = (
+                PaymentInstallment.objects
+                .filter(contract=OuterRef('pk'))
+                .order_by()
+                .values('contract')
+                .annotate(total=Sum(field))
+                .values('total')
             )
+            money = DecimalField(max_digits=15, decimal_places=2)
+            return Coalesce(Subquery(sums, output_field=money), Value(Decimal('0')), output_field=money)
+
+        return {
+            'paid_total': total_of('paid_amount'),
+            'installment_total': total_of('amount'),
+        }
+
+    @classmethod
+    def refresh_payment_totals(cls, contract_ids):
+        """Tính lại paid_total / installment_total bằng 1 câu UPDATE"""
+        from .reports import invalidate_receivables
+
+        # Mọi đường ghi đợt thanh toán (signal, bulk) đều qua đây -> xóa cache báo cáo công nợ
+        transaction.on_commit(invalidate_receivables)
+        return cls.objects.filter(pk__in=contract_ids).update(**cls.payment_total_expressions())
 
     @property
     def total_paid(self):
         """Tổng số tiền đã thanh toán"""
-        return self.installments.aggregate(Sum('paid_amount'))['paid_amount__sum'] or 0
+        return self.paid_total
+
+    @total_paid.setter
+    def total_paid(self, value):
+        # Nhận giá trị annotate từ with_payment_stats()
+        self.paid_total = value
 
     @property
     def remaining_amount(self):
         """Số tiền còn lại phải trả"""
-        return self.contract_value - self.total_paid
+        return self.contract_value - self.paid_total
 
     @property
     def payment_progress(self):
         """% tiến độ thanh toán"""
         if self.contract_value == 0:
             return 0
-        return round((self.total_paid / self.contract_value) * 100, 2)
+        return round((self.paid_total / self.contract_value) * 100, 2)
 
     @property
     def is_fully_paid(self):
         """Đã thanh toán đủ chưa"""
-        return self.total_paid >= self.contract_value
+        return self.paid_total >= self.contract_value
+
+    # ============================
+    # NẠP SẴN DỮ LIỆU TRANG CHI TIẾT
+    # ============================
+    SERVICE_RELATIONS = {
+        'nhanhieu': 'trademarks',
+        'banquyen': 'copyrights',
+        'dkkd': 'business',
+        'dautu': 'investment',
+        'khac': 'other_service',
+    }
+
+    def load_detail(self):
+        """
+        Nạp sẵn dịch vụ + tài liệu đính kèm và các đợt thanh toán
+        với số truy vấn cố định (không tăng theo số nhãn hiệu / tài liệu).
+        Trả về list dịch vụ của hợp đồng.
+        """
+        relation = self.SERVICE_RELATIONS.get(self.service_type, 'other_service')
+        prefetch_related_objects(
+            [self],
+            f'{relation}__certificates',
+            'installments',
+        )
+
+        if relation in ('trademarks', 'copyrights'):
+            return list(getattr(self, relation).all())
+        # dkkd / dautu / khac: OneToOne, có thể chưa nhập
+        try:
+            return [getattr(self, relation)]
+        except ObjectDoesNotExist:
+            return []
 
     def __str__(self):
         return f"{self.contract_no} - {self.get_service_type_display()}"
 
 
+# Ghi chú do create_installments() tự sinh: "Đợt 2/12"
+AUTO_INSTALLMENT_NOTE = re.compile(r'^Đợt \d+/\d+$')
+
+
 # ============================
 # ĐỢT THANH TOÁN (PaymentInstallment Model)
 # ============================
-class PaymentInstallment(models.Model):
+class PaymentInstallment(AuditedMixin, models.Model):
     contract = models.ForeignKey(
         Contract,
         on_delete=models.CASCADE,
@@ -472,6 +836,16 @@ class PaymentLog(models.Model):
         verbose_name='Ghi chú'
     )
 
+    # KHÓA CHỐNG GHI TRÙNG (form gửi lại / bấm 2 lần)
+    idempotency_key = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Khóa chống ghi trùng'
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -540,7 +914,9 @@ class Certificate(models.Model):
 # ============================
 # 1. NHÃN HIỆU
 # ============================
-class TrademarkService(models.Model):
+class TrademarkService(RegistryKeyMixin, AuditedMixin, models.Model):
+    REGISTRY_KEY_FIELDS = {'app_no': 'app_no_key'}
+
     contract = models.ForeignKey(
         Contract,
         on_delete=models.CASCADE,
@@ -585,6 +961,16 @@ class TrademarkService(models.Model):
         verbose_name='Số đơn'
     )
 
+    # Khóa chuẩn hóa để tìm chính xác / theo tiền tố bằng index
+    app_no_key = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Số đơn (chuẩn hóa)'
+    )
+
     filing_date = models.DateField(
         blank=True,
         null=True,
@@ -641,7 +1027,8 @@ class TrademarkService(models.Model):
     def clean(self):
         super().clean()
         # 🔥 KIỂM TRA SỐ ĐƠN TRÙNG (chỉ khi có giá trị)
-        if self.app_no:
+        # Formset đã kiểm tra cả lô bằng 1 câu IN (BatchDuplicateFormSet) -> bỏ qua
+        if self.app_no and not getattr(self, '_duplicates_checked', False):
             existing = TrademarkService.objects.filter(
                 app_no=self.app_no
             ).exclude(pk=self.pk)
@@ -658,7 +1045,9 @@ class TrademarkService(models.Model):
 # ============================
 # 2. BẢN QUYỀN
 # ============================
-class CopyrightService(models.Model):
+class CopyrightService(RegistryKeyMixin, AuditedMixin, models.Model):
+    REGISTRY_KEY_FIELDS = {'certificate_no': 'certificate_no_key'}
+
     contract = models.ForeignKey(
         Contract,
         on_delete=models.CASCADE,
@@ -709,6 +1098,16 @@ class CopyrightService(models.Model):
         verbose_name='Số chứng nhận'
     )
 
+    # Khóa chuẩn hóa để tìm chính xác / theo tiền tố bằng index
+    certificate_no_key = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Số chứng nhận (chuẩn hóa)'
+    )
+
     certificates = GenericRelation(
         Certificate,
         related_query_name='copyright_files'
@@ -721,7 +1120,8 @@ class CopyrightService(models.Model):
     def clean(self):
         super().clean()
         # 🔥 KIỂM TRA SỐ CHỨNG NHẬN TRÙNG (chỉ khi có giá trị)
-        if self.certificate_no:
+        # Formset đã kiểm tra cả lô bằng 1 câu IN (BatchDuplicateFormSet) -> bỏ qua
+        if self.certificate_no and not getattr(self, '_duplicates_checked', False):
             existing = CopyrightService.objects.filter(
                 certificate_no=self.certificate_no
             ).exclude(pk=self.pk)
@@ -738,7 +1138,9 @@ class CopyrightService(models.Model):
 # ============================
 # 3. ĐĂNG KÝ KINH DOANH
 # ============================
-class BusinessRegistrationService(models.Model):
+class BusinessRegistrationService(RegistryKeyMixin, AuditedMixin, models.Model):
+    REGISTRY_KEY_FIELDS = {'tax_code': 'tax_code_key'}
+
     contract = models.OneToOneField(
         Contract,
         on_delete=models.CASCADE,
@@ -768,6 +1170,16 @@ class BusinessRegistrationService(models.Model):
         verbose_name='Mã số thuế'
     )
 
+    # Khóa chuẩn hóa để tìm chính xác / theo tiền tố bằng index
+    tax_code_key = models.CharField(
+        max_length=20,
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Mã số thuế (chuẩn hóa)'
+    )
+
     address = models.CharField(
         max_length=255,
         blank=True,
@@ -846,7 +1258,9 @@ class BusinessRegistrationService(models.Model):
 # ============================
 # 4. ĐĂNG KÝ ĐẦU TƯ
 # ============================
-class InvestmentService(models.Model):
+class InvestmentService(RegistryKeyMixin, AuditedMixin, models.Model):
+    REGISTRY_KEY_FIELDS = {'project_code': 'project_code_key'}
+
     contract = models.OneToOneField(
         Contract,
         on_delete=models.CASCADE,
@@ -862,6 +1276,16 @@ class InvestmentService(models.Model):
         verbose_name='Mã dự án'
     )
 
+    # Khóa chuẩn hóa để tìm chính xác / theo tiền tố bằng index
+    project_code_key = models.CharField(
+        max_length=100,
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Mã dự án (chuẩn hóa)'
+    )
+
     investor = models.CharField(
         max_length=255,
         blank=True,
@@ -925,7 +1349,7 @@ class InvestmentService(models.Model):
 # ============================
 # 5. DỊCH VỤ KHÁC
 # ============================
-class OtherService(models.Model):
+class OtherService(AuditedMixin, models.Model):
     contract = models.OneToOneField(
         Contract,
         on_delete=models.CASCADE,
@@ -997,10 +1421,208 @@ class ContractHistory(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Trang lịch sử: lọc theo hợp đồng, sắp theo thời gian
+            models.Index(fields=['contract', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.contract.contract_no} - {self.action}"
 
 
+# ============================
+# CHỈ MỤC TÌM KIẾM HỢP ĐỒNG / DỊCH VỤ
+# ============================
+class SearchDocument(models.Model):
+    """
+    Mỗi hợp đồng và mỗi dịch vụ là 1 dòng, chứa dữ liệu đã bỏ dấu.
+    Trên SQLite có bảng FTS5 đi kèm, đồng bộ bằng trigger (xem registry_search.py).
+    """
+    KIND_CHOICES = (
+        ('contract', 'Hợp đồng'),
+        ('trademark', 'Nhãn hiệu'),
+        ('copyright', 'Bản quyền'),
+        ('business', 'ĐKKD'),
+        ('investment', 'Đầu tư'),
+        ('other', 'Dịch vụ khác'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+
+    contract = models.ForeignKey(
+        Contract,
+        on_delete=models.CASCADE,
+        related_name='search_documents'
+    )
+    service_type = models.CharField(max_length=50)
+
+    identifier = models.CharField(max_length=100, blank=True)
+    identifier_key = models.CharField(max_length=100, blank=True)
+    contract_no = models.CharField(max_length=50, blank=True)
+    customer_text = models.CharField(max_length=400, blank=True)
+    title = models.CharField(max_length=600, blank=True)
+    fragments = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Chỉ mục tìm kiếm'
+        verbose_name_plural = 'Chỉ mục tìm kiếm'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='uniq_searchdocument_kind_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}"
+
+
+# ============================
+# ẢNH CHỤP CÔNG NỢ QUÁ HẠN
+# ============================
+class OverdueSnapshot(models.Model):
+    """
+    Mỗi hợp đồng có đợt quá hạn là 1 dòng, do lệnh compute_overdue ghi (xem overdue.py).
+    Danh sách / nhắc nợ đọc bảng này thay vì quét toàn bộ đợt thanh toán.
+    """
+    contract = models.OneToOneField(
+        Contract,
+        on_delete=models.CASCADE,
+        related_name='overdue_snapshot'
+    )
+    overdue_installments = models.PositiveIntegerField(verbose_name='Số đợt quá hạn')
+    oldest_due_date = models.DateField(verbose_name='Hạn sớm nhất chưa trả')
+    days_overdue = models.PositiveIntegerField(verbose_name='Số ngày quá hạn')
+    outstanding_amount = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        verbose_name='Số tiền quá hạn'
+    )
+    snapshot_date = models.DateField(verbose_name='Ngày tính')
+
+    class Meta:
+        verbose_name = 'Công nợ quá hạn'
+        verbose_name_plural = 'Công nợ quá hạn'
+        indexes = [
+            models.Index(fields=['-days_overdue']),
+        ]
+
+    def __str__(self):
+        return f"{self.contract_id} - {self.days_overdue} ngày"
+
+
+# ============================
+# MỐC CHẠY CỦA CÁC JOB ĐỊNH KỲ
+# ============================
+class JobWatermark(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Mốc chạy job'
+        verbose_name_plural = 'Mốc chạy job'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+# ============================
+# HÀNG ĐỢI VIỆC NỀN (xem taskqueue.py)
+# ============================
+class BackgroundTask(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Chờ chạy'),
+        ('running', 'Đang chạy'),
+        ('done', 'Xong'),
+        ('failed', 'Lỗi'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name='Tên việc')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Tham số')
+    # Cùng khóa + đang chờ -> chỉ giữ 1 dòng (gộp nhiều lần gọi thành 1 lần chạy)
+    dedup_key = models.CharField(max_length=200, null=True, blank=True, verbose_name='Khóa gộp')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Trạng thái')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Số lần chạy')
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name='Số lần chạy tối đa')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Chạy từ')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Nhận lúc')
+    last_error = models.TextField(blank=True, verbose_name='Lỗi gần nhất')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Việc nền'
+        verbose_name_plural = 'Việc nền'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='bgtask_status_run_after'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='uniq_bgtask_pending_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+
+# ============================
+# FILE LỖI / NGOẠI LỆ KHI NHẬP DỮ LIỆU
+# ============================
+class ImportReportFile(models.Model):
+    """CSV lỗi của lần nhập gần nhất để tải về; session chỉ giữ id"""
+    kind = models.CharField(max_length=50, verbose_name='Loại')
+    content = models.TextField(verbose_name='Nội dung CSV')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'File lỗi khi nhập'
+        verbose_name_plural = 'File lỗi khi nhập'
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
+
+
+# ============================
+# DOANH THU GOM THEO NGÀY
+# ============================
+class DailyRevenue(models.Model):
+    """
+    Tổng PaymentLog theo (ngày, loại dịch vụ, đã xuất hóa đơn).
+    Cộng dồn khi ghi PaymentLog (xem revenue.py), dựng lại bằng lệnh rebuild_daily_revenue.
+    """
+    day = models.DateField(verbose_name='Ngày')
+    service_type = models.CharField(
+        max_length=50,
+        choices=Contract.SERVICE_TYPE_CHOICES,
+        verbose_name='Loại dịch vụ'
+    )
+    is_exported_bill = models.BooleanField(default=False, verbose_name='Đã xuất hóa đơn')
+    amount = models.DecimalField(
+        max_digits=15,
+        decimal_places=0,
+        default=0,
+        verbose_name='Doanh thu'
+    )
+    payment_count = models.IntegerField(default=0, verbose_name='Số lần thanh toán')
+
+    class Meta:
+        verbose_name = 'Doanh thu theo ngày'
+        verbose_name_plural = 'Doanh thu theo ngày'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'service_type', 'is_exported_bill'],
+                name='uniq_dailyrevenue_day_service_exported',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.service_type} - {self.amount:,.0f}"
+
+
 # ============================
 # CAROUSEL
 # ============================
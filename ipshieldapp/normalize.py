@@ -0,0 +1,40 @@
+import re
+import unicodedata
+
+
+# ============================
+# CHUẨN HÓA TIẾNG VIỆT
+# ============================
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold_text(value):
+    """
+    Bỏ dấu + chữ thường: "Nguyễn Đức" -> "nguyen duc".
+    Đ/đ không tách dấu được bằng NFD nên phải thay tay.
+    """
+    if not value:
+        return ''
+    value = str(value).replace('Đ', 'D').replace('đ', 'd')
+    value = unicodedata.normalize('NFD', value)
+    value = ''.join(ch for ch in value if unicodedata.category(ch) != 'Mn')
+    return value.lower()
+
+
+def fold_words(value):
+    """Tách chuỗi đã bỏ dấu thành danh sách từ"""
+    return _WORD_RE.findall(fold_text(value))
+
+
+def compact(value):
+    """Bỏ dấu và mọi ký tự không phải chữ/số: "KH-00 1" -> "kh001" """
+    return ''.join(fold_words(value))
+
+
+def registry_key(value):
+    """
+    Khóa so khớp cho số đơn / số CN / MST / mã dự án:
+    bỏ hoa-thường, khoảng trắng, gạch nối... "4-2024-12345" -> "4202412345".
+    Rỗng -> None để cột cho phép nhiều giá trị NULL.
+    """
+    return compact(value) or None
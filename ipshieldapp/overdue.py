@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Min, Q, Sum
+from django.utils import timezone
+
+from .models import JobWatermark, OverdueSnapshot, PaymentInstallment
+
+
+# ============================
+# TÍNH CÔNG NỢ QUÁ HẠN (THEO TẬP, CÓ MỐC)
+# ============================
+WATERMARK_NAME = 'overdue_snapshot'
+
+
+def refresh_overdue_snapshot(today=None, full=False):
+    """
+    Ghi lại bảng OverdueSnapshot bằng 1 câu GROUP BY trên PaymentInstallment.
+
+    Chạy tăng dần từ mốc lần trước: chỉ xét các hợp đồng có đợt đến hạn
+    trong [mốc, hôm nay) (index due_date) và các hợp đồng đang nằm trong snapshot
+    (index contract, is_paid) - vì số ngày quá hạn đổi mỗi ngày và có thể đã trả tiền.
+    Sửa lùi hạn / nhập hợp đồng cũ có đợt đã quá hạn -> chạy full=True.
+    """
+    today = today or timezone.now().date()
+    mark = JobWatermark.objects.filter(name=WATERMARK_NAME).first()
+    full = full or mark is None
+
+    overdue = PaymentInstallment.objects.filter(is_paid=False, due_date__lt=today)
+    if not full:
+        newly_due = overdue.filter(due_date__gte=mark.value).values('contract_id')
+        overdue = overdue.filter(
+            Q(contract_id__in=newly_due) |
+            Q(contract_id__in=OverdueSnapshot.objects.values('contract_id'))
+        )
+
+    rows = (
+        overdue.order_by()
+        .values('contract_id')
+        .annotate(
+            n=Count('id'),
+            oldest=Min('due_date'),
+            outstanding=Sum(ExpressionWrapper(
+                F('amount') - F('paid_amount'),
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            )),
+        )
+    )
+
+    snapshots = [
+        OverdueSnapshot(
+            contract_id=row['contract_id'],
+            overdue_installments=row['n'],
+            oldest_due_date=row['oldest'],
+            days_overdue=(today - row['oldest']).days,
+            outstanding_amount=row['outstanding'] or 0,
+            snapshot_date=today,
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        # Mọi dòng cũ đều thuộc phạm vi vừa tính lại nên thay toàn bộ
+        OverdueSnapshot.objects.all().delete()
+        OverdueSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+        JobWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': today})
+
+    return {
+        'full': full,
+        'contracts': len(snapshots),
+        'installments': sum(s.overdue_installments for s in snapshots),
+        'outstanding': sum((s.outstanding_amount for s in snapshots), 0),
+    }
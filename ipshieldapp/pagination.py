@@ -0,0 +1,147 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+# ============================
+# PHÂN TRANG THEO CON TRỎ (KEYSET)
+# ============================
+def encode_cursor(created_at, pk, direction):
+    """Mã hóa vị trí (created_at, id) thành token dùng trên URL"""
+    raw = json.dumps([direction, created_at.isoformat(), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Giải mã token -> (direction, created_at, id); token hỏng trả về None"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_token, prev_token, page_size):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.prev_token = prev_token
+        self.page_size = page_size
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_token is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Phân trang theo (created_at, id) giảm dần.
+    Token giữ nguyên giá trị khi có bản ghi mới chèn vào đầu danh sách,
+    nên "trang sau / trang trước" không bị lệch như phân trang theo OFFSET.
+    """
+
+    def __init__(self, queryset, page_size=None, default_page_size=None, max_page_size=None):
+        self.queryset = queryset
+        self.default_page_size = default_page_size or getattr(settings, 'CUSTOMER_PAGE_SIZE', 50)
+        self.max_page_size = max_page_size or getattr(settings, 'CUSTOMER_MAX_PAGE_SIZE', 200)
+        self.page_size = self._clamp(page_size or self.default_page_size)
+
+    def _clamp(self, value):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = self.default_page_size
+        return max(1, min(value, self.max_page_size))
+
+    def page(self, token=None):
+        cursor = decode_cursor(token)
+        size = self.page_size
+
+        if cursor is None:
+            rows = list(self.queryset.order_by('-created_at', '-id')[:size + 1])
+            has_more, has_before = len(rows) > size, False
+            rows = rows[:size]
+
+        elif cursor[0] == 'next':
+            _, created_at, pk = cursor
+            rows = list(
+                self.queryset.filter(
+                    Q(created_at__lt=created_at) |
+                    Q(created_at=created_at, id__lt=pk)
+                ).order_by('-created_at', '-id')[:size + 1]
+            )
+            has_more, has_before = len(rows) > size, True
+            rows = rows[:size]
+
+        else:
+            # Đi ngược: lấy tăng dần rồi đảo lại để giữ thứ tự hiển thị
+            _, created_at, pk = cursor
+            rows = list(
+                self.queryset.filter(
+                    Q(created_at__gt=created_at) |
+                    Q(created_at=created_at, id__gt=pk)
+                ).order_by('created_at', 'id')[:size + 1]
+            )
+            has_more, has_before = True, len(rows) > size
+            rows = rows[:size][::-1]
+
+        next_token = prev_token = None
+        if rows and has_more:
+            next_token = encode_cursor(rows[-1].created_at, rows[-1].id, 'next')
+        if rows and has_before:
+            prev_token = encode_cursor(rows[0].created_at, rows[0].id, 'prev')
+
+        return KeysetPage(rows, next_token, prev_token, size)
+
+
+class RankedPaginator(KeysetPaginator):
+    """
+    Phân trang kết quả tìm kiếm đã xếp hạng (bm25): thứ tự không theo created_at
+    nên token là vị trí trong danh sách xếp hạng.
+    search(limit, offset) -> list bản ghi.
+    """
+
+    def __init__(self, search, page_size=None, default_page_size=None, max_page_size=None):
+        super().__init__(None, page_size, default_page_size, max_page_size)
+        self.search = search
+
+    def page(self, token=None):
+        try:
+            offset = max(int(token), 0)
+        except (TypeError, ValueError):
+            offset = 0
+        size = self.page_size
+
+        rows = self.search(limit=size + 1, offset=offset)
+        next_token = str(offset + size) if len(rows) > size else None
+        prev_token = str(max(offset - size, 0)) if offset > 0 else None
+        return KeysetPage(rows[:size], next_token, prev_token, size)
+
+
+def approximate_count(queryset, cache_key, timeout=None):
+    """
+    Tổng số bản ghi lấy từ cache, chỉ chạy COUNT(*) khi cache hết hạn.
+    Con số có thể lệch vài bản ghi trong khoảng timeout - chỉ dùng để hiển thị.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'APPROX_COUNT_TIMEOUT', 300)
+    return cache.get_or_set(cache_key, queryset.count, timeout)
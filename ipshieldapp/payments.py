@@ -0,0 +1,143 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import audit
+from .models import Contract, Customer, PaymentInstallment, PaymentLog
+from .reports import invalidate_receivables
+
+
+PaymentResult = namedtuple('PaymentResult', 'log created')
+
+# Các cột của đợt thay đổi khi ghi nhận thanh toán
+PAYMENT_INSTALLMENT_FIELDS = ['paid_amount', 'is_paid', 'paid_date']
+
+
+# ============================
+# GHI NHẬN THANH TOÁN
+# ============================
+class PaymentService:
+    """
+    Ghi 1 khoản thanh toán trong 1 transaction ngắn:
+    khóa dòng đợt thanh toán -> cộng tiền bằng F() -> ghi PaymentLog
+    -> cộng paid_total + chuyển trạng thái hợp đồng ngay trong SQL.
+    Cùng idempotency_key gửi lại (bấm 2 lần, F5) chỉ trả về log cũ.
+    """
+
+    def __init__(self, contract):
+        self.contract = contract
+
+    @staticmethod
+    def parse_amount(raw):
+        try:
+            amount = Decimal(str(raw).replace(',', '').strip())
+        except (InvalidOperation, ValueError):
+            raise ValidationError('Số tiền không hợp lệ')
+        if amount <= 0:
+            raise ValidationError('Số tiền phải lớn hơn 0')
+        return amount
+
+    def record(self, installment_id, amount=None, paid_at=None, notes='', idempotency_key=None):
+        """
+        amount=None: trả nốt phần còn lại của đợt.
+        Trả về PaymentResult(log, created); created=False nghĩa là lần gửi lặp lại.
+        """
+        paid_at = paid_at or timezone.now()
+
+        try:
+            with transaction.atomic():
+                return self._record(installment_id, amount, paid_at, notes, idempotency_key)
+        except IntegrityError:
+            # 2 request cùng khóa chạy song song -> request sau trả về log đã ghi
+            if idempotency_key:
+                log = PaymentLog.objects.filter(idempotency_key=idempotency_key).first()
+                if log:
+                    return PaymentResult(log, False)
+            raise
+
+    def _record(self, installment_id, amount, paid_at, notes, idempotency_key):
+        # Khóa đợt trước rồi mới kiểm tra khóa chống trùng:
+        # request thứ 2 phải chờ request đầu commit nên chắc chắn thấy log của nó
+        try:
+            ins = (
+                PaymentInstallment.objects
+                .select_for_update()
+                .get(pk=installment_id, contract_id=self.contract.pk)
+            )
+        except (PaymentInstallment.DoesNotExist, ValueError, TypeError):
+            raise ValidationError('Không tìm thấy đợt thanh toán')
+
+        if idempotency_key:
+            log = PaymentLog.objects.filter(idempotency_key=idempotency_key).first()
+            if log:
+                return PaymentResult(log, False)
+
+        remaining = ins.amount - ins.paid_amount
+        if amount is None:
+            if ins.is_paid:
+                raise ValidationError('Đợt này đã được thanh toán rồi')
+            if remaining <= 0:
+                raise ValidationError('Đợt này chưa nhập số tiền')
+            amount = remaining
+        elif amount <= 0:
+            raise ValidationError('Số tiền phải lớn hơn 0')
+        elif ins.amount > 0 and amount > remaining:
+            # Giống nhập sao kê: không ghi quá phần còn phải thu của đợt
+            raise ValidationError(f'Số tiền vượt quá phần còn lại của đợt ({max(remaining, 0):,.0f} VNĐ)')
+
+        # Đủ tiền khi đợt đã có số tiền và tổng đã trả (sau khi cộng) >= số tiền đợt
+        fully_paid = Q(amount__gt=0, amount__lte=F('paid_amount') + amount)
+        PaymentInstallment.objects.filter(pk=ins.pk).update(
+            paid_amount=F('paid_amount') + amount,
+            is_paid=Case(When(fully_paid, then=Value(True)), default=Value(False)),
+            paid_date=Case(
+                When(fully_paid, then=Coalesce(F('paid_date'), Value(paid_at.date()))),
+                default=F('paid_date'),
+            ),
+            updated_at=timezone.now(),
+        )
+        # Dòng đợt đang khóa nên giá trị mới tính được ngay, không cần đọc lại
+        ins.paid_amount += amount
+        ins.is_paid = 0 < ins.amount <= ins.paid_amount
+        if ins.is_paid and ins.paid_date is None:
+            ins.paid_date = paid_at.date()
+        # queryset.update không gửi signal -> ghi lịch sử thủ công
+        audit.record_update(ins, PAYMENT_INSTALLMENT_FIELDS)
+
+        log = PaymentLog.objects.create(
+            contract=self.contract,
+            installment=ins,
+            amount_paid=amount,
+            paid_at=paid_at,
+            notes=notes,
+            idempotency_key=idempotency_key or None,
+        )
+
+        transaction.on_commit(invalidate_receivables)
+
+        # paid_total cộng dồn; trả đủ -> hoàn thành (khóa dòng để lịch sử có đúng trạng thái cũ)
+        contract = (
+            Contract.objects
+            .select_for_update()
+            .only('id', 'status', 'paid_total', 'contract_value')
+            .get(pk=self.contract.pk)
+        )
+        Contract.objects.filter(pk=contract.pk).update(
+            paid_total=F('paid_total') + amount,
+            status=Case(
+                When(contract_value__lte=F('paid_total') + amount, then=Value('completed')),
+                default=F('status'),
+            ),
+        )
+        if contract.contract_value <= contract.paid_total + amount:
+            contract.status = 'completed'
+            audit.record_update(contract, ['status'])
+        # queryset.update không gửi signal -> tính lại trạng thái khách sau commit
+        customer_id = self.contract.customer_id
+        transaction.on_commit(lambda: Customer.refresh_status([customer_id]))
+        return PaymentResult(log, True)
@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .normalize import fold_words, compact
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# CHỈ MỤC TIỀN TỐ TRONG BỘ NHỚ (AUTOCOMPLETE KHÁCH HÀNG)
+# ============================
+class SortedPrefixIndex:
+    """Mảng (key, id) đã sắp xếp - tìm tiền tố bằng bisect, O(log n)"""
+
+    def __init__(self, entries=()):
+        self._entries = sorted(entries)
+
+    def add(self, key, pk):
+        insort(self._entries, (key, pk))
+
+    def discard(self, key, pk):
+        i = bisect_left(self._entries, (key, pk))
+        if i < len(self._entries) and self._entries[i] == (key, pk):
+            del self._entries[i]
+
+    def iter_prefix(self, prefix):
+        entries = self._entries
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            yield entries[i]
+            i += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _keys_for(code, name):
+    """Các khóa của 1 khách hàng: mã rút gọn, tên đầy đủ và từng từ của tên"""
+    words = fold_words(name)
+    return compact(code), ' '.join(words), tuple(set(words))
+
+
+class CustomerPrefixIndex:
+    """
+    Chỉ mục customer_code / name đã bỏ dấu, nằm trong RAM của từng process.
+    - Dựng lúc khởi động (wsgi.py / passenger_wsgi.py) hoặc ở lần tìm đầu tiên.
+    - Cập nhật từng bản ghi qua signal của Customer (sau khi commit).
+    - Mỗi process có bản riêng, nên tự dựng lại sau CUSTOMER_PREFIX_INDEX_TTL giây
+      để nhận thay đổi do process khác ghi. Việc dựng lại chạy ở thread nền,
+      trong lúc đó vẫn trả lời bằng bản cũ rồi đổi sang bản mới 1 lần.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()   # chỉ 1 lần dựng tại 1 thời điểm
+        self._changes = None                  # thay đổi xảy ra trong lúc đang dựng
+        self._expired = False
+        self._records = {}
+        self._codes = SortedPrefixIndex()
+        self._names = SortedPrefixIndex()
+        self._words = SortedPrefixIndex()
+        self.version = 0
+        self.built_at = None
+        self._token = ''
+
+    # ---------- dựng / cập nhật ----------
+    def build(self):
+        from .models import Customer
+
+        with self._lock:
+            self._changes = []
+
+        records, codes, names, words = {}, [], [], []
+        try:
+            rows = Customer.objects.values_list(
+                'id', 'customer_code', 'name', 'phone', 'email'
+            ).iterator(chunk_size=5000)
+
+            for pk, code, name, phone, email in rows:
+                keys = _keys_for(code, name)
+                records[pk] = (self._payload(pk, code, name, phone, email), keys)
+                codes.append((keys[0], pk))
+                names.append((keys[1], pk))
+                words.extend((w, pk) for w in keys[2])
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            self._records = records
+            self._codes = SortedPrefixIndex(codes)
+            self._names = SortedPrefixIndex(names)
+            self._words = SortedPrefixIndex(words)
+            # Khách lưu / xóa trong lúc đang đọc CSDL -> áp lại lên bản mới
+            changes, self._changes = self._changes or [], None
+            for apply in changes:
+                apply()
+            self.version += 1
+            self.built_at = time.monotonic()
+            self._expired = False
+            self._token = uuid.uuid4().hex
+
+    def is_stale(self):
+        if self.built_at is None or self._expired:
+            return True
+        ttl = getattr(settings, 'CUSTOMER_PREFIX_INDEX_TTL', 600)
+        return time.monotonic() - self.built_at > ttl
+
+    def ensure_built(self):
+        """
+        Chưa có bản nào -> dựng ngay (các request cùng lúc chờ 1 lần dựng).
+        Đã có bản cũ mà hết hạn -> dựng lại ở thread nền, request không phải chờ.
+        """
+        if self.built_at is None:
+            with self._build_lock:
+                if self.built_at is None:
+                    self.build()
+        elif self.is_stale():
+            self._rebuild_in_background()
+
+    def _rebuild_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return  # đang có thread khác dựng
+
+        def run():
+            try:
+                self.build()
+            except DatabaseError:
+                logger.exception("Không dựng lại được chỉ mục autocomplete khách hàng")
+            finally:
+                self._build_lock.release()
+                connection.close()   # kết nối CSDL riêng của thread này
+
+        try:
+            threading.Thread(target=run, name='customer-prefix-index', daemon=True).start()
+        except RuntimeError:
+            self._build_lock.release()
+            raise
+
+    def _record_change(self, apply):
+        """Đang dựng lại -> ghi nhớ thay đổi để áp lên bản mới khi đổi"""
+        if self._changes is not None:
+            self._changes.append(apply)
+
+    def upsert(self, customer):
+        if self.built_at is None and self._changes is None:
+            return
+        with self._lock:
+            self._record_change(lambda: self._upsert(customer))
+            self._upsert(customer)
+
+    def _upsert(self, customer):
+        # Gọi khi đang giữ self._lock
+        self._discard(customer.pk)
+        keys = _keys_for(customer.customer_code, customer.name)
+        self._records[customer.pk] = (
+            self._payload(customer.pk, customer.customer_code, customer.name,
+                          customer.phone, customer.email),
+            keys,
+        )
+        self._codes.add(keys[0], customer.pk)
+        self._names.add(keys[1], customer.pk)
+        for w in keys[2]:
+            self._words.add(w, customer.pk)
+        self.version += 1
+
+    def invalidate(self):
+        """Sau khi nhập hàng loạt: dựng lại 1 lần (ở nền) từ lần tìm kế tiếp thay vì upsert từng dòng"""
+        with self._lock:
+            self._expired = True
+
+    def remove(self, customer_id):
+        if self.built_at is None and self._changes is None:
+            return
+        with self._lock:
+            self._record_change(lambda: self._remove(customer_id))
+            self._remove(customer_id)
+
+    def _remove(self, customer_id):
+        # Gọi khi đang giữ self._lock
+        self._discard(customer_id)
+        self.version += 1
+
+    def _discard(self, pk):
+        record = self._records.pop(pk, None)
+        if record is None:
+            return
+        code_key, name_key, word_keys = record[1]
+        self._codes.discard(code_key, pk)
+        self._names.discard(name_key, pk)
+        for w in word_keys:
+            self._words.discard(w, pk)
+
+    @staticmethod
+    def _payload(pk, code, name, phone, email):
+        return {
+            'id': pk,
+            'code': code,
+            'name': name,
+            'phone': str(phone) if phone else '',
+            'email': email if email else '',
+        }
+
+    # ---------- tìm kiếm ----------
+    def search(self, q, limit=10):
+        """
+        Thứ tự ưu tiên: trùng mã -> tiền tố mã -> tiền tố tên đầy đủ
+        -> mọi từ trong câu tìm là tiền tố của một từ trong tên.
+        """
+        code_q = compact(q)
+        words_q = fold_words(q)
+        if not code_q:
+            return []
+
+        name_q = ' '.join(words_q)
+        found = []
+        seen = set()
+
+        def take(pk):
+            if pk not in seen:
+                seen.add(pk)
+                found.append(pk)
+            return len(found) >= limit
+
+        with self._lock:
+            # Khóa trùng khớp luôn đứng đầu dải tiền tố trong mảng đã sắp xếp
+            for _, pk in self._codes.iter_prefix(code_q):
+                if take(pk):
+                    return self._result(found)
+
+            for _, pk in self._names.iter_prefix(name_q):
+                if take(pk):
+                    return self._result(found)
+
+            if words_q:
+                others = words_q[1:]
+                scanned = 0
+                for _, pk in self._words.iter_prefix(words_q[0]):
+                    scanned += 1
+                    if scanned > limit * 50:
+                        break
+                    word_keys = self._records[pk][1][2]
+                    if all(any(w.startswith(o) for w in word_keys) for o in others):
+                        if take(pk):
+                            break
+
+            return self._result(found)
+
+    def _result(self, ids):
+        return [self._records[pk][0] for pk in ids]
+
+    def etag(self, q, limit=10):
+        raw = f'{self._token}:{self.version}:{" ".join(fold_words(q))}:{limit}'
+        return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+    def __len__(self):
+        return len(self._records)
+
+
+customer_index = CustomerPrefixIndex()
+
+
+def warm_customer_index():
+    """Gọi lúc khởi động WSGI; CSDL chưa migrate thì để dựng ở lần tìm đầu"""
+    try:
+        customer_index.build()
+    except DatabaseError:
+        pass
@@ -0,0 +1,385 @@
+import logging
+from collections import namedtuple
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .fulltext import build_fragments, build_match
+from .normalize import fold_text, fold_words, compact, registry_key
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# TÌM KIẾM HỢP NHẤT: SỐ ĐƠN / SỐ CN / MST / MÃ DỰ ÁN / SỐ HĐ / KHÁCH HÀNG
+# ============================
+FTS_TABLE = 'ipshieldapp_searchdocument_fts'
+DOC_TABLE = 'ipshieldapp_searchdocument'
+FTS_COLUMNS = ('identifier', 'contract_no', 'customer_text', 'title', 'fragments')
+
+# kind -> (model, related_name trên Contract, trường định danh, các trường tên)
+SERVICE_KINDS = {
+    'trademark': ('TrademarkService', 'trademarks', 'app_no', ('trademark_name', 'applicant')),
+    'copyright': ('CopyrightService', 'copyrights', 'certificate_no', ('work_name', 'author', 'owner')),
+    'business': ('BusinessRegistrationService', 'business', 'tax_code', ('company_name', 'legal_representative')),
+    'investment': ('InvestmentService', 'investment', 'project_code', ('project_name', 'investor')),
+    'other': ('OtherService', 'other_service', None, ('description', 'legal_representative')),
+}
+
+MODEL_KINDS = {model_name: kind for kind, (model_name, *_) in SERVICE_KINDS.items()}
+
+SearchHit = namedtuple('SearchHit', 'kind object_id contract_id service_type identifier_match')
+
+
+# ---------- dựng dòng chỉ mục ----------
+def contract_document(contract, customer, doc_model):
+    return doc_model(
+        kind='contract',
+        object_id=contract.id,
+        contract_id=contract.id,
+        service_type=contract.service_type,
+        contract_no=fold_text(contract.contract_no),
+        customer_text=fold_text(f"{customer.customer_code} {customer.name}"),
+        fragments=build_fragments(contract.contract_no, customer.customer_code),
+    )
+
+
+def service_document(kind, service, service_type, doc_model):
+    _, _, id_field, title_fields = SERVICE_KINDS[kind]
+    identifier = getattr(service, id_field) if id_field else ''
+    title = ' '.join(str(getattr(service, f) or '') for f in title_fields)
+    return doc_model(
+        kind=kind,
+        object_id=service.id,
+        contract_id=service.contract_id,
+        service_type=service_type,
+        identifier=fold_text(identifier),
+        identifier_key=compact(identifier),
+        title=fold_text(title)[:600],
+        fragments=build_fragments(identifier),
+    )
+
+
+# ---------- kết quả ----------
+class SearchResult:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def __bool__(self):
+        return bool(self.hits)
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def contract_ids(self):
+        seen = []
+        for hit in self.hits:
+            if hit.contract_id not in seen:
+                seen.append(hit.contract_id)
+        return seen
+
+    def contracts(self):
+        """Danh sách hợp đồng (kèm số liệu thanh toán) theo thứ tự xếp hạng (1 truy vấn)"""
+        from .models import Contract
+        ids = self.contract_ids()
+        found = Contract.objects.with_payment_stats().select_related('customer').in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+    def _kind_hits(self, kind, identifier_only):
+        return [
+            h for h in self.hits
+            if h.kind == kind and (h.identifier_match or not identifier_only)
+        ]
+
+    def objects(self, kind, identifier_only=False):
+        """Các đối tượng dịch vụ theo thứ tự xếp hạng (1 truy vấn)"""
+        ids = [h.object_id for h in self._kind_hits(kind, identifier_only)]
+        if not ids:
+            return []
+        model = global_apps.get_model('ipshieldapp', SERVICE_KINDS[kind][0])
+        found = model.objects.select_related('contract', 'contract__customer').in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+    def first(self, kind, identifier_only=False):
+        hits = self._kind_hits(kind, identifier_only)
+        return hits[0] if hits else None
+
+
+# ---------- engine ----------
+class RegistrySearchEngine:
+    """
+    Mặc định (mọi CSDL): icontains trên bảng SearchDocument.
+    Trên SQLite dùng SqliteRegistrySearchEngine (FTS5 + bm25).
+    """
+
+    def _doc_model(self, apps=global_apps):
+        return apps.get_model('ipshieldapp', 'SearchDocument')
+
+    # ----- đồng bộ -----
+    def index_contract(self, contract):
+        Doc = self._doc_model()
+        customer = contract.customer
+        Doc.objects.filter(kind='contract', object_id=contract.id).delete()
+        contract_document(contract, customer, Doc).save(force_insert=True)
+
+    def index_service(self, service):
+        kind = MODEL_KINDS[type(service).__name__]
+        Doc = self._doc_model()
+        service_type = service.contract.service_type
+        Doc.objects.filter(kind=kind, object_id=service.id).delete()
+        service_document(kind, service, service_type, Doc).save(force_insert=True)
+
+    def index_many(self, contracts, services=()):
+        """
+        Dòng chỉ mục cho hợp đồng / dịch vụ vừa bulk_create (không có signal), 1 lần bulk_create.
+        contracts phải có sẵn .customer, services có sẵn .contract.
+        """
+        Doc = self._doc_model()
+        docs = [contract_document(c, c.customer, Doc) for c in contracts]
+        for service in services:
+            kind = MODEL_KINDS[type(service).__name__]
+            docs.append(service_document(kind, service, service.contract.service_type, Doc))
+        Doc.objects.bulk_create(docs, batch_size=2000)
+
+    def remove_service(self, service):
+        kind = MODEL_KINDS[type(service).__name__]
+        self._doc_model().objects.filter(kind=kind, object_id=service.id).delete()
+
+    def update_customer(self, customer):
+        """
+        Khách đổi mã/tên: dựng lại customer_text và fragments (hậu tố số HĐ + mã KH)
+        của các dòng 'contract' của khách đó.
+        """
+        Doc = self._doc_model()
+        rows = Doc.objects.filter(
+            kind='contract', contract__customer_id=customer.id
+        ).values_list('id', 'contract__contract_no')
+
+        customer_text = fold_text(f"{customer.customer_code} {customer.name}")
+        docs = [
+            Doc(id=pk, customer_text=customer_text,
+                fragments=build_fragments(contract_no, customer.customer_code))
+            for pk, contract_no in rows
+        ]
+        Doc.objects.bulk_update(docs, ['customer_text', 'fragments'], batch_size=500)
+
+    def rebuild(self, apps=global_apps):
+        """Dựng lại toàn bộ bảng chỉ mục, ghi theo lô"""
+        Doc = self._doc_model(apps)
+        Contract = apps.get_model('ipshieldapp', 'Contract')
+        batch_size = 2000
+        count = 0
+
+        with transaction.atomic():
+            Doc.objects.all().delete()
+
+            batch = []
+            contracts = Contract.objects.select_related('customer').iterator(chunk_size=batch_size)
+            for contract in contracts:
+                batch.append(contract_document(contract, contract.customer, Doc))
+                if len(batch) >= batch_size:
+                    Doc.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+
+            for kind, (model_name, *_rest) in SERVICE_KINDS.items():
+                model = apps.get_model('ipshieldapp', model_name)
+                rows = model.objects.select_related('contract').iterator(chunk_size=batch_size)
+                for service in rows:
+                    batch.append(service_document(kind, service, service.contract.service_type, Doc))
+                    if len(batch) >= batch_size:
+                        Doc.objects.bulk_create(batch)
+                        count += len(batch)
+                        batch = []
+
+            Doc.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    # ----- tìm kiếm -----
+    def search(self, q, service_type=None, kinds=None, limit=None):
+        limit = limit or getattr(settings, 'REGISTRY_SEARCH_LIMIT', 200)
+        words = fold_words(q)
+        if not words:
+            return SearchResult([])
+
+        key = compact(q)
+        docs = self._doc_model().objects.all()
+        if service_type:
+            docs = docs.filter(service_type=service_type)
+        if kinds:
+            docs = docs.filter(kind__in=kinds)
+
+        for word in words:
+            docs = docs.filter(
+                Q(identifier__icontains=word) |
+                Q(contract_no__icontains=word) |
+                Q(customer_text__icontains=word) |
+                Q(title__icontains=word) |
+                Q(fragments__icontains=word)
+            )
+
+        docs = docs.annotate(
+            exact=Case(When(identifier_key=key, then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by('exact', '-id')
+
+        rows = docs.values_list('kind', 'object_id', 'contract_id', 'service_type', 'identifier_key')[:limit]
+        return SearchResult([self._hit(row, key) for row in rows])
+
+    @staticmethod
+    def _hit(row, key):
+        kind, object_id, contract_id, service_type, identifier_key = row
+        return SearchHit(kind, object_id, contract_id, service_type, bool(identifier_key) and key in identifier_key)
+
+
+class SqliteRegistrySearchEngine(RegistrySearchEngine):
+    # Trọng số bm25: identifier, contract_no, customer_text, title, fragments
+    weights = (10.0, 8.0, 3.0, 2.0, 4.0)
+
+    # {alias CSDL: có bảng FTS}; chưa có bảng thì lần sau kiểm tra lại (xem fulltext.py)
+    _available = {}
+
+    def is_available(self):
+        alias = connection.alias
+        if self._available.get(alias):
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            found = cursor.fetchone() is not None
+        if not found and alias not in self._available:
+            logger.warning("Chưa có bảng %s (CSDL %s): tìm hồ sơ bằng icontains", FTS_TABLE, alias)
+        self._available[alias] = found
+        return found
+
+    def search(self, q, service_type=None, kinds=None, limit=None):
+        if not self.is_available():
+            return super().search(q, service_type, kinds, limit)
+
+        limit = limit or getattr(settings, 'REGISTRY_SEARCH_LIMIT', 200)
+        match = build_match(q)
+        if not match:
+            return SearchResult([])
+
+        key = compact(q)
+        where = [f"{FTS_TABLE} MATCH %s"]
+        params = [match]
+        if service_type:
+            where.append("d.service_type = %s")
+            params.append(service_type)
+        if kinds:
+            where.append("d.kind IN (%s)" % ', '.join(['%s'] * len(kinds)))
+            params.extend(kinds)
+
+        weights = ', '.join(str(w) for w in self.weights)
+        sql = (
+            f"SELECT d.kind, d.object_id, d.contract_id, d.service_type, d.identifier_key "
+            f"FROM {FTS_TABLE} JOIN {DOC_TABLE} d ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {' AND '.join(where)} "
+            f"ORDER BY CASE WHEN d.identifier_key = %s THEN 0 ELSE 1 END, bm25({FTS_TABLE}, {weights}) "
+            f"LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [key, limit])
+            rows = cursor.fetchall()
+        return SearchResult([self._hit(row, key) for row in rows])
+
+
+def create_sqlite_fts(schema_editor):
+    """Bảng FTS5 external-content + trigger giữ đồng bộ với SearchDocument"""
+    cols = ', '.join(FTS_COLUMNS)
+    new_vals = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_vals = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{cols}, content='{DOC_TABLE}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {DOC_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals}); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {DOC_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {DOC_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals}); END"
+    )
+    SqliteRegistrySearchEngine._available.pop(schema_editor.connection.alias, None)
+
+
+def drop_sqlite_fts(schema_editor):
+    for suffix in ('_ai', '_ad', '_au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    SqliteRegistrySearchEngine._available.pop(schema_editor.connection.alias, None)
+
+
+_engine = None
+
+
+def get_registry_search():
+    global _engine
+    if _engine is None:
+        if connection.vendor == 'sqlite':
+            _engine = SqliteRegistrySearchEngine()
+        else:
+            _engine = RegistrySearchEngine()
+    return _engine
+
+
+def registry_search(q, service_type=None, kinds=None, limit=None):
+    """Điểm vào duy nhất cho các trang tìm kiếm"""
+    return get_registry_search().search(q, service_type=service_type, kinds=kinds, limit=limit)
+
+
+# ---------- tra cứu theo số định danh ----------
+def identifier_matches(kind, q, limit=None):
+    """
+    Các dịch vụ khớp số định danh, theo 2 tầng:
+    1. Dải tiền tố trên cột *_key (có index): key <= x < key kế tiếp,
+       sắp theo key nên bản ghi trùng khớp luôn đứng đầu.
+    2. Không có -> tìm mờ (chuỗi con) qua chỉ mục FTS.
+    """
+    limit = limit or getattr(settings, 'REGISTRY_SEARCH_LIMIT', 200)
+    model_name, _, id_field, _ = SERVICE_KINDS[kind]
+    key = registry_key(q)
+    if not id_field or not key:
+        return []
+
+    key_field = f'{id_field}_key'
+    model = global_apps.get_model('ipshieldapp', model_name)
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+
+    prefixed = list(
+        model.objects.select_related('contract', 'contract__customer')
+        .filter(**{f'{key_field}__gte': key, f'{key_field}__lt': upper})
+        .order_by(key_field, 'id')[:limit]
+    )
+    if prefixed:
+        return prefixed
+
+    return registry_search(q, kinds=[kind], limit=limit).objects(kind, identifier_only=True)
+
+
+def lookup_identifier(kind, q):
+    """1 dịch vụ khớp nhất: trùng khóa (O(log n)) -> tiền tố -> tìm mờ"""
+    model_name, _, id_field, _ = SERVICE_KINDS[kind]
+    key = registry_key(q)
+    if not id_field or not key:
+        return None
+
+    model = global_apps.get_model('ipshieldapp', model_name)
+    exact = model.objects.filter(**{f'{id_field}_key': key}).order_by('id').first()
+    if exact:
+        return exact
+
+    matches = identifier_matches(kind, q, limit=1)
+    return matches[0] if matches else None
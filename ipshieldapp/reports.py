@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from django.utils import timezone
+
+from .models import Contract, PaymentInstallment
+
+
+# ============================
+# BÁO CÁO TUỔI NỢ (AGING)
+# ============================
+AGING_CACHE_KEY = 'reports:receivables_aging'
+
+AGING_BUCKETS = (
+    ('current', 'Chưa đến hạn'),
+    ('d0_30', '0–30 ngày'),
+    ('d31_60', '31–60 ngày'),
+    ('d61_90', '61–90 ngày'),
+    ('d90_plus', 'Trên 90 ngày'),
+)
+
+AGING_EXPORT_HEADERS = ['Nhóm', 'Tên', 'Mã KH'] + [label for _, label in AGING_BUCKETS] + ['Tổng']
+
+
+def invalidate_receivables():
+    """Gọi khi có thanh toán / thêm-sửa-xóa đợt (thường qua transaction.on_commit)"""
+    cache.delete(AGING_CACHE_KEY)
+
+
+def _bucket_conditions(today):
+    """Số ngày quá hạn = hôm nay - due_date; so sánh trực tiếp trên cột due_date để dùng index"""
+    return {
+        'current': Q(due_date__gt=today) | Q(due_date__isnull=True),
+        'd0_30': Q(due_date__lte=today, due_date__gte=today - timedelta(days=30)),
+        'd31_60': Q(due_date__lt=today - timedelta(days=30), due_date__gte=today - timedelta(days=60)),
+        'd61_90': Q(due_date__lt=today - timedelta(days=60), due_date__gte=today - timedelta(days=90)),
+        'd90_plus': Q(due_date__lt=today - timedelta(days=90)),
+    }
+
+
+def _empty_row():
+    row = OrderedDict((key, Decimal('0')) for key, _ in AGING_BUCKETS)
+    row['total'] = Decimal('0')
+    return row
+
+
+def compute_aging(today=None):
+    """
+    1 câu GROUP BY (khách hàng, loại dịch vụ) trên các đợt còn nợ,
+    mỗi nhóm tuổi nợ là 1 SUM(CASE ...). Gộp theo loại dịch vụ / theo khách hàng bằng Python
+    trên kết quả đã gom (ít dòng).
+    """
+    today = today or timezone.now().date()
+    money = DecimalField(max_digits=15, decimal_places=2)
+    outstanding = F('amount') - F('paid_amount')
+
+    buckets = {
+        key: Sum(Case(When(cond, then=outstanding), default=0, output_field=money))
+        for key, cond in _bucket_conditions(today).items()
+    }
+    rows = (
+        PaymentInstallment.objects
+        .filter(amount__gt=F('paid_amount'))
+        .order_by()
+        .values(
+            'contract__service_type',
+            'contract__customer_id',
+            'contract__customer__customer_code',
+            'contract__customer__name',
+        )
+        .annotate(**buckets)
+    )
+
+    labels = dict(Contract.SERVICE_TYPE_CHOICES)
+    by_service = OrderedDict((code, _empty_row()) for code, _ in Contract.SERVICE_TYPE_CHOICES)
+    by_customer = {}
+    totals = _empty_row()
+
+    for row in rows:
+        service_row = by_service.setdefault(row['contract__service_type'], _empty_row())
+        customer_id = row['contract__customer_id']
+        if customer_id not in by_customer:
+            by_customer[customer_id] = {
+                'customer_id': customer_id,
+                'customer_code': row['contract__customer__customer_code'],
+                'customer_name': row['contract__customer__name'],
+                'amounts': _empty_row(),
+            }
+        customer_row = by_customer[customer_id]['amounts']
+
+        for key, _ in AGING_BUCKETS:
+            value = row[key] or Decimal('0')
+            for target in (service_row, customer_row, totals):
+                target[key] += value
+                target['total'] += value
+
+    customers = sorted(by_customer.values(), key=lambda c: c['amounts']['total'], reverse=True)
+    return {
+        'date': today,
+        'by_service': [
+            {'service_type': code, 'label': labels.get(code, code), 'amounts': amounts}
+            for code, amounts in by_service.items()
+        ],
+        'by_customer': customers,
+        'totals': totals,
+    }
+
+
+def aging_report(today=None):
+    """Báo cáo tuổi nợ lấy từ cache; tính lại khi cache bị xóa hoặc đã sang ngày mới"""
+    today = today or timezone.now().date()
+    report = cache.get(AGING_CACHE_KEY)
+    if report is None or report['date'] != today:
+        report = compute_aging(today)
+        cache.set(AGING_CACHE_KEY, report, getattr(settings, 'AGING_REPORT_TIMEOUT', 3600))
+    return report
+
+
+def aging_export_rows(report):
+    """Dòng xuất file: phần theo loại dịch vụ rồi đến phần theo khách hàng"""
+    keys = [key for key, _ in AGING_BUCKETS] + ['total']
+    for row in report['by_service']:
+        yield ['Loại dịch vụ', row['label'], ''] + [row['amounts'][k] for k in keys]
+    for row in report['by_customer']:
+        yield ['Khách hàng', row['customer_name'], row['customer_code']] + [row['amounts'][k] for k in keys]
+    yield ['Tổng cộng', '', ''] + [report['totals'][k] for k in keys]
+
@@ -0,0 +1,180 @@
+from collections import OrderedDict, defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncYear
+
+from .models import Contract, DailyRevenue, PaymentLog
+
+
+# ============================
+# DOANH THU GOM THEO NGÀY (CỘNG DỒN)
+# ============================
+REVENUE_PERIODS = {
+    'day': None,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def _log_day(paid_at):
+    return paid_at.date() if isinstance(paid_at, datetime) else paid_at
+
+
+def apply_revenue_deltas(deltas):
+    """
+    deltas: {(ngày, loại dịch vụ, đã xuất HĐ): (số tiền, số lần)}.
+    Mỗi khóa 1 câu UPDATE cộng dồn bằng F(); chưa có dòng thì tạo mới.
+    """
+    for (day, service_type, exported), (amount, count) in deltas.items():
+        if not amount and not count:
+            continue
+        key = {'day': day, 'service_type': service_type, 'is_exported_bill': exported}
+        increment = {
+            'amount': F('amount') + amount,
+            'payment_count': F('payment_count') + count,
+        }
+        if DailyRevenue.objects.filter(**key).update(**increment):
+            continue
+        try:
+            with transaction.atomic():
+                DailyRevenue.objects.create(amount=amount, payment_count=count, **key)
+        except IntegrityError:
+            # Request khác vừa tạo dòng cùng khóa -> cộng vào dòng đó
+            DailyRevenue.objects.filter(**key).update(**increment)
+
+
+def _apply_log_changes(changes):
+    """
+    changes: list (PaymentLog, +1 / -1).
+    Loại dịch vụ lấy từ hợp đồng đã nạp, thiếu thì đọc 1 câu cho cả lô.
+    """
+    missing = {log.contract_id for log, _ in changes if not PaymentLog.contract.is_cached(log)}
+    service_types = dict(
+        Contract.objects.filter(pk__in=missing).values_list('id', 'service_type')
+    ) if missing else {}
+
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for log, sign in changes:
+        if PaymentLog.contract.is_cached(log):
+            service_type = log.contract.service_type
+        else:
+            service_type = service_types.get(log.contract_id)
+        if service_type is None:
+            continue  # hợp đồng đã bị xóa
+        delta = deltas[(_log_day(log.paid_at), service_type, log.is_exported_bill)]
+        delta[0] += sign * Decimal(log.amount_paid)
+        delta[1] += sign
+
+    apply_revenue_deltas(deltas)
+
+
+def add_logs(logs, sign=1):
+    """Cộng (sign=1) / trừ (sign=-1) các PaymentLog vào bảng gom"""
+    _apply_log_changes([(log, sign) for log in logs])
+
+
+def replace_log(before, after):
+    """Log bị sửa: trừ bản cũ, cộng bản mới"""
+    _apply_log_changes([(before, -1), (after, 1)])
+
+
+def move_to_exported(queryset):
+    """
+    queryset: các log vừa được UPDATE sang đã xuất HĐ (xuất hóa đơn hàng loạt không gửi signal).
+    1 câu GROUP BY rồi chuyển số tiền từ phần chưa xuất sang phần đã xuất.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(day=TruncDate('paid_at'))
+        .values('day', 'contract__service_type')
+        .annotate(total=Sum('amount_paid'), n=Count('id'))
+    )
+    deltas = {}
+    for row in rows:
+        total, n = row['total'] or Decimal('0'), row['n']
+        deltas[(row['day'], row['contract__service_type'], False)] = (-total, -n)
+        deltas[(row['day'], row['contract__service_type'], True)] = (total, n)
+    apply_revenue_deltas(deltas)
+
+
+# ============================
+# DỰNG LẠI TỪ PAYMENTLOG
+# ============================
+def rebuild_daily_revenue(start=None, end=None):
+    """
+    Tính lại bảng gom bằng 1 câu GROUP BY trên PaymentLog, trong khoảng [start, end] nếu có.
+    Dùng khi dữ liệu bị sửa ngoài luồng (vd. đổi loại dịch vụ của hợp đồng đã có thanh toán).
+    """
+    logs = PaymentLog.objects.all()
+    rollup = DailyRevenue.objects.all()
+    if start:
+        logs = logs.filter(paid_at__gte=datetime.combine(start, time.min))
+        rollup = rollup.filter(day__gte=start)
+    if end:
+        logs = logs.filter(paid_at__lt=datetime.combine(end + timedelta(days=1), time.min))
+        rollup = rollup.filter(day__lte=end)
+
+    rows = (
+        logs.order_by()
+        .annotate(day=TruncDate('paid_at'))
+        .values('day', 'contract__service_type', 'is_exported_bill')
+        .annotate(total=Sum('amount_paid'), n=Count('id'))
+    )
+    objs = [
+        DailyRevenue(
+            day=row['day'],
+            service_type=row['contract__service_type'],
+            is_exported_bill=row['is_exported_bill'],
+            amount=row['total'] or 0,
+            payment_count=row['n'],
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        rollup.delete()
+        DailyRevenue.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+# ============================
+# ĐỌC CHO BÁO CÁO
+# ============================
+def revenue_by_period(period='month', start=None, end=None):
+    """
+    Doanh thu theo kỳ (ngày / tháng / năm) x loại dịch vụ, đọc từ bảng gom.
+    Trả về list dòng: {'period', 'amounts': {service_type: số tiền}, 'exported', 'total', 'count'}.
+    """
+    qs = DailyRevenue.objects.order_by()
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+
+    trunc = REVENUE_PERIODS[period]
+    qs = qs.annotate(period=trunc('day') if trunc else F('day'))
+    rows = (
+        qs.values('period', 'service_type', 'is_exported_bill')
+        .annotate(total=Sum('amount'), n=Sum('payment_count'))
+        .order_by('-period')
+    )
+
+    periods = OrderedDict()
+    for row in rows:
+        entry = periods.setdefault(row['period'], {
+            'period': row['period'],
+            'amounts': OrderedDict((code, Decimal('0')) for code, _ in Contract.SERVICE_TYPE_CHOICES),
+            'exported': Decimal('0'),
+            'total': Decimal('0'),
+            'count': 0,
+        })
+        total = row['total'] or Decimal('0')
+        entry['amounts'][row['service_type']] = entry['amounts'].get(row['service_type'], 0) + total
+        if row['is_exported_bill']:
+            entry['exported'] += total
+        entry['total'] += total
+        entry['count'] += row['n'] or 0
+    return list(periods.values())
@@ -0,0 +1,252 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Customer,
+    Contract,
+    PaymentInstallment,
+    PaymentLog,
+    TrademarkService,
+    CopyrightService,
+    BusinessRegistrationService,
+    InvestmentService,
+    OtherService,
+)
+from . import audit
+from .fulltext import get_search_backend
+from .prefix_index import customer_index
+from .registry_search import get_registry_search
+from .revenue import add_logs, replace_log
+
+SERVICE_MODELS = (
+    TrademarkService,
+    CopyrightService,
+    BusinessRegistrationService,
+    InvestmentService,
+    OtherService,
+)
+
+
+# ============================
+# ĐỒNG BỘ CHỈ MỤC TÌM KIẾM KHÁCH HÀNG
+# ============================
+@receiver(post_save, sender=Customer)
+def index_customer(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index(instance)
+    # Chỉ mục RAM không rollback được nên chờ commit xong mới cập nhật
+    transaction.on_commit(lambda: customer_index.upsert(instance))
+
+
+@receiver(post_delete, sender=Customer)
+def unindex_customer(sender, instance, **kwargs):
+    pk = instance.pk
+    get_search_backend().remove(pk)
+    transaction.on_commit(lambda: customer_index.remove(pk))
+
+
+# ============================
+# ĐỒNG BỘ CHỈ MỤC HỢP ĐỒNG / DỊCH VỤ
+# ============================
+CONTRACT_INDEXED_FIELDS = {'contract_no', 'customer', 'customer_id', 'service_type'}
+
+
+@receiver(post_save, sender=Contract)
+def index_contract(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # save(update_fields=['status']) không đổi dữ liệu tìm kiếm -> bỏ qua
+    if update_fields is not None and not CONTRACT_INDEXED_FIELDS & set(update_fields):
+        return
+    get_registry_search().index_contract(instance)
+
+
+@receiver(post_save, sender=Customer)
+def reindex_customer_contracts(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and not set(Customer.CONTRACT_INDEX_FIELDS) & set(update_fields):
+        return
+    # Chỉ khi đổi mã / tên khách
+    if not instance.contract_index_changed():
+        return
+    get_registry_search().update_customer(instance)
+    instance._indexed_values = tuple(getattr(instance, f) for f in Customer.CONTRACT_INDEX_FIELDS)
+
+
+def _index_service(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_registry_search().index_service(instance)
+
+
+def _unindex_service(sender, instance, **kwargs):
+    get_registry_search().remove_service(instance)
+
+
+for _model in SERVICE_MODELS:
+    post_save.connect(_index_service, sender=_model, dispatch_uid=f'index_{_model.__name__}')
+    post_delete.connect(_unindex_service, sender=_model, dispatch_uid=f'unindex_{_model.__name__}')
+
+
+# ============================
+# TRẠNG THÁI KHÁCH HÀNG (SUY RA TỪ HỢP ĐỒNG)
+# ============================
+CUSTOMER_STATUS_SOURCE_FIELDS = {'status', 'customer', 'customer_id'}
+
+
+def _refresh_customer_status_on_commit(customer_ids):
+    # 1 câu UPDATE có chỉ mục -> chạy ngay sau commit, không cần worker
+    transaction.on_commit(lambda: Customer.refresh_status(customer_ids))
+
+
+@receiver(post_save, sender=Contract)
+def refresh_customer_status_on_contract_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not CUSTOMER_STATUS_SOURCE_FIELDS & set(update_fields):
+        return
+    customer_ids = {instance.customer_id}
+    # Chuyển hợp đồng sang khách khác -> khách cũ cũng phải tính lại
+    # (đọc trước khi _audit_save cập nhật _loaded_values)
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded and loaded.get('customer_id') is not None:
+        customer_ids.add(loaded['customer_id'])
+    _refresh_customer_status_on_commit(list(customer_ids))
+
+
+@receiver(post_delete, sender=Contract)
+def refresh_customer_status_on_contract_delete(sender, instance, **kwargs):
+    _refresh_customer_status_on_commit([instance.customer_id])
+
+
+# ============================
+# TỔNG TIỀN LƯU SẴN TRÊN HỢP ĐỒNG
+# ============================
+PAYMENT_TOTAL_SOURCE_FIELDS = {'amount', 'paid_amount', 'contract', 'contract_id'}
+
+# Xóa / dựng lại nhiều đợt 1 lần (create_installments): signal từng dòng chỉ gom lại
+_installment_batch = ContextVar('installment_batch', default=None)
+
+
+@contextmanager
+def installment_batch():
+    """
+    Trong khối: xóa đợt không tính lại tổng / doanh thu theo từng dòng.
+    Ra khỏi khối: tính lại tổng 1 lần cho các hợp đồng, trừ doanh thu các log bị xóa 1 lần.
+    """
+    batch = {'contract_ids': set(), 'deleted_logs': []}
+    token = _installment_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _installment_batch.reset(token)
+    if batch['contract_ids']:
+        Contract.refresh_payment_totals(list(batch['contract_ids']))
+    if batch['deleted_logs']:
+        add_logs(batch['deleted_logs'], sign=-1)
+
+
+def _refresh_contract_totals(instance):
+    batch = _installment_batch.get()
+    if batch is not None:
+        batch['contract_ids'].add(instance.contract_id)
+        return
+    # Chạy trong cùng transaction với lần ghi đợt thanh toán
+    Contract.refresh_payment_totals([instance.contract_id])
+    # Hợp đồng đang giữ trong bộ nhớ (vd. contract.installments.get(...)) -> nạp lại tổng
+    if PaymentInstallment.contract.is_cached(instance):
+        try:
+            instance.contract.refresh_from_db(fields=Contract.PAYMENT_TOTAL_FIELDS)
+        except Contract.DoesNotExist:
+            pass  # đang xóa cả hợp đồng
+
+
+@receiver(post_save, sender=PaymentInstallment)
+def update_totals_on_installment_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # save(update_fields=['is_exported_bill', ...]) không đổi số tiền -> bỏ qua
+    if update_fields is not None and not PAYMENT_TOTAL_SOURCE_FIELDS & set(update_fields):
+        return
+    _refresh_contract_totals(instance)
+
+
+@receiver(post_delete, sender=PaymentInstallment)
+def update_totals_on_installment_delete(sender, instance, **kwargs):
+    _refresh_contract_totals(instance)
+
+
+# ============================
+# DOANH THU GOM THEO NGÀY
+# ============================
+REVENUE_SOURCE_FIELDS = ('contract_id', 'amount_paid', 'paid_at', 'is_exported_bill')
+REVENUE_UPDATE_FIELDS = {'contract', 'contract_id', 'amount_paid', 'paid_at', 'is_exported_bill'}
+
+
+@receiver(pre_save, sender=PaymentLog)
+def remember_revenue_before(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not REVENUE_UPDATE_FIELDS & set(update_fields):
+        return
+    # Sửa log -> giữ bản cũ để trừ khỏi bảng gom
+    instance._revenue_before = (
+        PaymentLog.objects
+        .filter(pk=instance.pk)
+        .only('contract', 'amount_paid', 'paid_at', 'is_exported_bill')
+        .first()
+    )
+
+
+@receiver(post_save, sender=PaymentLog)
+def update_revenue_on_log_save(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add_logs([instance])
+        return
+
+    before = instance.__dict__.pop('_revenue_before', None)
+    if before is None:
+        return
+    if all(getattr(before, f) == getattr(instance, f) for f in REVENUE_SOURCE_FIELDS):
+        return
+    replace_log(before, instance)
+
+
+@receiver(post_delete, sender=PaymentLog)
+def update_revenue_on_log_delete(sender, instance, **kwargs):
+    batch = _installment_batch.get()
+    if batch is not None:
+        batch['deleted_logs'].append(instance)
+        return
+    add_logs([instance], sign=-1)
+
+
+# ============================
+# LỊCH SỬ THAY ĐỔI HỢP ĐỒNG (audit.py)
+# ============================
+AUDITED_MODELS = (Contract, PaymentInstallment) + SERVICE_MODELS
+
+
+def _audit_save(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    audit.record_save(instance, created, update_fields)
+
+
+def _audit_delete(sender, instance, **kwargs):
+    # Xóa hợp đồng kéo theo xóa lịch sử của nó -> chỉ ghi khi xóa dịch vụ / đợt
+    if sender is not Contract:
+        audit.record_delete(instance)
+
+
+for _model in AUDITED_MODELS:
+    post_save.connect(_audit_save, sender=_model, dispatch_uid=f'audit_save_{_model.__name__}')
+    post_delete.connect(_audit_delete, sender=_model, dispatch_uid=f'audit_delete_{_model.__name__}')
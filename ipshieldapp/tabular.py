@@ -0,0 +1,173 @@
+import csv
+import io
+import os
+import tempfile
+
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from .normalize import fold_words
+
+try:
+    import openpyxl
+except ImportError:  # chỉ cần khi đọc / ghi .xlsx
+    openpyxl = None
+
+
+# ============================
+# ĐỌC FILE BẢNG (CSV / XLSX)
+# ============================
+def _header_key(value):
+    return ' '.join(fold_words(value))
+
+
+def _iter_csv(fileobj):
+    raw = fileobj.read()
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8-sig')
+    sample = raw[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(io.StringIO(raw), dialect)
+
+
+def _iter_xlsx(fileobj):
+    if openpyxl is None:
+        raise ValidationError('Cần cài openpyxl để đọc file .xlsx')
+    book = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in book.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        book.close()
+
+
+def iter_rows(fileobj, filename):
+    """Đọc từng dòng (list giá trị) của file .csv / .xlsx"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        return _iter_xlsx(fileobj)
+    if ext in ('.csv', '.txt', ''):
+        return _iter_csv(fileobj)
+    raise ValidationError(f'Không hỗ trợ định dạng file "{ext}" (chỉ nhận .csv, .xlsx)')
+
+
+def read_records(fileobj, filename, columns, required=()):
+    """
+    Đọc file có dòng tiêu đề, trả về list (số dòng, dict) theo tên cột chuẩn.
+    columns: {'amount': ('so tien', 'amount', ...)} - tên cột đã bỏ dấu, chữ thường.
+    Dòng trống bị bỏ qua.
+    """
+    rows = iter_rows(fileobj, filename)
+    header = next(rows, None)
+    if not header:
+        raise ValidationError('File rỗng')
+
+    aliases = {alias: name for name, names in columns.items() for alias in names}
+    positions = {}
+    for i, title in enumerate(header):
+        name = aliases.get(_header_key(title))
+        if name and name not in positions:
+            positions[name] = i
+
+    missing = [name for name in required if name not in positions]
+    if missing:
+        raise ValidationError(f'Thiếu cột: {", ".join(missing)}')
+
+    records = []
+    for row_no, row in enumerate(rows, start=2):
+        if not any(v not in (None, '') for v in row):
+            continue
+        records.append((row_no, {
+            name: row[i] if i < len(row) else None
+            for name, i in positions.items()
+        }))
+    return records
+
+
+# ============================
+# XUẤT FILE BẢNG (CSV / XLSX)
+# ============================
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+def export_response(headers, rows, filename, fmt='csv'):
+    """Trả file .csv (có BOM cho Excel) hoặc .xlsx từ danh sách dòng"""
+    if fmt == 'xlsx':
+        if openpyxl is None:
+            raise ValidationError('Cần cài openpyxl để xuất file .xlsx')
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet()
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(list(row))
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        book.save(response)
+    else:
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response.write('\ufeff')
+        writer = csv.writer(response)
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def write_xlsx(target, headers, rows):
+    """Ghi .xlsx chế độ write_only (openpyxl đẩy từng dòng ra file tạm, RAM không tăng theo số dòng)"""
+    if openpyxl is None:
+        raise ValidationError('Cần cài openpyxl để xuất file .xlsx')
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(list(row))
+    book.save(target)
+
+
+def write_csv(target, headers, rows):
+    """Ghi CSV từng dòng vào file văn bản đang mở (mở với newline='')"""
+    writer = csv.writer(target)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+
+
+class _Echo:
+    """csv.writer ghi vào đây -> trả lại chuỗi để StreamingHttpResponse gửi đi ngay"""
+    def write(self, value):
+        return value
+
+
+def _stream_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_response(headers, rows, filename, fmt='csv'):
+    """
+    Như export_response nhưng không giữ cả file trong RAM:
+    CSV gửi từng dòng qua StreamingHttpResponse; XLSX ghi write_only ra file tạm rồi gửi file.
+    rows nên là iterator (vd. values_list(...).iterator(chunk_size=...)).
+    """
+    if fmt == 'xlsx':
+        tmp = tempfile.TemporaryFile()
+        write_xlsx(tmp, headers, rows)
+        tmp.seek(0)
+        return FileResponse(
+            tmp,
+            as_attachment=True,
+            filename=f'{filename}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    response = StreamingHttpResponse(_stream_csv(headers, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+
+# ============================
+# HÀNG ĐỢI VIỆC NỀN (LƯU TRONG CSDL)
+# ============================
+# Việc chậm sau request (tính lại trạng thái khách...) được ghi thành 1 dòng
+# BackgroundTask rồi chạy ngoài request:
+#   - TASK_QUEUE_MODE = 'db'     : tiến trình `manage.py run_tasks` lấy việc ra chạy
+#   - TASK_QUEUE_MODE = 'thread' : chạy luôn trong thread pool của tiến trình web (dev)
+# Cùng dedup_key mà còn 1 việc đang chờ -> không thêm dòng mới.
+_registry = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task(name, max_attempts=3):
+    """Đăng ký hàm chạy nền: @task('customers.refresh_status') - hàm nhận payload dạng **kwargs"""
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def _mode():
+    return getattr(settings, 'TASK_QUEUE_MODE', 'db')
+
+
+def _lock_timeout():
+    return timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 600))
+
+
+def _retry_delay(attempts):
+    """Chờ tăng dần giữa các lần chạy lại: 30s, 60s, 120s... tối đa 1 giờ"""
+    base = getattr(settings, 'TASK_RETRY_DELAY', 30)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 3600))
+
+
+# ============================
+# THÊM VIỆC
+# ============================
+def enqueue(name, payload=None, dedup_key=None, run_after=None):
+    """
+    Thêm 1 việc vào hàng đợi, trả về BackgroundTask.
+    Gọi trong transaction -> việc chỉ tồn tại nếu transaction commit.
+    """
+    if name not in _registry:
+        raise ValueError(f"Việc nền chưa đăng ký: {name}")
+    max_attempts = _registry[name][1]
+
+    try:
+        # Savepoint: trùng khóa không làm hỏng transaction bên ngoài
+        with transaction.atomic():
+            item = BackgroundTask.objects.create(
+                name=name,
+                payload=payload or {},
+                dedup_key=dedup_key,
+                max_attempts=max_attempts,
+                run_after=run_after or timezone.now(),
+            )
+    except IntegrityError:
+        if dedup_key is None:
+            raise
+        # Đã có việc cùng khóa đang chờ -> việc đó chạy sau thời điểm này nên đủ
+        item = BackgroundTask.objects.filter(dedup_key=dedup_key, status='pending').first()
+        if item is not None:
+            return item
+        # Việc kia vừa được nhận chạy giữa chừng -> thêm lại
+        return enqueue(name, payload, dedup_key, run_after)
+
+    if _mode() == 'thread':
+        transaction.on_commit(lambda: _submit(item.pk))
+    return item
+
+
+def enqueue_on_commit(name, payload=None, dedup_key=None, run_after=None):
+    """Chỉ thêm việc sau khi transaction hiện tại commit (rollback -> không có việc)"""
+    transaction.on_commit(lambda: enqueue(name, payload, dedup_key, run_after))
+
+
+# ============================
+# NHẬN VIỆC + CHẠY
+# ============================
+def _claim(task_id):
+    """Nhận 1 việc đang chờ; nhiều worker cùng nhận thì chỉ 1 câu UPDATE thành công"""
+    now = timezone.now()
+    claimed = BackgroundTask.objects.filter(
+        pk=task_id, status='pending', run_after__lte=now,
+    ).update(status='running', locked_at=now, attempts=F('attempts') + 1)
+    return BackgroundTask.objects.get(pk=task_id) if claimed else None
+
+
+def claim_batch(limit=10):
+    """Nhận tối đa `limit` việc đã đến giờ chạy, theo thứ tự đến hạn"""
+    ids = list(
+        BackgroundTask.objects
+        .filter(status='pending', run_after__lte=timezone.now())
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for task_id in ids:
+        item = _claim(task_id)
+        if item is not None:
+            claimed.append(item)
+    return claimed
+
+
+def _finish(item, **fields):
+    BackgroundTask.objects.filter(pk=item.pk).update(**fields)
+    for key, value in fields.items():
+        setattr(item, key, value)
+
+
+def _reschedule(item, error):
+    """Trả việc về hàng đợi (chờ tăng dần) hoặc đánh dấu lỗi nếu đã hết lượt"""
+    now = timezone.now()
+    if item.attempts >= item.max_attempts:
+        _finish(item, status='failed', last_error=error, finished_at=now, locked_at=None)
+        return
+    try:
+        with transaction.atomic():
+            _finish(
+                item, status='pending', last_error=error, locked_at=None,
+                run_after=now + _retry_delay(item.attempts),
+            )
+    except IntegrityError:
+        # Đã có việc mới cùng khóa đang chờ -> lần chạy đó làm thay
+        _finish(item, status='done', last_error=f"{error}\n(gộp vào việc cùng khóa đang chờ)", finished_at=now)
+
+
+def run_task(item):
+    """Chạy 1 việc đã nhận; trả về True nếu xong"""
+    entry = _registry.get(item.name)
+    if entry is None:
+        _finish(item, status='failed', last_error=f"Việc nền chưa đăng ký: {item.name}",
+                finished_at=timezone.now(), locked_at=None)
+        return False
+
+    try:
+        entry[0](**item.payload)
+    except Exception:
+        _reschedule(item, traceback.format_exc())
+        return False
+
+    _finish(item, status='done', last_error='', finished_at=timezone.now(), locked_at=None)
+    return True
+
+
+def release_stale(timeout=None):
+    """Việc 'đang chạy' quá lâu (worker chết giữa chừng) -> trả lại hàng đợi"""
+    cutoff = timezone.now() - (timeout or _lock_timeout())
+    stale = BackgroundTask.objects.filter(status='running', locked_at__lt=cutoff)
+    for item in stale:
+        _reschedule(item, f"Worker không trả kết quả sau {item.locked_at:%Y-%m-%d %H:%M:%S}")
+    return len(stale)
+
+
+def purge_finished(days):
+    """Xóa việc đã xong / lỗi cũ hơn `days` ngày"""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = BackgroundTask.objects.filter(
+        Q(status='done') | Q(status='failed'), finished_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+# ============================
+# CHẾ ĐỘ THREAD (DEV)
+# ============================
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TASK_THREAD_WORKERS', 2),
+                thread_name_prefix='ipshield-task',
+            )
+    return _executor
+
+
+def _submit(task_id):
+    _get_executor().submit(_run_in_thread, task_id)
+
+
+def _run_in_thread(task_id):
+    close_old_connections()
+    try:
+        while True:
+            item = _claim(task_id)
+            if item is None or run_task(item):
+                return
+            logger.warning(
+                "Việc nền %s #%s lỗi (lần %s/%s): %s",
+                item.name, item.pk, item.attempts, item.max_attempts, item.last_error,
+            )
+            item.refresh_from_db(fields=['status', 'run_after'])
+            if item.status != 'pending':
+                return
+            # Chạy lại ngay trong thread sau khoảng chờ
+            time.sleep(max((item.run_after - timezone.now()).total_seconds(), 0))
+    except Exception:
+        logger.exception("Việc nền #%s lỗi khi chạy trong thread", task_id)
+    finally:
+        connection.close()
@@ -0,0 +1,13 @@
+from .models import Customer
+from .taskqueue import task
+
+
+# ============================
+# VIỆC NỀN ĐÃ ĐĂNG KÝ (chạy bằng `manage.py run_tasks`)
+# ============================
+# Chỉ đưa vào hàng đợi việc thật sự chậm. Trạng thái khách sau mỗi lần ghi hợp đồng /
+# thanh toán là 1 câu UPDATE -> chạy ngay sau commit (signals.py, payments.py).
+@task('customers.refresh_status')
+def refresh_customer_status(customer_ids=None):
+    """Tính lại trạng thái khách từ trạng thái các hợp đồng (None = toàn bộ bảng)"""
+    Customer.refresh_status(customer_ids)
@@ -1,3 +1,148 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from .forms import ContractForm
+from .models import Contract, Customer, PaymentLog
+from .payments import PaymentService
+
+
+def make_customer(code='KH001'):
+    return Customer.objects.create(
+        customer_code=code, name='Nguyễn Văn A', phone='0900000000', email='a@example.com',
+        address='Hà Nội', manager='Trần B', position='Giám đốc',
+    )
+
+
+def make_contract(customer, contract_no='HD001', **fields):
+    fields = {
+        'service_type': 'khac', 'contract_value': 1000, 'payment_type': 'installment',
+        'number_of_installments': 2, 'status': 'processing', **fields,
+    }
+    return Contract.objects.create(customer=customer, contract_no=contract_no, **fields)
+
+
+# ============================
+# VALIDATE HỢP ĐỒNG 1 LẦN / ĐƯỜNG GHI
+# ============================
+class ContractValidationQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.contract = make_contract(cls.customer)
+
+    def form_data(self, contract, **changes):
+        data = {
+            'customer': contract.customer_id,
+            'service_type': contract.service_type,
+            'contract_no': contract.contract_no,
+            'contract_value': contract.contract_value,
+            'payment_type': contract.payment_type,
+            'prepaid_amount': contract.prepaid_amount,
+            'number_of_installments': contract.number_of_installments,
+            'installment_interval_days': contract.installment_interval_days,
+        }
+        data.update(changes)
+        return data
+
+    def test_save_update_fields_skips_validation(self):
+        contract = Contract.objects.get(pk=self.contract.pk)
+        contract.status = 'paused'
+        # Chỉ câu UPDATE: không kiểm tra lại unique contract_no / khóa ngoại customer
+        with self.assertNumQueries(1):
+            contract.save(update_fields=['status'])
+
+    def test_form_save_does_not_revalidate(self):
+        contract = Contract.objects.get(pk=self.contract.pk)
+        form = ContractForm(self.form_data(contract, contract_value=2000), instance=contract)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        # full_clean của form đã kiểm tra -> save() chỉ ghi (UPDATE + chỉ mục tìm kiếm)
+        with self.assertNumQueries(3):
+            form.save()
+
+        # Lưu lại không đổi gì: không truy vấn kiểm tra nào
+        with self.assertNumQueries(3):
+            contract.save()
+
+    def test_save_revalidates_changed_fields(self):
+        contract = Contract.objects.get(pk=self.contract.pk)
+        make_contract(self.customer, 'HD002')
+        contract.contract_no = 'HD002'
+        with self.assertRaises(ValidationError) as ctx:
+            contract.save()
+        self.assertIn('contract_no', ctx.exception.message_dict)
+
+    def test_validate_many_uses_one_query(self):
+        contracts = [
+            Contract(customer=self.customer, contract_no=no, service_type='khac',
+                     contract_value=1000, payment_type='full')
+            for no in ('HD101', 'HD102', self.contract.contract_no, 'HD101')
+        ]
+        # Trùng CSDL + trùng trong lô: 1 câu IN cho cả lô
+        with self.assertNumQueries(1):
+            errors = Contract.validate_many(contracts, exclude=['customer'])
+        self.assertEqual(sorted(errors), [2, 3])
+
+
+# ============================
+# GHI NHẬN THANH TOÁN (PaymentService)
+# ============================
+class PaymentServiceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.contract = make_contract(make_customer())
+        cls.contract.create_installments()
+        for ins in cls.contract.installments.all():
+            ins.amount = 500
+            ins.save()
+
+    def setUp(self):
+        self.contract = Contract.objects.get(pk=self.contract.pk)
+        self.first, self.second = self.contract.installments.order_by('due_date', 'id')
+
+    def record(self, installment, **kwargs):
+        return PaymentService(Contract.objects.get(pk=self.contract.pk)).record(installment.pk, **kwargs)
+
+    def test_same_idempotency_key_returns_original_log(self):
+        first = self.record(self.first, amount=Decimal('200'), idempotency_key='form-1')
+        again = self.record(self.first, amount=Decimal('200'), idempotency_key='form-1')
+
+        self.assertTrue(first.created)
+        self.assertFalse(again.created)
+        self.assertEqual(again.log.pk, first.log.pk)
+        self.assertEqual(PaymentLog.objects.count(), 1)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.paid_amount, 200)
+
+    def test_overpayment_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.record(self.first, amount=Decimal('600'))
+        self.assertFalse(PaymentLog.objects.exists())
+
+    def test_paid_installment_is_rejected(self):
+        self.record(self.first)
+        with self.assertRaises(ValidationError):
+            self.record(self.first)
+        self.assertEqual(PaymentLog.objects.count(), 1)
+
+    def test_totals_and_status_match_refresh_payment_totals(self):
+        self.record(self.first, amount=Decimal('300'))
+        self.record(self.first)
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.paid_total, 500)
+        self.assertEqual(self.contract.status, 'processing')
+
+        self.record(self.second)
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.status, 'completed')
+
+        # Tổng cộng dồn bằng F() phải khớp với tính lại từ bảng đợt
+        paid_total = self.contract.paid_total
+        Contract.refresh_payment_totals([self.contract.pk])
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.paid_total, paid_total)
+        self.assertEqual(self.contract.paid_total, 1000)
@@ -27,6 +27,8 @@ urlpatterns = [
 
     # CUSTOMER
     path('customer-add/', views.add_customer, name='add_customer'),
+    path('customer-import/', views.customer_import, name='customer_import'),
+    path('customer-import/errors.csv', views.customer_import_errors, name='customer_import_errors'),
     path('customer/<int:id>/', views.customer_detail, name='customer_detail'),
     path('customer/<int:id>/edit/', views.customer_edit, name='customer_edit'),
     path('customer/<int:id>/delete/', views.customer_delete, name='customer_delete'),
@@ -39,6 +41,18 @@ urlpatterns = [
     path('<int:pk>/change-status/', views.customer_change_status, name='customer_change_status'),
     path("contracts/edit/<int:id>", views.contract_edit, name="contract_edit"),
     path('api/search-customer/', views.search_customer, name='search_customer'),
+
+    # ĐỐI SOÁT SAO KÊ NGÂN HÀNG
+    path('payments/import-statement/', views.bank_statement_import, name='bank_statement_import'),
+    path('payments/import-statement/exceptions.csv', views.bank_statement_exceptions, name='bank_statement_exceptions'),
+    path('payments/export-invoices/', views.invoice_export, name='invoice_export'),
+
+    # BÁO CÁO
+    path('reports/aging/', views.receivables_aging, name='receivables_aging'),
+    path('reports/revenue/', views.revenue_report, name='revenue_report'),
+
+    # XUẤT DỮ LIỆU
+    path('exports/<str:name>/', views.data_export, name='data_export'),
 # Thêm vào urls.py
 path('contract/<int:contract_id>/edit-installments/', views.edit_installment_amounts, name='edit_installment_amounts'),
     # CERTIFICATE (GIẤY CHỨNG NHẬN)
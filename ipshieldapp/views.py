@@ -1,22 +1,29 @@
 # ===============================================
 # IMPORTS
 # ===============================================
-from decimal import Decimal
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
-from django.http import FileResponse, Http404
-from django.db import IntegrityError
+from django.db.models import Count, Q, Sum
+from django.http import FileResponse, Http404, HttpResponse
+from django.db import IntegrityError, transaction
 import os
+import uuid
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 
 from .models import *
 from .forms import *
+from .pagination import KeysetPaginator, RankedPaginator, approximate_count
+from .fulltext import get_search_backend
+from .prefix_index import customer_index
+from .attachments import DeferredFileWriter, build_certificates, validate_uploads
 
-def lock_contract_fields(contract_form):
+def lock_contract_fields(contract_form, editable=()):
 
     for field_name, field in contract_form.fields.items():
+        if field_name in editable:
+            continue
         field.disabled = True
         field.widget.attrs['readonly'] = True
         field.widget.attrs['class'] = field.widget.attrs.get('class', '') + ' readonly-field'
@@ -26,22 +33,33 @@ def lock_contract_fields(contract_form):
 # ===============================================
 def home(request):
     q = request.GET.get('q', '').strip()
-    customers = Customer.objects.all()
 
     if q:
-        customers = customers.filter(
-            Q(customer_code__icontains=q) |
-            Q(name__icontains=q) |
-            Q(email__icontains=q) |
-            Q(phone__icontains=q)
+        # 🔥 TÌM QUA CHỈ MỤC FULL-TEXT, XẾP HẠNG THEO ĐỘ LIÊN QUAN (không dấu: "nguyen" khớp "Nguyễn")
+        backend = get_search_backend()
+        paginator = RankedPaginator(
+            lambda limit, offset: backend.search(q, limit=limit, offset=offset),
+            page_size=request.GET.get('page_size'),
         )
+    else:
+        # 🔥 PHÂN TRANG THEO CON TRỎ (created_at, id) - KHÔNG DÙNG OFFSET
+        paginator = KeysetPaginator(Customer.objects.all(), page_size=request.GET.get('page_size'))
+    page = paginator.page(request.GET.get('cursor'))
+
+    # Tổng số chỉ lấy gần đúng từ cache, không COUNT(*) mỗi lần tải trang
+    total_customers = None
+    if not q:
+        total_customers = approximate_count(Customer.objects.all(), 'customer_total_count')
 
     sliders = Slider.objects.filter(is_active=True)
     mascots = Mascot.objects.filter(is_active=True)
     nhanhieudocquyen = NhanHieuDocQuyen.objects.filter(is_active=True).order_by('id')
 
     return render(request, 'khachhang.html', {
-        'customers': customers,
+        'customers': page,
+        'page': page,
+        'total_customers': total_customers,
+        'q': q,
         'sliders': sliders,
         'mascots': mascots,
         "nhanhieudocquyen": nhanhieudocquyen,
@@ -50,392 +68,142 @@ def home(request):
 # ===============================================
 # CUSTOMER CREATE (ĐÃ SỬA - XỬ LÝ TRÙNG MÃ)
 # ===============================================
-def add_contract(request):
-    if request.method == 'POST':
-        print("\n" + "=" * 60)
-        print("🔍 POST REQUEST RECEIVED")
-        print("=" * 60)
+# Loại dịch vụ -> (form trong context, nhãn lỗi, ô file đính kèm, tên khi không nhập dịch vụ)
+ADD_CONTRACT_SERVICES = {
+    'nhanhieu': ('trademark_formset', 'Nhãn hiệu', 'trademark_files_{}', 'nhãn hiệu'),
+    'banquyen': ('copyright_formset', 'Bản quyền', 'copyright_files_{}', 'bản quyền'),
+    'dkkd': ('business_form', 'ĐKKD', 'business_files', 'ĐKKD'),
+    'dautu': ('investment_form', 'Đầu tư', 'investment_files', 'đầu tư'),
+    'khac': ('other_form', 'Dịch vụ khác', 'other_files', 'dịch vụ'),
+}
+
+
+def _add_contract_forms(data=None, files=None, service_type=None):
+    """Form dịch vụ của trang thêm hợp đồng; chỉ form đúng loại dịch vụ nhận dữ liệu POST"""
+    def bind(code):
+        return (data, files) if code == service_type else ()
+
+    return {
+        'trademark_formset': TrademarkFormSet(
+            *bind('nhanhieu'), prefix='trademark', queryset=TrademarkService.objects.none()
+        ),
+        'copyright_formset': CopyrightFormSet(
+            *bind('banquyen'), prefix='copyright', queryset=CopyrightService.objects.none()
+        ),
+        'business_form': BusinessRegistrationForm(*bind('dkkd')),
+        'investment_form': InvestmentForm(*bind('dautu')),
+        'other_form': OtherServiceForm(*bind('khac')),
+    }
 
-        # Debug: Print all POST data
-        print("\n📋 POST Data Keys:")
-        for key in request.POST.keys():
-            if 'trademark' in key or 'copyright' in key:
-                print(f"  {key}: {request.POST.get(key)}")
 
-        # ===== VALIDATE CONTRACT FORM =====
-        contract_form = ContractForm(request.POST, request.FILES)
+def _form_error_messages(form, label=None):
+    prefix = f"{label} - " if label else ""
+    result = []
+    for field, errors in form.errors.items():
+        field_label = form.fields[field].label if field in form.fields else field
+        result.extend(f"{prefix}{field_label}: {error}" for error in errors)
+    return result
 
+
+def _service_error_messages(service_form, label):
+    if not hasattr(service_form, 'forms'):
+        return _form_error_messages(service_form, label)
+    result = []
+    for idx, form in enumerate(service_form.forms):
+        result.extend(_form_error_messages(form, f"{label} #{idx + 1}"))
+    result.extend(f"Lỗi formset: {error}" for error in service_form.non_form_errors())
+    return result
+
+
+def _service_entries(service_form, file_key, request):
+    """(dịch vụ chưa lưu, file đính kèm) của các form dịch vụ hợp lệ có nhập dữ liệu"""
+    if not hasattr(service_form, 'forms'):
+        if not any(service_form.cleaned_data.values()):
+            return []
+        return [(service_form.save(commit=False), request.FILES.getlist(file_key))]
+
+    # Ô file đặt tên theo vị trí form trong formset (trademark_files_0, _1...)
+    return [
+        (form.save(commit=False), request.FILES.getlist(file_key.format(idx)))
+        for idx, form in enumerate(service_form.forms)
+        if form.cleaned_data and not form.cleaned_data.get('DELETE', False)
+    ]
+
+
+def add_contract(request):
+    if request.method == 'POST':
+        contract_form = ContractForm(request.POST, request.FILES)
+        service_type = request.POST.get('service_type')
+        if service_type not in ADD_CONTRACT_SERVICES:
+            service_type = 'khac'
+        form_key, label, file_key, missing = ADD_CONTRACT_SERVICES[service_type]
+        service_forms = _add_contract_forms(request.POST, request.FILES, service_type)
+        service_form = service_forms[form_key]
+
+        # ===== 1. KIỂM TRA HỢP ĐỒNG + DỊCH VỤ + FILE TRƯỚC KHI GHI =====
+        errors = []
         if not contract_form.is_valid():
-            print("\n❌ Contract form invalid:")
-            print(contract_form.errors)
-            for field, errors in contract_form.errors.items():
-                for error in errors:
-                    field_label = contract_form.fields.get(field).label if field in contract_form.fields else field
-                    messages.error(request, f"{field_label}: {error}")
+            errors.extend(_form_error_messages(contract_form))
+
+        entries = []
+        if service_form.is_valid():
+            entries = _service_entries(service_form, file_key, request)
+            for idx, (_, files) in enumerate(entries):
+                errors.extend(validate_uploads(files, f"{label} #{idx + 1}" if len(entries) > 1 else label))
+        else:
+            errors.extend(_service_error_messages(service_form, label))
 
+        if errors:
+            for error in errors:
+                messages.error(request, error)
             return render(request, "add_contract.html", {
                 'contract_form': contract_form,
-                'trademark_formset': TrademarkFormSet(request.POST, request.FILES, prefix='trademark'),
-                'copyright_formset': CopyrightFormSet(request.POST, request.FILES, prefix='copyright'),
-                'business_form': BusinessRegistrationForm(request.POST, request.FILES),
-                'investment_form': InvestmentForm(request.POST, request.FILES),
-                'other_form': OtherServiceForm(request.POST, request.FILES),
+                **service_forms,
             })
 
-        print("✅ Contract form valid")
-
-        # ===== SAVE CONTRACT =====
+        # ===== 2. GHI TẤT CẢ TRONG 1 TRANSACTION =====
         contract = contract_form.save(commit=False)
         contract.status = 'completed' if contract.payment_type == 'full' else 'processing'
+        writer = DeferredFileWriter()
 
         try:
-            contract.save()
-            print(f"✅ Contract saved: {contract.contract_no}")
-            
-            # ===== HANDLE SERVICE BASED ON TYPE =====
-            service_type = contract.service_type
-            print(f"\n📦 Processing service type: {service_type}")
-
-            # ==================================================
-            #           🔥 NHÃN HIỆU (TRADEMARK)
-            # ==================================================
-            if service_type == 'nhanhieu':
-                print("\n🏷️ Processing TRADEMARK formset...")
-
-                trademark_formset = TrademarkFormSet(
-                    request.POST,
-                    request.FILES,
-                    prefix='trademark'
-                )
+            with transaction.atomic():
+                contract.save()
 
-                print(f"   Management form - TOTAL_FORMS: {request.POST.get('trademark-TOTAL_FORMS')}")
-                print(f"   Management form - INITIAL_FORMS: {request.POST.get('trademark-INITIAL_FORMS')}")
-
-                if not trademark_formset.is_valid():
-                    print("❌ Trademark formset invalid:")
-                    print(f"   Errors: {trademark_formset.errors}")
-                    print(f"   Non-form errors: {trademark_formset.non_form_errors()}")
-
-                    contract.delete()
-
-                    # Show formset errors properly
-                    for idx, form_errors in enumerate(trademark_formset.errors):
-                        if form_errors:
-                            for field, errors in form_errors.items():
-                                for error in errors:
-                                    messages.error(request, f"Nhãn hiệu #{idx + 1} - {field}: {error}")
-
-                    # Show non-form errors
-                    for error in trademark_formset.non_form_errors():
-                        messages.error(request, f"Lỗi formset: {error}")
-
-                    return render(request, "add_contract.html", {
-                        'contract_form': contract_form,
-                        'trademark_formset': trademark_formset,
-                        'copyright_formset': CopyrightFormSet(prefix='copyright',
-                                                            queryset=CopyrightService.objects.none()),
-                        'business_form': BusinessRegistrationForm(),
-                        'investment_form': InvestmentForm(),
-                        'other_form': OtherServiceForm(),
-                    })
-
-                print("✅ Trademark formset valid")
-
-                # Count valid forms BEFORE saving
-                valid_forms = [
-                    form for form in trademark_formset
-                    if form.cleaned_data and not form.cleaned_data.get('DELETE', False)
-                ]
-
-                # 🔥 CHO PHÉP LƯU KHÔNG CẦN DỊCH VỤ
-                if len(valid_forms) == 0:
-                    print("⚠️ No trademark data provided, but contract saved")
-                    messages.warning(request, "⚠️ Hợp đồng đã lưu nhưng chưa có thông tin nhãn hiệu")
-                else:
-                    # Save valid forms
-                    saved_count = 0
-                    for idx, form in enumerate(valid_forms):
-                        # 🔥 LƯU TRADEMARK TRƯỚC
-                        instance = form.save(commit=False)
-                        instance.contract = contract
-                        instance.save()
-                        saved_count += 1
-
-                        # 🔥 SAU ĐÓ MỚI XỬ LÝ FILE (instance đã tồn tại)
-                        files = request.FILES.getlist(f'trademark_files_{idx}')
-                        print(f"   📎 Found {len(files)} files for trademark #{idx}")
-
-                        for f in files:
-                            Certificate.objects.create(
-                                content_object=instance,
-                                file=f,
-                                name=f.name,
-                            )
-                            print(f"      ✅ Saved file: {f.name}")
-
-                    print(f"✅ Saved {saved_count} trademarks")
-
-            # ==================================================
-            # 🔥 BẢN QUYỀN (COPYRIGHT)
-            # ==================================================
-            elif service_type == 'banquyen':
-                print("\n©️ Processing COPYRIGHT formset...")
-
-                copyright_formset = CopyrightFormSet(
-                    request.POST,
-                    request.FILES,
-                    prefix='copyright'
-                )
+                certificates = []
+                for service, files in entries:
+                    service.contract = contract
+                    writer.hold(service)
+                    service.save()
+                    certificates.extend(build_certificates(service, files, writer))
+                Certificate.objects.bulk_create(certificates)
 
-                print(f"   Management form - TOTAL_FORMS: {request.POST.get('copyright-TOTAL_FORMS')}")
-                print(f"   Management form - INITIAL_FORMS: {request.POST.get('copyright-INITIAL_FORMS')}")
-
-                if not copyright_formset.is_valid():
-                    print("❌ Copyright formset invalid:")
-                    print(f"   Errors: {copyright_formset.errors}")
-                    print(f"   Non-form errors: {copyright_formset.non_form_errors()}")
-
-                    contract.delete()
-
-                    for idx, form_errors in enumerate(copyright_formset.errors):
-                        if form_errors:
-                            for field, errors in form_errors.items():
-                                for error in errors:
-                                    messages.error(request, f"Bản quyền #{idx + 1} - {field}: {error}")
-
-                    for error in copyright_formset.non_form_errors():
-                        messages.error(request, f"Lỗi formset: {error}")
-
-                    return render(request, "add_contract.html", {
-                        'contract_form': contract_form,
-                        'trademark_formset': TrademarkFormSet(prefix='trademark',
-                                                            queryset=TrademarkService.objects.none()),
-                        'copyright_formset': copyright_formset,
-                        'business_form': BusinessRegistrationForm(),
-                        'investment_form': InvestmentForm(),
-                        'other_form': OtherServiceForm(),
-                    })
-
-                print("✅ Copyright formset valid")
-
-                # Count valid forms BEFORE saving
-                valid_forms = [
-                    form for form in copyright_formset
-                    if form.cleaned_data and not form.cleaned_data.get('DELETE', False)
-                ]
-
-                # 🔥 CHO PHÉP LƯU KHÔNG CẦN DỊCH VỤ
-                if len(valid_forms) == 0:
-                    print("⚠️ No copyright data provided, but contract saved")
-                    messages.warning(request, "⚠️ Hợp đồng đã lưu nhưng chưa có thông tin bản quyền")
-                else:
-                    # Save valid forms
-                    saved_count = 0
-                    for idx, form in enumerate(valid_forms):
-                        # 🔥 LƯU COPYRIGHT TRƯỚC
-                        instance = form.save(commit=False)
-                        instance.contract = contract
-                        instance.save()
-                        saved_count += 1
-
-                        # 🔥 SAU ĐÓ MỚI XỬ LÝ FILE
-                        files = request.FILES.getlist(f'copyright_files_{idx}')
-                        print(f"   📎 Found {len(files)} files for copyright #{idx}")
-
-                        for f in files:
-                            Certificate.objects.create(
-                                content_object=instance,
-                                file=f,
-                                name=f.name,
-                            )
-                            print(f"      ✅ Saved file: {f.name}")
-
-                    print(f"✅ Saved {saved_count} copyrights")
-            # ==================================================
-            # OTHER SERVICES (DKKD, DAUTU, KHAC)
-            # ==================================================
-            elif service_type == 'dkkd':
-                form = BusinessRegistrationForm(request.POST, request.FILES)
-                if not form.is_valid():
-                    contract.delete()
-                    for field, errors in form.errors.items():
-                        for error in errors:
-                            field_label = form.fields.get(field).label if field in form.fields else field
-                            messages.error(request, f"ĐKKD - {field_label}: {error}")
-
-                    return render(request, "add_contract.html", {
-                        'contract_form': contract_form,
-                        'trademark_formset': TrademarkFormSet(prefix='trademark',
-                                                            queryset=TrademarkService.objects.none()),
-                        'copyright_formset': CopyrightFormSet(prefix='copyright',
-                                                            queryset=CopyrightService.objects.none()),
-                        'business_form': form,
-                        'investment_form': InvestmentForm(),
-                        'other_form': OtherServiceForm(),
-                    })
-
-                # 🔥 CHỈ LƯU NẾU CÓ DỮ LIỆU
-                if any(form.cleaned_data.values()):
-                    # 🔥 LƯU BUSINESS TRƯỚC
-                    obj = form.save(commit=False)
-                    obj.contract = contract
-                    obj.save()
-                    
-                    # 🔥 SAU ĐÓ MỚI XỬ LÝ FILE
-                    files = request.FILES.getlist('business_files')
-                    print(f"   📎 Found {len(files)} files for business")
-                    
-                    for f in files:
-                        Certificate.objects.create(
-                            content_object=obj,
-                            file=f,
-                            name=f.name,
-                        )
-                        print(f"      ✅ Saved file: {f.name}")
-                    
-                    print("✅ Saved business registration")
-                else:
-                    print("⚠️ No business data provided")
-                    messages.warning(request, "⚠️ Hợp đồng đã lưu nhưng chưa có thông tin ĐKKD")
-
-            elif service_type == 'dautu':
-                form = InvestmentForm(request.POST, request.FILES)
-                if not form.is_valid():
-                    contract.delete()
-                    for field, errors in form.errors.items():
-                        for error in errors:
-                            field_label = form.fields.get(field).label if field in form.fields else field
-                            messages.error(request, f"Đầu tư - {field_label}: {error}")
-
-                    return render(request, "add_contract.html", {
-                        'contract_form': contract_form,
-                        'trademark_formset': TrademarkFormSet(prefix='trademark',
-                                                            queryset=TrademarkService.objects.none()),
-                        'copyright_formset': CopyrightFormSet(prefix='copyright',
-                                                            queryset=CopyrightService.objects.none()),
-                        'business_form': BusinessRegistrationForm(),
-                        'investment_form': form,
-                        'other_form': OtherServiceForm(),
-                    })
-
-                # 🔥 CHỈ LƯU NẾU CÓ DỮ LIỆU
-                if any(form.cleaned_data.values()):
-                    # 🔥 LƯU INVESTMENT TRƯỚC
-                    obj = form.save(commit=False)
-                    obj.contract = contract
-                    obj.save()
-                    
-                    # 🔥 SAU ĐÓ MỚI XỬ LÝ FILE
-                    files = request.FILES.getlist('investment_files')
-                    print(f"   📎 Found {len(files)} files for investment")
-                    
-                    for f in files:
-                        Certificate.objects.create(
-                            content_object=obj,
-                            file=f,
-                            name=f.name,
-                        )
-                        print(f"      ✅ Saved file: {f.name}")
-
-                    print("✅ Saved investment")
-                else:
-                    print("⚠️ No investment data provided")
-                    messages.warning(request, "⚠️ Hợp đồng đã lưu nhưng chưa có thông tin đầu tư")
-
-            else:  # khac
-                form = OtherServiceForm(request.POST, request.FILES)
-                if not form.is_valid():
-                    contract.delete()
-                    for field, errors in form.errors.items():
-                        for error in errors:
-                            field_label = form.fields.get(field).label if field in form.fields else field
-                            messages.error(request, f"Dịch vụ khác - {field_label}: {error}")
-
-                    return render(request, "add_contract.html", {
-                        'contract_form': contract_form,
-                        'trademark_formset': TrademarkFormSet(prefix='trademark',
-                                                            queryset=TrademarkService.objects.none()),
-                        'copyright_formset': CopyrightFormSet(prefix='copyright',
-                                                            queryset=CopyrightService.objects.none()),
-                        'business_form': BusinessRegistrationForm(),
-                        'investment_form': InvestmentForm(),
-                        'other_form': form,
-                    })
-
-                # 🔥 CHỈ LƯU NẾU CÓ DỮ LIỆU
-                if any(form.cleaned_data.values()):
-                    # 🔥 LƯU OTHER SERVICE TRƯỚC
-                    obj = form.save(commit=False)
-                    obj.contract = contract
-                    obj.save()
-                    
-                    # 🔥 SAU ĐÓ MỚI XỬ LÝ FILE
-                    files = request.FILES.getlist('other_files')
-                    print(f"   📎 Found {len(files)} files for other service")
-                    
-                    for f in files:
-                        Certificate.objects.create(
-                            content_object=obj,
-                            file=f,
-                            name=f.name,
-                        )
-                        print(f"      ✅ Saved file: {f.name}")
-                    
-                    print("✅ Saved other service")
-                else:
-                    print("⚠️ No service data provided")
-                    messages.warning(request, "⚠️ Hợp đồng đã lưu nhưng chưa có thông tin dịch vụ")
-
-            # Thay thế phần xử lý PREPAID PAYMENT trong add_contract view
-
-            # ===== HANDLE PREPAID PAYMENT =====
-            if contract.payment_type == 'installment':
                 # 🆕 TỰ ĐỘNG TẠO CÁC ĐỢT THANH TOÁN
-                contract.create_installments()
-                print(f"✅ Created {contract.number_of_installments} installments")
-            else:
-                # Trả dứt điểm - tự động hoàn thành
-                contract.status = 'completed'
-                contract.save(update_fields=['status'])
-
-            # ===== UPDATE CUSTOMER STATUS =====
-            customer = contract.customer
-            customer.status = 'pending'
-            customer.save()
-            print(f"✅ Updated customer status: {customer.customer_code}")
+                # (trạng thái khách tự tính lại khi lưu hợp đồng - signal)
+                if contract.payment_type == 'installment':
+                    contract.create_installments()
 
-            print("\n" + "=" * 60)
-            print("✅ CONTRACT CREATED SUCCESSFULLY!")
-            print("=" * 60 + "\n")
-
-            messages.success(request, "✅ Tạo hợp đồng thành công!")
-            return redirect('contract_detail', id=contract.id)
+                # File chỉ ghi xuống đĩa khi transaction commit
+                writer.commit()
 
         except Exception as e:
             import traceback
-            print("\n" + "=" * 60)
-            print("❌ ERROR OCCURRED")
-            print("=" * 60)
-            print(f"Error: {str(e)}")
             print(traceback.format_exc())
-            print("=" * 60 + "\n")
-
-            # Rollback
-            if contract.id:
-                contract.delete()
-
             messages.error(request, f"❌ Có lỗi xảy ra: {str(e)}")
-            return redirect('add_contract')
+            return render(request, "add_contract.html", {
+                'contract_form': contract_form,
+                **service_forms,
+            })
+
+        if not entries:
+            messages.warning(request, f"⚠️ Hợp đồng đã lưu nhưng chưa có thông tin {missing}")
+        messages.success(request, "✅ Tạo hợp đồng thành công!")
+        return redirect('contract_detail', id=contract.id)
 
     # ===== GET REQUEST =====
-    print("\n📄 GET REQUEST - Rendering empty form")
     return render(request, "add_contract.html", {
         'contract_form': ContractForm(),
-        'trademark_formset': TrademarkFormSet(prefix='trademark', queryset=TrademarkService.objects.none()),
-        'copyright_formset': CopyrightFormSet(prefix='copyright', queryset=CopyrightService.objects.none()),
-        'business_form': BusinessRegistrationForm(),
-        'investment_form': InvestmentForm(),
-        'other_form': OtherServiceForm(),
+        **_add_contract_forms(),
     })
 
 
@@ -452,7 +220,7 @@ def contract_delete(request, pk):
 # ===============================================
 def customer_detail(request, id):
     customer = get_object_or_404(Customer, id=id)
-    contracts = customer.contracts.all()
+    contracts = customer.contracts.with_payment_stats().order_by('-created_at')
 
     return render(request, 'customer_detail.html', {
         'customer': customer,
@@ -536,38 +304,50 @@ def customer_delete(request, id):
 # CONTRACT LIST
 # ===============================================
 def contract_list(request):
-    contracts = Contract.objects.select_related("customer").order_by("-created_at")
-    return render(request, "contract_list.html", {"contracts": contracts})
+    filter_form = ContractFilterForm(request.GET or None)
+
+    # 🔥 Chỉ lấy đúng các cột template dùng
+    contracts = Contract.objects.select_related("customer").only(
+        "id", "contract_no", "service_type", "status", "created_at",
+        "contract_value", "paid_total",
+        "customer__id", "customer__name",
+    ).with_payment_stats()
+    contracts = filter_form.filter(contracts)
+
+    # Phân trang theo (created_at, id) -> thứ tự ổn định giữa các trang
+    paginator = KeysetPaginator(
+        contracts,
+        page_size=request.GET.get("page_size"),
+        default_page_size=settings.CONTRACT_PAGE_SIZE,
+        max_page_size=settings.CONTRACT_MAX_PAGE_SIZE,
+    )
+    page = paginator.page(request.GET.get("cursor"))
+
+    # Giữ bộ lọc khi chuyển trang
+    params = request.GET.copy()
+    params.pop("cursor", None)
+
+    return render(request, "contract_list.html", {
+        "contracts": page,
+        "page": page,
+        "filter_form": filter_form,
+        "filter_query": params.urlencode(),
+    })
 
 
 # ===============================================
 # CONTRACT DETAIL
 # ===============================================
-from datetime import date
+from datetime import date, timedelta
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.db.models import QuerySet
+from django.core.exceptions import ValidationError
+from .payments import PaymentService
 
 
 def contract_detail(request, id):
-    contract = get_object_or_404(Contract, id=id)
-    installments = contract.installments.all()
-
-    # ✅ ĐếM SỐ ĐỢT ĐÃ TRẢ
-    paid_count = installments.filter(is_paid=True).count()
-
-    # Lấy dịch vụ
-    service = None
-    if contract.service_type == "nhanhieu":
-        service = contract.trademarks.all()
-    elif contract.service_type == "banquyen":
-        service = contract.copyrights.all()
-    elif contract.service_type == "dkkd":
-        service = BusinessRegistrationService.objects.filter(contract=contract)
-    elif contract.service_type == "dautu":
-        service = InvestmentService.objects.filter(contract=contract)
-    else:
-        service = OtherService.objects.filter(contract=contract)
+    contract = get_object_or_404(Contract.objects.select_related("customer"), id=id)
 
     # Auto hoàn thành nếu trả dứt
     if contract.payment_type == "full" and contract.status != "completed":
@@ -590,92 +370,43 @@ def contract_detail(request, id):
                 messages.success(request, f"✅ Đã đánh dấu xuất hóa đơn")
             return redirect("contract_detail", id=contract.id)
 
-        # 2️⃣ THANH TOÁN ĐỢT (CHỈ CẦN 1 CLICK)
-        elif action == "pay_installment":
+        # 2️⃣ THANH TOÁN ĐỢT (CHỈ CẦN 1 CLICK) / 3️⃣ THANH TOÁN TỪNG PHẦN
+        elif action in ("pay_installment", "partial_payment"):
             installment_id = request.POST.get("installment_id")
 
-            try:
-                ins = contract.installments.get(id=installment_id)
-
-                if ins.is_paid:
-                    messages.warning(request, "⚠️ Đợt này đã được thanh toán rồi")
-                    return redirect("contract_detail", id=contract.id)
+            # Khóa chống ghi trùng: token của lần render trang + đợt + thao tác
+            token = request.POST.get("payment_token")
+            idempotency_key = f"{token}:{action}:{installment_id}" if token else None
 
-                # Tính số tiền còn phải trả
-                remaining = ins.amount - ins.paid_amount
-
-                # Cập nhật thanh toán
-                ins.paid_amount = ins.amount
-                ins.is_paid = True
-                ins.paid_date = timezone.now().date()
-                ins.save()
-
-                # Ghi log
-                PaymentLog.objects.create(
-                    contract=contract,
-                    installment=ins,
-                    amount_paid=remaining,
-                    paid_at=timezone.now()
+            try:
+                amount = None
+                if action == "partial_payment":
+                    paid_amount_raw = request.POST.get("paid_amount")
+                    if not paid_amount_raw:
+                        messages.error(request, "❌ Vui lòng nhập số tiền thanh toán")
+                        return redirect("contract_detail", id=contract.id)
+                    amount = PaymentService.parse_amount(paid_amount_raw)
+
+                result = PaymentService(contract).record(
+                    installment_id,
+                    amount=amount,
+                    idempotency_key=idempotency_key,
                 )
-
-                # Cập nhật status contract nếu đã trả hết
-                if contract.remaining_amount <= 0:
-                    contract.status = "completed"
-                    contract.save(update_fields=["status"])
-
-                messages.success(request, f"✅ Đã thanh toán đợt {ins.notes} - Số tiền: {remaining:,.0f} VNĐ")
-                return redirect("contract_detail", id=contract.id)
-
-            except PaymentInstallment.DoesNotExist:
-                messages.error(request, "❌ Không tìm thấy đợt thanh toán")
-                return redirect("contract_detail", id=contract.id)
-            except Exception as e:
-                messages.error(request, f"❌ Có lỗi xảy ra: {str(e)}")
-                return redirect("contract_detail", id=contract.id)
-
-        # 3️⃣ THANH TOÁN TỪNG PHẦN (NẾU CẦN)
-        elif action == "partial_payment":
-            installment_id = request.POST.get("installment_id")
-            paid_amount_raw = request.POST.get("paid_amount")
-
-            if not paid_amount_raw:
-                messages.error(request, "❌ Vui lòng nhập số tiền thanh toán")
+            except ValidationError as e:
+                messages.error(request, f"❌ {' '.join(e.messages)}")
                 return redirect("contract_detail", id=contract.id)
 
-            try:
-                paid_amount = Decimal(paid_amount_raw)
-                ins = contract.installments.get(id=installment_id)
-
-                # Cập nhật số tiền
-                ins.paid_amount += paid_amount
-
-                # Kiểm tra xem đã đủ chưa
-                if ins.paid_amount >= ins.amount:
-                    ins.is_paid = True
-                    ins.paid_date = timezone.now().date()
-
-                ins.save()
-
-                # Ghi log
-                PaymentLog.objects.create(
-                    contract=contract,
-                    installment=ins,
-                    amount_paid=paid_amount,
-                    paid_at=timezone.now()
+            if not result.created:
+                messages.info(request, "ℹ️ Khoản thanh toán này đã được ghi nhận trước đó")
+            elif action == "pay_installment":
+                messages.success(
+                    request,
+                    f"✅ Đã thanh toán đợt {result.log.installment.notes} - Số tiền: {result.log.amount_paid:,.0f} VNĐ"
                 )
+            else:
+                messages.success(request, f"✅ Đã ghi nhận thanh toán: {result.log.amount_paid:,.0f} VNĐ")
+            return redirect("contract_detail", id=contract.id)
 
-                # Cập nhật status
-                if contract.remaining_amount <= 0:
-                    contract.status = "completed"
-                    contract.save(update_fields=["status"])
-
-                messages.success(request, f"✅ Đã ghi nhận thanh toán: {paid_amount:,.0f} VNĐ")
-                return redirect("contract_detail", id=contract.id)
-
-            except Exception as e:
-                messages.error(request, f"❌ Có lỗi xảy ra: {str(e)}")
-                return redirect("contract_detail", id=contract.id)
-        
         # 4️⃣ XUẤT HÓA ĐƠN
         if action == 'export_bill':
             installment_id = request.POST.get('installment_id')
@@ -705,11 +436,19 @@ def contract_detail(request, id):
             
             return redirect('contract_detail', id=id)
 
+    # 🔥 Nạp sẵn dịch vụ + tài liệu, các đợt, lịch sử thanh toán (số truy vấn cố định)
+    service = contract.load_detail()
+    installments = contract.installments.all()
+
+    # ✅ ĐẾM SỐ ĐỢT ĐÃ TRẢ (trên dữ liệu đã nạp)
+    paid_count = sum(1 for ins in installments if ins.is_paid)
+
     return render(request, "contract_detail.html", {
         "contract": contract,
         "service": service,
         "installments": installments,
         "paid_count": paid_count,
+        "payment_token": uuid.uuid4().hex,
     })
 
 
@@ -779,6 +518,31 @@ def edit_installment_amounts(request, contract_id):
 # ===============================================
 # CONTRACT EDIT (ĐÃ SỬA - CẬP NHẬT TRẠNG THÁI)
 # ===============================================
+# Hợp đồng trả góp: vẫn cho sửa số đợt / khoảng cách đợt -> dựng lại lịch thanh toán
+INSTALLMENT_SCHEDULE_FIELDS = ('number_of_installments', 'installment_interval_days')
+
+
+def _editable_contract_fields(contract):
+    return INSTALLMENT_SCHEDULE_FIELDS if contract.payment_type == 'installment' else ()
+
+
+def _save_contract_form(request, contract_form):
+    """
+    Lưu hợp đồng; đổi số đợt / khoảng cách đợt thì dựng lại lịch
+    (giữ đợt đã trả / đã xuất hóa đơn) và báo kết quả cho người dùng.
+    Gọi trong transaction: lịch không dựng được -> ValidationError, không ghi gì.
+    """
+    contract = contract_form.save()
+    if not set(_editable_contract_fields(contract)) & set(contract_form.changed_data):
+        return
+    summary = contract.create_installments(regenerate=True)
+    messages.info(
+        request,
+        f"🔁 Lịch thanh toán: thêm {summary['created']} đợt, sửa {summary['updated']} đợt, "
+        f"xóa {summary['deleted']} đợt, giữ nguyên {summary['kept']} đợt đã thanh toán / xuất hóa đơn"
+    )
+
+
 @login_required
 def contract_edit(request, id):
     # ==========================
@@ -827,7 +591,7 @@ def contract_edit(request, id):
     if request.method == "POST":
         # 🔒 KHÓA TRƯỜNG HỢP ĐỒNG
         contract_form = ContractForm(request.POST, instance=contract)
-        lock_contract_fields(contract_form)
+        lock_contract_fields(contract_form, _editable_contract_fields(contract))
 
         # ===== 3.1 FORMSET (NHÃN HIỆU / BẢN QUYỀN) =====
         if FormSetClass:
@@ -839,21 +603,25 @@ def contract_edit(request, id):
             )
 
             if contract_form.is_valid() and service_formset.is_valid():
-                # Lưu hợp đồng (chỉ những field cho phép)
-                contract_form.save()
-
-                # Lưu / update service
-                instances = service_formset.save(commit=False)
-                for obj in instances:
-                    obj.contract = contract
-                    obj.save()
-
-                # Xóa service bị đánh dấu DELETE
-                for obj in service_formset.deleted_objects:
-                    obj.delete()
-
-                messages.success(request, "✅ Cập nhật hợp đồng thành công!")
-                return redirect("contract_detail", id=contract.id)
+                try:
+                    with transaction.atomic():
+                        # Lưu hợp đồng (chỉ những field cho phép)
+                        _save_contract_form(request, contract_form)
+
+                        # Lưu / update service
+                        instances = service_formset.save(commit=False)
+                        for obj in instances:
+                            obj.contract = contract
+                            obj.save()
+
+                        # Xóa service bị đánh dấu DELETE
+                        for obj in service_formset.deleted_objects:
+                            obj.delete()
+                except ValidationError as e:
+                    contract_form.add_error(None, e)
+                else:
+                    messages.success(request, "✅ Cập nhật hợp đồng thành công!")
+                    return redirect("contract_detail", id=contract.id)
 
         # ===== 3.2 SERVICE ĐƠN (DKKD / ĐẦU TƯ / KHÁC) =====
         else:
@@ -864,21 +632,25 @@ def contract_edit(request, id):
             )
 
             if contract_form.is_valid() and service_form.is_valid():
-                contract_form.save()
-
-                obj = service_form.save(commit=False)
-                obj.contract = contract   # 🔥 đảm bảo gắn contract
-                obj.save()
-
-                messages.success(request, "✅ Cập nhật hợp đồng thành công!")
-                return redirect("contract_detail", id=contract.id)
+                try:
+                    with transaction.atomic():
+                        _save_contract_form(request, contract_form)
+
+                        obj = service_form.save(commit=False)
+                        obj.contract = contract   # 🔥 đảm bảo gắn contract
+                        obj.save()
+                except ValidationError as e:
+                    contract_form.add_error(None, e)
+                else:
+                    messages.success(request, "✅ Cập nhật hợp đồng thành công!")
+                    return redirect("contract_detail", id=contract.id)
 
     # ==========================
     # 4. GET – HIỂN THỊ FORM
     # ==========================
     else:
         contract_form = ContractForm(instance=contract)
-        lock_contract_fields(contract_form)
+        lock_contract_fields(contract_form, _editable_contract_fields(contract))
 
         if FormSetClass:
             service_formset = FormSetClass(
@@ -975,15 +747,14 @@ def add_customer(request):
 
 from django.http import JsonResponse
 from django.db.models import Q
-
-from django.http import JsonResponse
-from django.db.models import Q
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 
 def search_customer(request):
     """
     API tìm kiếm khách hàng theo mã hoặc tên
     URL: /api/search-customer/?q=ma123
+    Trả lời từ chỉ mục tiền tố trong RAM, không chạm CSDL.
     """
     query = request.GET.get('q', '').strip()
 
@@ -992,24 +763,24 @@ def search_customer(request):
         return JsonResponse([], safe=False)
 
     try:
-        # Tìm kiếm theo customer_code hoặc name
-        customers = Customer.objects.filter(
-            Q(customer_code__icontains=query) |
-            Q(name__icontains=query)
-        )[:10]
-
-        # Tạo danh sách kết quả
-        results = []
-        for c in customers:
-            results.append({
-                'id': c.id,
-                'code': c.customer_code,
-                'name': c.name,
-                'phone': str(c.phone) if c.phone else '',
-                'email': c.email if c.email else ''
-            })
-
-        return JsonResponse(results, safe=False)
+        customer_index.ensure_built()
+        etag = customer_index.etag(query)
+
+        # Trình duyệt gửi lại ETag cũ -> 304, không cần tính lại
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        results = customer_index.search(query, limit=10)
+
+        response = JsonResponse(results, safe=False)
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            private=True,
+            max_age=settings.CUSTOMER_AUTOCOMPLETE_MAX_AGE,
+        )
+        return response
 
     except Exception as e:
         import traceback
@@ -1066,37 +837,22 @@ protect_views(
 # ===============================================
 # CONTRACT SEARCH (NHÃN HIỆU)
 # ===============================================
-from django.shortcuts import render, redirect
-from django.db.models import Q
-from .models import Contract, TrademarkService
+# 🔥 Mọi trang tìm kiếm đều đi qua registry_search: 1 truy vấn xếp hạng
+#    trên chỉ mục chung, view chỉ chọn loại kết quả cần hiển thị.
+from .registry_search import registry_search, identifier_matches, lookup_identifier
 
 
 def contract_search(request):
     q = request.GET.get('q', '').strip()
 
     # Mặc định lấy tất cả hợp đồng nhãn hiệu
-    contracts = Contract.objects.filter(service_type='nhanhieu').order_by('-created_at')
-    trademarks = []  # 🔥 THÊM BIẾN ĐỂ LƯU DANH SÁCH NHÃN HIỆU
+    contracts = Contract.objects.filter(service_type='nhanhieu').with_payment_stats().order_by('-created_at')
+    trademarks = []
 
     if q:
-        # 🔥 TÌM TẤT CẢ NHÃN HIỆU CÓ CHỨA SỐ ĐƠN
-        trademarks = TrademarkService.objects.filter(
-            app_no__icontains=q
-        ).select_related('contract', 'contract__customer')
-
-        # Nếu tìm thấy nhãn hiệu, lọc các hợp đồng liên quan
-        if trademarks.exists():
-            contract_ids = trademarks.values_list('contract_id', flat=True)
-            contracts = Contract.objects.filter(
-                id__in=contract_ids
-            ).order_by('-created_at')
-        else:
-            # Nếu không tìm thấy theo số đơn, tìm theo thông tin hợp đồng
-            contracts = contracts.filter(
-                Q(contract_no__icontains=q) |
-                Q(customer__customer_code__icontains=q) |
-                Q(customer__name__icontains=q)
-            ).distinct()
+        # Nhãn hiệu khớp theo số đơn hiển thị riêng, còn lại là hợp đồng
+        trademarks = identifier_matches('trademark', q)
+        contracts = registry_search(q, service_type='nhanhieu').contracts()
 
     context = {
         'contracts': contracts,
@@ -1112,28 +868,12 @@ def contract_copyright_search(request):
     q = request.GET.get('q', '').strip()
 
     # Mặc định lấy tất cả hợp đồng bản quyền
-    contracts = Contract.objects.filter(service_type='banquyen').order_by('-created_at')
-    copyrights = []  # 🔥 THÊM BIẾN ĐỂ LƯU DANH SÁCH BẢN QUYỀN
+    contracts = Contract.objects.filter(service_type='banquyen').with_payment_stats().order_by('-created_at')
+    copyrights = []
 
     if q:
-        # 🔥 TÌM TẤT CẢ BẢN QUYỀN CÓ CHỨA SỐ GIẤY CHỨNG NHẬN
-        copyrights = CopyrightService.objects.filter(
-            certificate_no__icontains=q
-        ).select_related('contract', 'contract__customer')
-
-        # Nếu tìm thấy bản quyền, lọc các hợp đồng liên quan
-        if copyrights.exists():
-            contract_ids = copyrights.values_list('contract_id', flat=True)
-            contracts = Contract.objects.filter(
-                id__in=contract_ids
-            ).order_by('-created_at')
-        else:
-            # Nếu không tìm thấy theo số chứng nhận, tìm theo thông tin hợp đồng
-            contracts = contracts.filter(
-                Q(contract_no__icontains=q) |
-                Q(customer__customer_code__icontains=q) |
-                Q(customer__name__icontains=q)
-            ).distinct()
+        copyrights = identifier_matches('copyright', q)
+        contracts = registry_search(q, service_type='banquyen').contracts()
 
     return render(request, 'contract_copyright_search.html', {
         'contracts': contracts,
@@ -1146,24 +886,15 @@ def contract_copyright_search(request):
 
 def contract_business_search(request):
     q = request.GET.get('q', '').strip()
-    contracts = Contract.objects.filter(service_type='dkkd')
+    contracts = Contract.objects.filter(service_type='dkkd').with_payment_stats().order_by('-created_at')
 
     if q:
-        # Kiểm tra xem có phải mã số thuế không
-        business = BusinessRegistrationService.objects.filter(tax_code__icontains=q).first()
-
+        # Khớp mã số thuế -> chuyển đến trang chi tiết
+        business = lookup_identifier('business', q)
         if business:
-            # Nếu tìm thấy, chuyển đến trang chi tiết
             return redirect('business_detail', business_id=business.id)
 
-        # Nếu không phải mã số thuế, tìm kiếm hợp đồng bình thường
-        contracts = contracts.filter(
-            Q(contract_no__icontains=q) |
-            Q(customer__customer_code__icontains=q) |
-            Q(customer__name__icontains=q)
-        )
-
-    contracts = contracts.order_by('-created_at')
+        contracts = registry_search(q, service_type='dkkd').contracts()
 
     return render(request, 'contract_business_search.html', {
         'contracts': contracts,
@@ -1174,24 +905,15 @@ def contract_business_search(request):
 # ===============================================
 def contract_investment_search(request):
     q = request.GET.get('q', '').strip()
-    contracts = Contract.objects.filter(service_type='dautu')
+    contracts = Contract.objects.filter(service_type='dautu').with_payment_stats().order_by('-created_at')
 
     if q:
-        # Kiểm tra xem có phải mã dự án không
-        investment = InvestmentService.objects.filter(project_code__icontains=q).first()
-
+        # Khớp mã dự án -> chuyển đến trang chi tiết
+        investment = lookup_identifier('investment', q)
         if investment:
-            # Nếu tìm thấy, chuyển đến trang chi tiết
             return redirect('investment_detail', investment_id=investment.id)
 
-        # Nếu không phải mã dự án, tìm kiếm hợp đồng bình thường
-        contracts = contracts.filter(
-            Q(contract_no__icontains=q) |
-            Q(customer__customer_code__icontains=q) |
-            Q(customer__name__icontains=q)
-        )
-
-    contracts = contracts.order_by('-created_at')
+        contracts = registry_search(q, service_type='dautu').contracts()
 
     return render(request, 'contract_investment_search.html', {
         'contracts': contracts,
@@ -1206,16 +928,10 @@ def contract_other_service_search(request):
 
     contracts = Contract.objects.filter(
         service_type='khac'   # ✅ DỊCH VỤ KHÁC
-    )
+    ).with_payment_stats().order_by('-created_at')
 
     if q:
-        contracts = contracts.filter(
-            Q(contract_no__icontains=q) |
-            Q(customer__customer_code__icontains=q) |
-            Q(customer__name__icontains=q)
-        )
-
-    contracts = contracts.order_by('-created_at')
+        contracts = registry_search(q, service_type='khac').contracts()
 
     return render(request, 'contract_other_service_search.html', {
         'contracts': contracts,
@@ -1223,25 +939,25 @@ def contract_other_service_search(request):
     })
 
 
-
-
-
-
-def trademark_search(request):
+def _registry_lookup(request, kind, template, detail_url, detail_kwarg):
+    """Tìm theo số định danh; có kết quả thì chuyển thẳng đến trang chi tiết"""
     q = request.GET.get('q', '').strip()
 
     if q:
-        trademark = TrademarkService.objects.filter(app_no__icontains=q).first()
+        found = lookup_identifier(kind, q)
 
-        if trademark:
-            return redirect('trademark_detail', trademark_id=trademark.id)
-        else:
-            return render(request, 'trademark_search.html', {
-                'q': q,
-                'not_found': True
-            })
+        if found:
+            return redirect(detail_url, **{detail_kwarg: found.id})
+        return render(request, template, {
+            'q': q,
+            'not_found': True
+        })
 
-    return render(request, 'trademark_search.html', {'q': q})
+    return render(request, template, {'q': q})
+
+
+def trademark_search(request):
+    return _registry_lookup(request, 'trademark', 'trademark_search.html', 'trademark_detail', 'trademark_id')
 
 
 def trademark_detail(request, trademark_id):
@@ -1261,23 +977,7 @@ def trademark_detail(request, trademark_id):
 # COPYRIGHT SEARCH & DETAIL
 # ===============================================
 def copyright_search(request):
-    q = request.GET.get('q', '').strip()
-
-    if q:
-        # Tìm bản quyền theo số giấy chứng nhận
-        copyright = CopyrightService.objects.filter(certificate_no__icontains=q).first()
-
-        if copyright:
-            # Nếu tìm thấy, chuyển đến trang chi tiết
-            return redirect('copyright_detail', copyright_id=copyright.id)
-        else:
-            # Nếu không tìm thấy, hiển thị thông báo
-            return render(request, 'copyright_search.html', {
-                'q': q,
-                'not_found': True
-            })
-
-    return render(request, 'copyright_search.html', {'q': q})
+    return _registry_lookup(request, 'copyright', 'copyright_search.html', 'copyright_detail', 'copyright_id')
 
 
 def copyright_detail(request, copyright_id):
@@ -1295,23 +995,7 @@ def copyright_detail(request, copyright_id):
 # BUSINESS REGISTRATION SEARCH & DETAIL
 # ===============================================
 def business_search(request):
-    q = request.GET.get('q', '').strip()
-
-    if q:
-        # Tìm đăng ký kinh doanh theo mã số thuế
-        business = BusinessRegistrationService.objects.filter(tax_code__icontains=q).first()
-
-        if business:
-            # Nếu tìm thấy, chuyển đến trang chi tiết
-            return redirect('business_detail', business_id=business.id)
-        else:
-            # Nếu không tìm thấy, hiển thị thông báo
-            return render(request, 'business_search.html', {
-                'q': q,
-                'not_found': True
-            })
-
-    return render(request, 'business_search.html', {'q': q})
+    return _registry_lookup(request, 'business', 'business_search.html', 'business_detail', 'business_id')
 
 
 def business_detail(request, business_id):
@@ -1328,23 +1012,7 @@ def business_detail(request, business_id):
 # INVESTMENT SEARCH & DETAIL
 # ===============================================
 def investment_search(request):
-    q = request.GET.get('q', '').strip()
-
-    if q:
-        # Tìm dự án đầu tư theo mã dự án
-        investment = InvestmentService.objects.filter(project_code__icontains=q).first()
-
-        if investment:
-            # Nếu tìm thấy, chuyển đến trang chi tiết
-            return redirect('investment_detail', investment_id=investment.id)
-        else:
-            # Nếu không tìm thấy, hiển thị thông báo
-            return render(request, 'investment_search.html', {
-                'q': q,
-                'not_found': True
-            })
-
-    return render(request, 'investment_search.html', {'q': q})
+    return _registry_lookup(request, 'investment', 'investment_search.html', 'investment_detail', 'investment_id')
 
 
 def investment_detail(request, investment_id):
@@ -1403,3 +1071,208 @@ def upload_certificate(request):
 
         messages.success(request, 'Đã thêm tài liệu')
         return redirect(request.META.get('HTTP_REFERER'))
+
+
+# ===============================================
+# NHẬP SAO KÊ NGÂN HÀNG (ĐỐI SOÁT HÀNG LOẠT)
+# ===============================================
+from .bank_import import BankStatementImporter, read_statement
+
+# File lỗi cũ hơn số ngày này bị xóa khi có lần nhập mới
+IMPORT_REPORT_MAX_AGE_DAYS = 7
+
+
+def _store_import_report(request, session_key, content):
+    """Lưu CSV lỗi vào bảng ImportReportFile, session chỉ giữ id (thay cho file của lần trước)"""
+    cutoff = timezone.now() - timedelta(days=IMPORT_REPORT_MAX_AGE_DAYS)
+    stale = Q(created_at__lt=cutoff)
+    previous = request.session.get(session_key)
+    if previous:
+        stale |= Q(pk=previous)
+    ImportReportFile.objects.filter(stale).delete()
+    request.session[session_key] = ImportReportFile.objects.create(kind=session_key, content=content).pk
+
+
+def _import_report_response(request, session_key, filename):
+    report = ImportReportFile.objects.filter(pk=request.session.get(session_key) or 0, kind=session_key).first()
+    if report is None:
+        raise Http404
+    response = HttpResponse(report.content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def bank_statement_import(request):
+    report = None
+    form = BankStatementImportForm(request.POST or None, request.FILES or None)
+
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['statement']
+        try:
+            lines, invalid = read_statement(upload, upload.name)
+        except ValidationError as e:
+            form.add_error('statement', e)
+        else:
+            report = BankStatementImporter(dry_run=form.cleaned_data['dry_run']).run(lines, invalid)
+            if not report.dry_run and report.matched:
+                messages.success(
+                    request,
+                    f"✅ Đã ghi nhận {len(report.matched)} giao dịch - {report.matched_amount:,.0f} VNĐ"
+                )
+            # Báo cáo ngoại lệ lưu bảng, session chỉ giữ id để tải CSV
+            _store_import_report(request, 'bank_import_exceptions_id', report.exceptions_csv())
+
+    return render(request, 'bank_statement_import.html', {
+        'form': form,
+        'report': report,
+    })
+
+
+@login_required
+def bank_statement_exceptions(request):
+    return _import_report_response(request, 'bank_import_exceptions_id', 'sao_ke_khong_khop.csv')
+
+
+# ===============================================
+# BÁO CÁO TUỔI NỢ
+# ===============================================
+from .reports import aging_report, aging_export_rows, AGING_BUCKETS, AGING_EXPORT_HEADERS
+from .tabular import export_response, EXPORT_FORMATS
+
+
+@login_required
+def receivables_aging(request):
+    report = aging_report()
+
+    fmt = request.GET.get('format')
+    if fmt in EXPORT_FORMATS:
+        return export_response(
+            AGING_EXPORT_HEADERS,
+            aging_export_rows(report),
+            f"tuoi_no_{report['date']:%Y%m%d}",
+            fmt,
+        )
+
+    return render(request, 'receivables_aging.html', {
+        'report': report,
+        'buckets': AGING_BUCKETS,
+        # Trang chỉ hiện các khách nợ nhiều nhất, file xuất có đủ
+        'top_customers': report['by_customer'][:100],
+    })
+
+
+# ===============================================
+# BÁO CÁO DOANH THU (ĐỌC BẢNG GOM THEO NGÀY)
+# ===============================================
+from .revenue import revenue_by_period, REVENUE_PERIODS
+
+
+@login_required
+def revenue_report(request):
+    period = request.GET.get('period')
+    if period not in REVENUE_PERIODS:
+        period = 'month'
+
+    return render(request, 'revenue_report.html', {
+        'period': period,
+        'rows': revenue_by_period(period),
+        'service_types': Contract.SERVICE_TYPE_CHOICES,
+    })
+
+
+# ===============================================
+# XUẤT HÓA ĐƠN HÀNG LOẠT
+# ===============================================
+from .forms import InvoiceExportForm
+from .invoices import pending_invoices, mark_exported, invoice_rows, INVOICE_EXPORT_HEADERS
+from .tabular import stream_response
+
+
+@login_required
+def invoice_export(request):
+    form = InvoiceExportForm(request.POST or None)
+    pending = None
+
+    if form.is_valid():
+        data = form.cleaned_data
+        queryset = pending_invoices(data['date_from'], data['date_to'], data['customer_code'])
+
+        if request.POST.get('action') == 'preview':
+            pending = queryset.aggregate(count=Count('id'), total=Sum('amount_paid'))
+        else:
+            count, stamp = mark_exported(queryset)
+            if not count:
+                messages.info(request, "ℹ️ Không có khoản thanh toán nào chưa xuất hóa đơn")
+            else:
+                return stream_response(
+                    INVOICE_EXPORT_HEADERS,
+                    invoice_rows(stamp),
+                    f"hoa_don_{stamp:%Y%m%d_%H%M%S}",
+                    data['format'],
+                )
+
+    return render(request, 'invoice_export.html', {
+        'form': form,
+        'pending': pending,
+    })
+
+
+# ===============================================
+# XUẤT DỮ LIỆU TOÀN BỘ (STREAMING)
+# ===============================================
+from .exports import EXPORTS
+
+
+@login_required
+def data_export(request, name):
+    if name not in EXPORTS:
+        raise Http404
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+
+    filename, headers, rows = EXPORTS[name]
+    return stream_response(
+        headers,
+        rows(),
+        f"{filename}_{timezone.now():%Y%m%d}",
+        fmt,
+    )
+
+
+# ===============================================
+# NHẬP KHÁCH HÀNG HÀNG LOẠT
+# ===============================================
+from .customer_import import CustomerImporter, read_customers
+
+
+@login_required
+def customer_import(request):
+    report = None
+    form = CustomerFileImportForm(request.POST or None, request.FILES or None)
+
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['customers_file']
+        try:
+            records = read_customers(upload, upload.name)
+        except ValidationError as e:
+            form.add_error('customers_file', e)
+        else:
+            report = CustomerImporter(dry_run=form.cleaned_data['dry_run']).run(records)
+            if not report.dry_run and report.created:
+                messages.success(request, f"✅ Đã thêm {report.created} khách hàng")
+            # File lỗi từng dòng lưu bảng, session chỉ giữ id để tải CSV
+            _store_import_report(request, 'customer_import_errors_id', report.errors_csv())
+
+    return render(request, 'customer_import.html', {
+        'form': form,
+        'report': report,
+        # Trang chỉ hiện một phần, file lỗi có đủ
+        'errors_preview': report.errors[:200] if report else [],
+    })
+
+
+@login_required
+def customer_import_errors(request):
+    return _import_report_response(request, 'customer_import_errors_id', 'khach_hang_loi.csv')
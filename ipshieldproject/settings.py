@@ -41,6 +41,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Gom lịch sử hợp đồng trong request, ghi 1 lần sau commit
+    "ipshieldapp.audit.AuditMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -122,6 +124,49 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 
+# =========================
+# PAGINATION
+# =========================
+CUSTOMER_PAGE_SIZE = 50
+CUSTOMER_MAX_PAGE_SIZE = 200
+CONTRACT_PAGE_SIZE = 50
+CONTRACT_MAX_PAGE_SIZE = 200
+APPROX_COUNT_TIMEOUT = 300
+
+# =========================
+# CUSTOMER AUTOCOMPLETE
+# =========================
+CUSTOMER_PREFIX_INDEX_TTL = 600
+CUSTOMER_AUTOCOMPLETE_MAX_AGE = 30
+
+# =========================
+# CACHE
+# =========================
+# Dùng chung cho mọi process Passenger trên máy (LocMem mặc định là riêng từng process:
+# xóa cache báo cáo ở process này thì process khác vẫn trả số cũ)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache",
+    }
+}
+
+# =========================
+# REPORTS
+# =========================
+# Báo cáo tuổi nợ được cache, tự xóa khi có thanh toán / sửa đợt
+AGING_REPORT_TIMEOUT = 3600
+
+# =========================
+# BACKGROUND TASKS
+# =========================
+# 'db': chạy bằng `python manage.py run_tasks` (cần chạy worker riêng, vd. cron `run_tasks --once`);
+# 'thread': chạy trong tiến trình web (dev)
+TASK_QUEUE_MODE = "db"
+TASK_THREAD_WORKERS = 2
+TASK_RETRY_DELAY = 30
+TASK_LOCK_TIMEOUT = 600
+
 # =========================
 # SECURITY (DEV)
 # =========================
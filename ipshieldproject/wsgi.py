@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ipshieldproject.settings")
 
 application = get_wsgi_application()
+
+# Dựng sẵn chỉ mục autocomplete khách hàng cho process này
+from ipshieldapp.prefix_index import warm_customer_index  # noqa: E402
+
+warm_customer_index()
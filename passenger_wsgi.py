@@ -11,3 +11,8 @@ os.environ.setdefault(
 from django.core.wsgi import get_wsgi_application
 
 application = get_wsgi_application()
+
+# Dựng sẵn chỉ mục autocomplete khách hàng cho process này
+from ipshieldapp.prefix_index import warm_customer_index  # noqa: E402
+
+warm_customer_index()